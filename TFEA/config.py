@@ -31,11 +31,15 @@ FIMO_MOTIFS = False
 FIMO_BACKGROUND = 'largewindow'
 SINGLEMOTIF = False
 GENOMEHITS = False
+SCAN_CACHE = False
+SCAN_CACHE_SIZE = 10.0
 PERMUTATIONS = 1000
+NULL = 'permutation'
 LARGEWINDOW = 1500
 SMALLWINDOW = 150
 DPI = None
 PADJCUTOFF = 0.001
 TEXTONLY = False
 CPUS = 10
+COVERAGE_CACHE = False
 vars = dict()
\ No newline at end of file
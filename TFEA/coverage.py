@@ -0,0 +1,599 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''This file contains scripts to convert bam and bedGraph files into a compact,
+    memory-mappable coverage cache used by the RANK module to count reads
+    within regions and to compute meta-profiles without re-reading the
+    original files. Signal is split by strand: reads on the forward strand and
+    positive bedGraph values are stored as '+', reads on the reverse strand
+    and negative bedGraph values (as absolute values) as '-'. For each
+    chromosome and strand, a cache entry holds:
+        start_positions.npy - sorted positions at which reads (or bedGraph
+            intervals) start
+        start_sums.npy - cumulative number of reads (or summed value) starting
+            at or before each position in start_positions.npy
+        stop_positions.npy, stop_sums.npy - the same for read stops
+        index.json - chromosome and strand offsets into the above
+
+    Only positions where the signal changes are stored, so an entry scales
+    with the number of distinct read ends rather than the size of the genome.
+    The signal overlapping [start, stop) is the cumulative sum of starts
+    before stop minus the cumulative sum of stops at or before start, and the
+    per-base coverage at x is the signal overlapping [x, x+1). Entries are
+    keyed by the sha1 of the input file, so a cache folder may be shared
+    between runs and projects. Usage:
+
+        TFEA build-coverage --input FILE [FILE ...] --output CACHE_DIR
+
+    The resulting CACHE_DIR can then be given to TFEA using --coverage-cache.
+'''
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import sys
+import time
+import shutil
+import datetime
+import argparse
+from array import array
+from pathlib import Path
+
+import ujson
+import numpy as np
+
+from TFEA import exceptions
+from TFEA import multiprocess
+from TFEA import scan_cache
+
+#Constants
+#==============================================================================
+#Increment if the format or meaning of cache entries changes
+VERSION = 1
+#Unmapped (0x4), failed QC (0x200) and duplicate (0x400) reads are not counted
+SKIP_FLAGS = 0x604
+#Number of reads to collect before aggregating them by position
+READ_BLOCKSIZE = 2**22
+#Approximate number of bytes of a bedGraph file to read at once
+BEDGRAPH_BLOCKSIZE = 2**26
+STRANDS = ['+', '-']
+
+#Main Function
+#==============================================================================
+def main(args=None):
+    '''Main executable script
+    '''
+    parser = parse_arguments()
+    if args is not None and len(args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    inputs = vars(parser.parse_args(args))
+    files = [Path(path) for path in inputs['input']]
+    output = Path(inputs['output'])
+
+    start_time = time.time()
+    print("Building coverage cache...", flush=True, file=sys.stderr)
+    coverages = build_all(files=files, cachedir=output,
+                            cpus=int(inputs['cpus']))
+    total_time = time.time() - start_time
+    print("done in: " + str(datetime.timedelta(seconds=int(total_time))),
+            file=sys.stderr)
+    for path, cache_entry in zip(files, coverages):
+        print(path, '->', cache_entry.path, file=sys.stderr)
+
+#Secondary Functions
+#==============================================================================
+def parse_arguments():
+    '''Parse user arguments
+    '''
+    parser = argparse.ArgumentParser(prog='TFEA build-coverage',
+                                        description=("Convert bam and bedGraph "
+                                        "files into a memory-mappable coverage "
+                                        "cache for use with --coverage-cache."))
+    parser.add_argument('--input', '-i', nargs='+', required=True,
+                        help=("Bam (.bam) or bedGraph files to add to the "
+                        "cache."))
+    parser.add_argument('--output', '-o', required=True, help=("Full path to "
+                        "the cache folder. Created if it does not exist."))
+    parser.add_argument('--cpus', default=1, help=("Number of files to "
+                        "process in parallel. Default: 1"))
+    return parser
+
+#Classes
+#==============================================================================
+class Coverage(object):
+    '''A lightweight handle to a coverage cache entry. Only the path is
+        pickled when this object is sent to another process; the arrays are
+        mapped on first access within each process.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        full path to a cache entry folder created by build
+    '''
+    def __init__(self, path=None):
+        self.path = Path(path)
+
+    def segment(self, chrom=None, strand=None):
+        '''Returns the stored arrays of a single chromosome and strand:
+            start_positions, start_sums, stop_positions, stop_sums. Arrays
+            are empty if there is no signal.
+        '''
+        offsets, arrays = load(path=self.path)
+        i, j, k, l = offsets.get(chrom, {}).get(strand, [0, 0, 0, 0])
+        start_positions, start_sums, stop_positions, stop_sums = arrays
+
+        return (start_positions[i:j], start_sums[i:j],
+                stop_positions[k:l], stop_sums[k:l])
+
+    def overlapping(self, chrom=None, strand=None, starts=None, stops=None):
+        '''Returns the signal of a single chromosome and strand overlapping
+            (by at least 1bp) each interval [start, stop).
+
+        Parameters
+        ----------
+        chrom : str
+            the chromosome of all intervals
+        strand : str
+            '+' or '-'
+        starts : array
+            int array of interval starts
+        stops : array
+            int array of interval stops
+
+        Returns
+        -------
+        signal : array
+            float64 array of reads (or bedGraph signal) within each interval
+        '''
+        start_positions, start_sums, stop_positions, stop_sums = \
+                                    self.segment(chrom=chrom, strand=strand)
+        started = cumulative(sums=start_sums,
+                            indexes=np.searchsorted(start_positions, stops,
+                                                    side='left'))
+        stopped = cumulative(sums=stop_sums,
+                            indexes=np.searchsorted(stop_positions, starts,
+                                                    side='right'))
+
+        return started - stopped
+
+    def counts(self, chroms=None, starts=None, stops=None, strands=None):
+        '''Counts the reads (or sums the absolute bedGraph signal) overlapping
+            each region, following bedtools multicov and bedtools map -o sum.
+
+        Parameters
+        ----------
+        chroms : list
+            the chromosome of each region
+        starts : list
+            the start of each region
+        stops : list
+            the stop of each region
+        strands : list or None
+            the strand of each region. If given, only reads on the same strand
+            as a '+' or '-' region are counted (as with multicov -s). If None,
+            both strands are counted
+
+        Returns
+        -------
+        counts : array
+            float64 array with the signal within each region
+        '''
+        chroms = np.array(chroms)
+        starts = np.array(starts, dtype=np.int64)
+        stops = np.array(stops, dtype=np.int64)
+        if strands is not None:
+            strands = np.array(strands)
+        counts = np.zeros(len(chroms))
+        for chrom in np.unique(chroms):
+            mask = chroms == chrom
+            for strand in STRANDS:
+                if strands is not None:
+                    strand_mask = mask & (strands != STRANDS[1-STRANDS.index(strand)])
+                else:
+                    strand_mask = mask
+                counts[strand_mask] += self.overlapping(chrom=chrom,
+                                                        strand=strand,
+                                                        starts=starts[strand_mask],
+                                                        stops=stops[strand_mask])
+
+        return counts
+
+    def profile(self, chrom=None, start=None, stop=None, strand=None):
+        '''Returns the per-base coverage of a single strand within a region
+            [start, stop) as a float64 array
+        '''
+        return self.profiles(chrom=chrom, starts=[start], width=stop - start,
+                                strand=strand)[0]
+
+    def profiles(self, chrom=None, starts=None, width=None, strand=None):
+        '''Returns the per-base coverage of a single strand within windows of
+            a single chromosome. The coverage at the first base of each window
+            is read from the cumulative arrays, and the reads starting and
+            stopping within each window are added to a difference array which
+            is then summed along each window.
+
+        Parameters
+        ----------
+        chrom : str
+            the chromosome of all windows
+        starts : array
+            int array of window starts
+        width : int
+            the length of every window
+        strand : str
+            '+' or '-'
+
+        Returns
+        -------
+        profiles : array
+            (windows x width) float64 array of per-base coverage
+        '''
+        starts = np.asarray(starts, dtype=np.int64)
+        differences = np.zeros((len(starts), width))
+        differences[:, 0] = self.overlapping(chrom=chrom, strand=strand,
+                                                starts=starts, stops=starts + 1)
+        start_positions, start_sums, stop_positions, stop_sums = \
+                                    self.segment(chrom=chrom, strand=strand)
+        for positions, sums, sign in [(start_positions, start_sums, 1),
+                                        (stop_positions, stop_sums, -1)]:
+            first = np.searchsorted(positions, starts + 1, side='left')
+            last = np.searchsorted(positions, starts + width, side='left')
+            lengths = last - first
+            rows = np.repeat(np.arange(len(starts)), lengths)
+            events = (np.arange(len(rows))
+                        - np.repeat(np.cumsum(lengths) - lengths - first,
+                                    lengths))
+            weights = sums[events] - cumulative(sums=sums, indexes=events)
+            np.add.at(differences, (rows, positions[events] - starts[rows]),
+                        sign*weights)
+
+        return np.cumsum(differences, axis=1)
+
+#Functions
+#==============================================================================
+_arrays = dict()
+
+def load(path=None):
+    '''Opens a cache entry created by build. Arrays are memory-mapped and
+        cached per process.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        full path to a cache entry folder
+
+    Returns
+    -------
+    offsets : dict
+        chromosome -> strand -> [start_positions/start_sums offsets,
+        stop_positions/stop_sums offsets]
+    arrays : tuple
+        start_positions, start_sums, stop_positions, stop_sums
+    '''
+    key = str(path)
+    if key not in _arrays:
+        path = Path(path)
+        with open(path / 'index.json') as F:
+            index = ujson.load(F)
+        arrays = tuple(np.load(path / f'{name}.npy', mmap_mode='r')
+                        for name in ['start_positions', 'start_sums',
+                                        'stop_positions', 'stop_sums'])
+        _arrays[key] = (index['chroms'], arrays)
+
+    return _arrays[key]
+
+#==============================================================================
+def cumulative(sums=None, indexes=None):
+    '''Returns the cumulative sum preceding each index (0 for index 0)
+    '''
+    if len(sums) == 0:
+        return np.zeros(len(indexes))
+
+    return np.where(indexes > 0, sums[np.maximum(indexes - 1, 0)], 0)\
+                                                        .astype(np.float64)
+
+#==============================================================================
+def build_all(files=None, cachedir=None, debug=False, jobid=None, cpus=1):
+    '''Adds several bam or bedGraph files to a coverage cache in parallel.
+        Files already within the cache are not read again.
+
+    Parameters
+    ----------
+    files : list
+        full paths to bam (.bam) or bedGraph files
+    cachedir : pathlib.Path
+        full path to the cache folder
+    cpus : int
+        the maximum number of files to read at once
+
+    Returns
+    -------
+    coverages : list
+        a Coverage handle for each file, in the order given
+    '''
+    Path(cachedir).mkdir(exist_ok=True, parents=True)
+    results = multiprocess.main(function=build, args=list(enumerate(files)),
+                                kwargs=dict(cachedir=cachedir), debug=debug,
+                                jobid=jobid, cpus=max(1, min(cpus, len(files))))
+    coverages = [None]*len(files)
+    for i, cache_entry in results:
+        coverages[i] = cache_entry
+
+    return coverages
+
+#==============================================================================
+def build(arg, cachedir=None):
+    '''Adds a single bam or bedGraph file to a coverage cache unless an entry
+        with the same contents already exists.
+
+    Parameters
+    ----------
+    arg : tuple
+        (index, full path to a bam or bedGraph file)
+    cachedir : pathlib.Path
+        full path to the cache folder
+
+    Returns
+    -------
+    index : int
+        the index given in arg
+    coverage : Coverage
+        a handle to the cache entry
+    '''
+    index, path = arg
+    cachedir = Path(cachedir)
+    entry = cachedir / checksum(path=path, cachedir=cachedir)
+    if (entry / 'index.json').exists():
+        return index, Coverage(path=entry)
+
+    if str(path).endswith('.bam'):
+        signal = read_bam(bamfile=path)
+    else:
+        signal = read_bedgraph(bgfile=path)
+
+    #Write then rename so that concurrent runs never read a partial entry
+    temp_entry = entry.with_name(f'{entry.name}.{os.getpid()}.tmp')
+    write(signal=signal, path=temp_entry, source=path)
+    try:
+        os.replace(temp_entry, entry)
+    except OSError:
+        shutil.rmtree(temp_entry, ignore_errors=True)
+
+    return index, Coverage(path=entry)
+
+#==============================================================================
+def checksum(path=None, cachedir=None):
+    '''Returns the sha1 of a file's contents. Checksums are remembered within
+        the cache folder by path, size and modification time so that large
+        files are only hashed once.
+    '''
+    stat = os.stat(path)
+    key = str(Path(path).resolve())
+    identity = [stat.st_size, stat.st_mtime_ns]
+    checksum_file = Path(cachedir) / 'checksums.json'
+    try:
+        with open(checksum_file) as F:
+            checksums = ujson.load(F)
+    except (OSError, ValueError):
+        checksums = dict()
+    if key in checksums and checksums[key][:2] == identity:
+        return checksums[key][2]
+
+    digest = scan_cache.file_hash(path=path)
+    checksums[key] = identity + [digest]
+    temp_file = checksum_file.with_name(f'checksums.{os.getpid()}.tmp')
+    with open(temp_file, 'w') as outfile:
+        ujson.dump(checksums, outfile)
+    os.replace(temp_file, checksum_file)
+
+    return digest
+
+#==============================================================================
+def read_bam(bamfile=None, blocksize=READ_BLOCKSIZE):
+    '''Reads the aligned span of every read within a bam file, skipping
+        unmapped, duplicate and failed QC reads (as bedtools multicov does).
+        Reads are aggregated by position in blocks, so the bam file does not
+        need to be sorted or held in memory.
+
+    Parameters
+    ----------
+    bamfile : string
+        full path to a bam file
+    blocksize : int
+        number of reads to collect before aggregating
+
+    Returns
+    -------
+    signal : dict
+        (chromosome, strand) -> list of (start positions, start weights, stop
+        positions, stop weights) tuples for each block
+    '''
+    import pysam
+    signal = dict()
+    with pysam.AlignmentFile(str(bamfile), 'rb') as bam:
+        references = list(bam.references)
+        tids = array('l')
+        starts = array('l')
+        stops = array('l')
+        reverse = array('b')
+        for read in bam.fetch(until_eof=True):
+            if read.flag & SKIP_FLAGS or read.reference_end is None:
+                continue
+            tids.append(read.reference_id)
+            starts.append(read.reference_start)
+            stops.append(read.reference_end)
+            reverse.append(read.is_reverse)
+            if len(tids) == blocksize:
+                add_block(signal=signal, names=references, codes=np.array(tids),
+                            starts=np.array(starts), stops=np.array(stops),
+                            weights=np.where(np.array(reverse), -1, 1))
+                tids, starts, stops, reverse = (array('l'), array('l'),
+                                                array('l'), array('b'))
+        if len(tids) > 0:
+            add_block(signal=signal, names=references, codes=np.array(tids),
+                        starts=np.array(starts), stops=np.array(stops),
+                        weights=np.where(np.array(reverse), -1, 1))
+
+    return signal
+
+#==============================================================================
+def read_bedgraph(bgfile=None, blocksize=BEDGRAPH_BLOCKSIZE):
+    '''Reads a bedGraph file in blocks of lines, aggregating interval starts
+        and stops by position. The bedGraph does not need to be sorted.
+
+    Parameters
+    ----------
+    bgfile : string
+        full path to a bedGraph file
+    blocksize : int
+        approximate number of bytes of the bedGraph to read at once
+
+    Returns
+    -------
+    signal : dict
+        (chromosome, strand) -> list of (start positions, start weights, stop
+        positions, stop weights) tuples for each block
+
+    Raises
+    ------
+    InputError
+        If the bedGraph file does not have exactly 4 columns
+    '''
+    signal = dict()
+    with open(bgfile, 'rb') as F:
+        while True:
+            lines = F.readlines(blocksize)
+            if len(lines) == 0:
+                break
+            lines = [line for line in lines
+                        if not line.startswith((b'#', b'track', b'browser'))]
+            fields = b''.join(lines).split()
+            if len(fields) != 4*len(lines):
+                raise exceptions.InputError(("bedGraph files must contain 4 "
+                                                f"columns: {bgfile}"))
+            values = np.array(fields[3::4]).astype(np.float64)
+            if np.all(np.mod(values, 1) == 0):
+                values = values.astype(np.int64)
+            names, codes = np.unique(np.array(fields[0::4]).astype(str),
+                                        return_inverse=True)
+            add_block(signal=signal, names=names, codes=codes,
+                        starts=np.array(fields[1::4]).astype(np.int64),
+                        stops=np.array(fields[2::4]).astype(np.int64),
+                        weights=values)
+
+    return signal
+
+#==============================================================================
+def add_block(signal=None, names=None, codes=None, starts=None, stops=None,
+                weights=None):
+    '''Aggregates a block of intervals by chromosome, strand and position and
+        appends them to signal. Intervals with a positive weight are on the
+        '+' strand and those with a negative weight on the '-' strand.
+
+    Parameters
+    ----------
+    signal : dict
+        (chromosome, strand) -> list of aggregated blocks, updated in place
+    names : list
+        chromosome names
+    codes : array
+        the index within names of the chromosome of each interval
+    starts : array
+        int array of interval starts
+    stops : array
+        int array of interval stops
+    weights : array
+        the signal of each interval, negative on the '-' strand
+    '''
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(names)))
+    for code in np.flatnonzero(np.bincount(codes, minlength=len(names))):
+        indexes = order[(bounds[code-1] if code > 0 else 0):bounds[code]]
+        for strand, mask in zip(STRANDS, [weights[indexes] > 0,
+                                            weights[indexes] < 0]):
+            if not np.any(mask):
+                continue
+            block = indexes[mask]
+            block_weights = np.abs(weights[block])
+            signal.setdefault((str(names[code]), strand), list()).append(
+                        aggregate(positions=starts[block], weights=block_weights)
+                        + aggregate(positions=stops[block], weights=block_weights))
+
+#==============================================================================
+def aggregate(positions=None, weights=None):
+    '''Sums weights at each unique position
+
+    Returns
+    -------
+    positions : array
+        sorted unique positions
+    weights : array
+        the summed weight at each position
+    '''
+    positions, inverse = np.unique(positions, return_inverse=True)
+    sums = np.bincount(inverse, weights=weights, minlength=len(positions))
+    if np.issubdtype(weights.dtype, np.integer):
+        sums = np.round(sums).astype(np.int64)
+
+    return positions, sums
+
+#==============================================================================
+def write(signal=None, path=None, source=None):
+    '''Writes the signal read from a bam or bedGraph file as a cache entry
+        folder (see module description).
+    '''
+    path.mkdir(exist_ok=True, parents=True)
+    offsets = dict()
+    arrays = dict(start_positions=list(), start_sums=list(),
+                    stop_positions=list(), stop_sums=list())
+    sizes = [0, 0]
+    for chrom, strand in sorted(signal):
+        blocks = signal[(chrom, strand)]
+        start_positions, start_sums = aggregate(
+                                positions=np.concatenate([b[0] for b in blocks]),
+                                weights=np.concatenate([b[1] for b in blocks]))
+        stop_positions, stop_sums = aggregate(
+                                positions=np.concatenate([b[2] for b in blocks]),
+                                weights=np.concatenate([b[3] for b in blocks]))
+        arrays['start_positions'].append(start_positions)
+        arrays['start_sums'].append(np.cumsum(start_sums))
+        arrays['stop_positions'].append(stop_positions)
+        arrays['stop_sums'].append(np.cumsum(stop_sums))
+        offsets.setdefault(chrom, dict())[strand] = [
+                                    sizes[0], sizes[0] + len(start_positions),
+                                    sizes[1], sizes[1] + len(stop_positions)]
+        sizes[0] += len(start_positions)
+        sizes[1] += len(stop_positions)
+
+    for name, values in arrays.items():
+        values = np.concatenate(values) if len(values) > 0 else np.zeros(0, dtype=np.int64)
+        np.save(path / f'{name}.npy', compact(values))
+
+    with open(path / 'index.json', 'w') as outfile:
+        ujson.dump(dict(version=VERSION, source=str(source), chroms=offsets),
+                    outfile)
+
+#==============================================================================
+def compact(values=None):
+    '''Returns integer arrays as int32 where possible (int64 otherwise). Other
+        arrays are returned as float64.
+    '''
+    if not np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.float64)
+    if len(values) == 0 or (values.min() >= np.iinfo(np.int32).min
+                            and values.max() <= np.iinfo(np.int32).max):
+        return values.astype(np.int32)
+
+    return values.astype(np.int64)
+
+#Independent script functionality
+#==============================================================================
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module stores motif distances as a compact (motifs x regions) float32
+    matrix backed by a memory-mapped .npy file within the TFEA temporary
+    directory. NaN values mean the motif was not within the given region. The
+    SCANNER module fills this matrix one row per motif and the ENRICHMENT
+    module reads it, so that parallel workers only need to be sent a row index
+    rather than a pickled copy of every distance.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import multiprocess
+
+#Classes
+#==============================================================================
+class DistanceMatrix(object):
+    '''A lightweight handle to a memory-mapped motif distance matrix. Only the
+        path and motif names are pickled when this object is sent to another
+        process; the matrix itself is mapped on first access within each
+        process.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        full path to a .npy file containing a float32 (motifs x regions) matrix
+    motifs : list
+        motif names corresponding to each row of the matrix
+    '''
+    def __init__(self, path=None, motifs=None):
+        self.path = Path(path)
+        self.motifs = list(motifs)
+
+    def __len__(self):
+        return len(self.motifs)
+
+    @property
+    def array(self):
+        return load(path=self.path)
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def index(self, motif):
+        return self.motifs.index(motif)
+
+    def row(self, index):
+        '''Returns the distances for a single motif as a float32 array (a view
+            into the memory-mapped matrix).
+        '''
+        return self.array[index]
+
+    def to_list(self, index):
+        '''Returns the distances for a single motif in the list format used
+            throughout TFEA: [motif, distance1, distance2, ...] with '.' where
+            the motif was not within the given region.
+        '''
+        return [self.motifs[index]] + row_to_list(self.row(index))
+
+#Functions
+#==============================================================================
+_arrays = dict()
+
+def load(path=None):
+    '''Maps a distance matrix file into memory. Maps are cached per process so
+        that repeated row lookups within a worker do not reopen the file. A
+        file that has been recreated since it was mapped is mapped again.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        full path to a .npy distance matrix file
+
+    Returns
+    -------
+    array : numpy.memmap
+        the (motifs x regions) float32 distance matrix
+    '''
+    key = str(path)
+    stat = os.stat(key)
+    identity = (stat.st_ino, stat.st_size)
+    if key not in _arrays or _arrays[key][0] != identity:
+        _arrays[key] = (identity, np.load(key, mmap_mode='r+'))
+
+    return _arrays[key][1]
+
+#==============================================================================
+def create(path=None, motifs=None, regions=None):
+    '''Creates a new distance matrix file filled with NaN (no motif hits).
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        full path to the .npy file to create
+    motifs : list
+        motif names that will make up the rows of the matrix
+    regions : int
+        the number of regions (columns) in the matrix
+
+    Returns
+    -------
+    distance_matrix : DistanceMatrix
+        a handle to the newly created matrix
+    '''
+    _arrays.pop(str(path), None)
+    array = np.lib.format.open_memmap(str(path), mode='w+', dtype=np.float32,
+                                        shape=(len(motifs), regions))
+    array[:] = np.nan
+    array.flush()
+    del array
+
+    return DistanceMatrix(path=path, motifs=motifs)
+
+#==============================================================================
+def fill(function=None, motifs=None, regions=None, path=None, kwargs=None,
+            debug=False, jobid=None, cpus=1):
+    '''Creates a distance matrix and fills it by running a SCANNER function
+        on each motif in parallel. Each worker writes its row straight into
+        the memory-mapped file and only returns the motif name.
+
+    Parameters
+    ----------
+    function : function object
+        a function that takes a motif as its first argument and returns a list
+        of the form [motif, distance1, distance2, ...] or [motif, array]
+    motifs : list
+        the motifs to pass to function
+    regions : int
+        the number of distances returned by function for each motif
+    path : pathlib.Path
+        full path to the .npy file to create
+    kwargs : dict
+        keyword arguments to pass to function
+
+    Returns
+    -------
+    distance_matrix : DistanceMatrix
+        a handle to the filled matrix
+    '''
+    distance_matrix = create(path=path, motifs=motifs, regions=regions)
+    fill_keywords = dict(function=function, path=path, kwargs=kwargs)
+    names = multiprocess.main(function=fill_row,
+                                args=list(enumerate(motifs)),
+                                kwargs=fill_keywords, debug=debug,
+                                jobid=jobid, cpus=cpus)
+
+    #Motif names may be altered by function (i.e. file extensions removed)
+    for index, name in names:
+        distance_matrix.motifs[index] = name
+    load(path=path).flush()
+
+    return distance_matrix
+
+#==============================================================================
+def project(source=None, indices=None, path=None, blocksize=256):
+    '''Creates a distance matrix from a subset of the columns (regions) of
+        another, i.e. when several region sets were scanned as one.
+
+    Parameters
+    ----------
+    source : DistanceMatrix or list
+        the distance matrix to take columns from. If a list of distance 
+        matrices (with the same motifs), their columns are taken in turn
+    indices : array
+        the column of source corresponding to each region of the new matrix
+    path : pathlib.Path
+        full path to the .npy file to create
+    blocksize : int
+        number of motifs (rows) to copy at once
+
+    Returns
+    -------
+    distance_matrix : DistanceMatrix
+        a handle to the new matrix
+    '''
+    sources = source if isinstance(source, list) else [source]
+    distance_matrix = create(path=path, motifs=sources[0].motifs, 
+                                regions=len(indices))
+    array = load(path=path)
+    for start in range(0, len(sources[0]), blocksize):
+        block = np.concatenate([matrix.array[start:start + blocksize] 
+                                for matrix in sources], axis=1)
+        array[start:start + blocksize] = block[:, indices]
+    array.flush()
+
+    return distance_matrix
+
+#==============================================================================
+def fill_row(arg, function=None, path=None, kwargs=None):
+    '''Runs a SCANNER function for one motif and writes its distances into the
+        row of the distance matrix corresponding to that motif.
+
+    Parameters
+    ----------
+    arg : tuple
+        (row index, motif)
+
+    Returns
+    -------
+    index : int
+        the row index written to
+    name : str
+        the motif name returned by function
+    '''
+    index, motif = arg
+    result = function(motif, **kwargs)
+    if len(result) == 2 and isinstance(result[1], np.ndarray):
+        load(path=path)[index] = result[1]
+    else:
+        load(path=path)[index] = list_to_row(result[1:])
+
+    return index, result[0]
+
+#==============================================================================
+def list_to_row(distances):
+    '''Converts a list of distances with '.' for missing hits into a float32
+        array with NaN for missing hits
+    '''
+    return np.array([np.nan if x == '.' else x for x in distances],
+                    dtype=np.float32)
+
+#==============================================================================
+def row_to_list(row):
+    '''Converts a float32 array of distances with NaN for missing hits into a
+        list with '.' for missing hits
+    '''
+    return ['.' if np.isnan(x) else (int(x) if x.is_integer() else float(x))
+                for x in row.tolist()]
@@ -34,6 +34,8 @@ from TFEA import config
 from TFEA import multiprocess
 from TFEA import plot
 from TFEA import exceptions
+from TFEA import distance_matrix
+from TFEA import motif_database as motifdb
 
 #Main Script
 #==============================================================================
@@ -44,7 +46,7 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
             jobid=None, pvals=None, fcs=None, p_cutoff=None, figuredir=None, 
             plotall=False, fimo_motifs=None, meta_profile_dict=None, 
             label1=None, label2=None, dpi=None, motif_fpkm={}, bootstrap=False,
-            gc=None, plot_format=None):
+            gc=None, plot_format=None, null=None):
     '''This is the main script of the ENRICHMENT module. It takes as input
         a list of distances outputted from the SCANNER module and calculates
         an enrichment score, a p-value, and in some instances an adjusted 
@@ -54,21 +56,14 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
     ----------
     use_config : boolean
         Whether to use a config module to assign variables.
-    motif_distances : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
-    md_distances1 : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
-    md_distances2 : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
+    motif_distances : DistanceMatrix
+        A handle to a memory-mapped (motifs x regions) float32 matrix 
+        containing the motif distance for each region (ranked). A NaN value 
+        means the motif was not within the given region
+    md_distances1 : DistanceMatrix
+        Same as motif_distances for the regions of a single condition
+    md_distances2 : DistanceMatrix
+        Same as motif_distances for the regions of a single condition
     enrichment : str
         The type of enrichment analysis to perform
     output_type : str
@@ -77,6 +72,10 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
     permutations : int
         Number of random shuffling permutations to perform to calculate a 
         p-value
+    null : str
+        How the null distribution of the E-score is obtained. 'permutation' 
+        simulates it by shuffling ranks, 'analytic' uses the exact mean and 
+        variance of the E-score under random shuffling.
     debug : boolean
         Whether to print debug statements specifically within the multiprocess
         module
@@ -101,6 +100,7 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
         mdd_distances2 = config.vars['MDD_DISTANCES2']
         enrichment = config.vars['ENRICHMENT']
         permutations = config.vars['PERMUTATIONS']
+        null = config.vars['NULL']
         debug = config.vars['DEBUG']
         largewindow = config.vars['LARGEWINDOW']
         smallwindow = config.vars['SMALLWINDOW']
@@ -137,9 +137,11 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
         linear_regression = None
         if gc:
             print('\tCorrecting GC:', file=sys.stderr)
-            auc_keywords = dict(fimo_motifs=fimo_motifs)
+            auc_keywords = dict(fimo_motifs=fimo_motifs, 
+                                matrix=motif_distances)
             motif_gc_auc = multiprocess.main(function=get_auc_gc, 
-                                        args=motif_distances, kwargs=auc_keywords,
+                                        args=range(len(motif_distances)), 
+                                        kwargs=auc_keywords,
                                         debug=debug, jobid=jobid, cpus=cpus)
 
             #Calculate linear regression based on AUC and GC content of motifs
@@ -157,15 +159,22 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
         # manager = Manager()
         # meta_profile_dict = manager.dict(meta_profile_dict)
         auc_keywords = dict(permutations=permutations, use_config=use_config, 
-                        output_type=output_type, pvals=pvals, plotall=plotall, 
-                        p_cutoff=p_cutoff, figuredir=figuredir, 
-                        largewindow=largewindow, fimo_motifs=fimo_motifs, 
-                        meta_profile_dict=meta_profile_dict, label1=label1, 
-                        label2=label2, fcs=fcs, motif_fpkm=motif_fpkm, 
+                        output_type=output_type, 
+                        pvals=multiprocess.shared_value('PVALS', pvals), 
+                        plotall=plotall, p_cutoff=p_cutoff, 
+                        figuredir=figuredir, largewindow=largewindow, 
+                        fimo_motifs=fimo_motifs, 
+                        meta_profile_dict=multiprocess.shared_value(
+                                            'META_PROFILE', meta_profile_dict), 
+                        label1=label1, label2=label2, 
+                        fcs=multiprocess.shared_value('FCS', fcs), 
+                        motif_fpkm=motif_fpkm, 
                         tests=len(motif_distances), bootstrap=bootstrap, 
-                        gc_correct=gc_correct, plot_format=plot_format)
+                        gc_correct=gc_correct, plot_format=plot_format, 
+                        null=null, matrix=motif_distances)
         results = multiprocess.main(function=auc_simulate_and_plot, 
-                                    args=motif_distances, kwargs=auc_keywords,
+                                    args=range(len(motif_distances)), 
+                                    kwargs=auc_keywords,
                                     debug=debug, jobid=jobid, cpus=cpus)
                                     
         plot.plot_global_gc(results, p_cutoff=p_cutoff, 
@@ -242,9 +251,14 @@ def main(use_config=True, motif_distances=None, md_distances1=None,
 #==============================================================================
 def calculate_md(md_distances1=None, md_distances2=None, smallwindow=None, 
                     jobid=None, cpus=None, debug=None):
-    md_keywords = dict(smallwindow=smallwindow)
+    md_keywords = dict(smallwindow=smallwindow, 
+                        matrices=(md_distances1, md_distances2))
+    #Pair rows of each condition by motif name
+    md_indexes = [(md_distances1.index(motif), md_distances2.index(motif)) 
+                    for motif in sorted(md_distances1.motifs) 
+                    if motif in md_distances2.motifs]
     md_results = multiprocess.main(function=md_score, 
-                    args=list(zip(sorted(md_distances1),sorted(md_distances2))), 
+                    args=md_indexes, 
                     kwargs=md_keywords,
                     debug=debug, jobid=jobid, cpus=cpus)
 
@@ -254,7 +268,67 @@ def calculate_md(md_distances1=None, md_distances2=None, smallwindow=None,
 
 #Functions
 #==============================================================================
-def get_auc_gc(distances, fimo_motifs=None):
+def get_motif_distances(distances, matrix=None):
+    '''Retrieves the name and distances of a single motif. Distances are 
+        returned as a float array with NaN where the motif was not within the
+        given region.
+
+    Parameters
+    ----------
+    distances : int or list
+        a row index into matrix, or a list of the form 
+        [motif, distance1, distance2, ...] with '.' for missing hits
+    matrix : DistanceMatrix
+        the matrix that distances indexes into. If None, distances must be a 
+        list
+
+    Returns
+    -------
+    motif : str
+        the name of the motif
+    distances : array
+        float64 array of distances with NaN for missing hits
+    '''
+    if matrix is not None:
+        motif = matrix.motifs[distances]
+        distances = matrix.row(distances)
+    else:
+        motif = distances[0]
+        distances = distance_matrix.list_to_row(distances[1:])
+
+    return motif, np.asarray(distances, dtype=np.float64)
+
+#==============================================================================
+def exp_score(distances_abs):
+    '''Converts absolute motif distances into -exp() scores normalized by the
+        average distance within the middle two quartiles of regions.
+
+    Parameters
+    ----------
+    distances_abs : array
+        absolute distances with NaN for missing hits
+
+    Returns
+    -------
+    score : array or None
+        the score for each region (0 for missing hits). None if there are no
+        hits within the middle two quartiles
+    '''
+    q1 = int(round(len(distances_abs)*.25))
+    q3 = int(round(len(distances_abs)*.75))
+    middledistancehist = distances_abs[q1:q3]
+    middledistancehist = middledistancehist[~np.isnan(middledistancehist)]
+    if len(middledistancehist) == 0:
+        return None
+    average_distance = np.mean(middledistancehist)
+
+    score = np.exp(-distances_abs/average_distance)
+    score[np.isnan(score)] = 0.0
+
+    return score
+
+#==============================================================================
+def get_auc_gc(distances, fimo_motifs=None, matrix=None):
     '''Calculates an enrichment score using the area under the curve. This
         method is not as sensitive to artifacts as other methods. It works well
         as an asymmetry detector and will be good at picking up cases where
@@ -264,14 +338,15 @@ def get_auc_gc(distances, fimo_motifs=None):
     try:
         #sort distances based on the ranks from TF bed file
         #and calculate the absolute distance
-        motif = distances[0]
-        if fimo_motifs is not None:
-            gc = get_gc(motif=motif, motif_database=fimo_motifs)
+        motif, distances = get_motif_distances(distances, 
+                                            matrix=matrix)
         nan = float('Nan')
-        distances = distances[1:]
-        distances_abs = [abs(x)  if x != '.' else x for x in distances]
+        gc = nan
+        if fimo_motifs:
+            gc = get_gc(motif=motif, motif_database=fimo_motifs)
+        distances_abs = np.abs(distances)
 
-        hits = len([x for x in distances_abs if x != '.'])
+        hits = np.count_nonzero(~np.isnan(distances_abs))
 
         #Filter any TFs/files without any hits
         if hits == 0:
@@ -279,22 +354,16 @@ def get_auc_gc(distances, fimo_motifs=None):
 
         #Get -exp() of distance and get cumulative scores
         #Filter distances into quartiles to get middle distribution
-        q1 = int(round(len(distances)*.25))
-        q3 = int(round(len(distances)*.75))
-        middledistancehist =  [x for x in distances_abs[int(q1):int(q3)] if x != '.']
-        try:
-            average_distance = float(sum(middledistancehist))/float(len(middledistancehist))
-        except ZeroDivisionError:
+        score = exp_score(distances_abs)
+        if score is None:
             return [motif, nan, gc]
-        
-        score = [math.exp(-float(x)/average_distance) if x != '.' else 0.0 for x in distances_abs]
-        total = sum(score)
+        total = np.sum(score)
 
         binwidth = 1.0/float(len(distances_abs))
-        normalized_score = [(float(x)/total)*binwidth for x in score]
+        normalized_score = np.multiply(np.divide(score, total), binwidth)
         cumscore = np.cumsum(normalized_score)
         trend = np.append(np.arange(0,1,1.0/float(len(cumscore) - 1)), 1.0)
-        trend = [x*binwidth for x in trend]
+        trend = np.multiply(trend, binwidth)
 
         #The AUC is the relative to the "random" line
         auc = (np.trapz(cumscore) - np.trapz(trend))*2
@@ -313,17 +382,21 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
                         largewindow=None, fimo_motifs=None, 
                         meta_profile_dict=None, label1=None, label2=None, 
                         dpi=None, fcs=None, tests=None, motif_fpkm=None, 
-                        bootstrap=False, gc_correct=None, plot_format=None):
+                        bootstrap=False, gc_correct=None, plot_format=None,
+                        null='permutation', matrix=None):
     '''Calculates an enrichment score using the area under the curve. This
         method is not as sensitive to artifacts as other methods. It works well
         as an asymmetry detector and will be good at picking up cases where
         most of the motif localization changes happen at the most differentially
-        transcribed regions.
+        transcribed regions. If null is 'analytic' (and no bootstrapping is
+        requested), the mean and standard deviation of the null distribution 
+        are computed exactly instead of by permutation.
     '''
     try:
         #sort distances based on the ranks from TF bed file
         #and calculate the absolute distance
-        motif = distances[0]
+        motif, distances = get_motif_distances(distances, 
+                                            matrix=matrix)
         nan = float('Nan')
         gc = nan
         if fimo_motifs:
@@ -334,10 +407,9 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
             fpkm = motif_fpkm[motif]
         except KeyError:
             fpkm = nan
-        distances = distances[1:]
-        distances_abs = [abs(x)  if x != '.' else x for x in distances]
+        distances_abs = np.abs(distances)
 
-        hits = len([x for x in distances_abs if x != '.'])
+        hits = np.count_nonzero(~np.isnan(distances_abs))
 
         #Filter any TFs/files without any hits
         if hits == 0:
@@ -345,19 +417,11 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
 
         #Get -exp() of distance and get cumulative scores
         #Filter distances into quartiles to get middle distribution
-        q1 = int(round(len(distances)*.25))
-        q3 = int(round(len(distances)*.75))
-        middledistancehist =  [x for x in distances_abs[int(q1):int(q3)] if x != '.']
+        score = exp_score(distances_abs)
         #In the case where there are no hits in the middle two quartiles, then
         #don't perform computation
-        if len(middledistancehist) == 0:
+        if score is None:
             return [motif, 0, 0, hits, gc, fpkm, 0, 0]
-        try:
-            average_distance = np.mean(middledistancehist)#float(sum(middledistancehist))/float(len(middledistancehist))
-        except ZeroDivisionError:
-            return [motif, 0, 0, hits, gc, fpkm, 0, 0]
-        
-        score = [math.exp(-float(x)/average_distance) if x != '.' else 0.0 for x in distances_abs]
         total = np.sum(score)
 
         binwidth = 1.0/float(len(distances_abs))
@@ -377,15 +441,23 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
 
         #Calculate random AUC
         if bootstrap:
-            sim_auc = permute_auc_bootstrap(original_distances=distances, trend=trend, 
+            sim_auc = permute_auc_bootstrap(
+                                original_distances=distance_matrix.row_to_list(distances), 
+                                trend=trend, 
                                 permutations=permutations, bootstrap=bootstrap)
+            mu = np.mean(sim_auc)
+            sigma = np.std(sim_auc)
+        elif null == 'analytic':
+            mu, sigma = analytic_auc_null(distances=normalized_score, 
+                                            trend=trend)
+            sim_auc = None
         else:
             sim_auc = permute_auc(distances=normalized_score, trend=trend, 
                                 permutations=permutations)
+            mu = np.mean(sim_auc)
+            sigma = np.std(sim_auc)
 
         #Calculate p-value
-        mu = np.mean(sim_auc)
-        sigma = np.std(sim_auc)
         p = min(stats.norm.logcdf(auc,mu,sigma), stats.norm.logsf(auc,mu,sigma))
         if math.isnan(p):
             p = 0
@@ -400,10 +472,15 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
 
         if plotall or (output_type=='html' and p < p_cutoff):
             from TFEA import plot
+            #The simulation plot needs sampled AUCs even with an analytic null
+            if sim_auc is None:
+                sim_auc = permute_auc(distances=normalized_score, trend=trend,
+                                    permutations=permutations)
             plotting_score = np.divide(score, total)
             # [(float(x)/total) for x in score]
             plotting_cumscore = np.cumsum(plotting_score)
-            plot.plot_individual_graphs(motif=motif, distances=distances, 
+            plot.plot_individual_graphs(motif=motif, 
+                                        distances=distance_matrix.row_to_list(distances), 
                                         figuredir=figuredir, 
                                         fimo_motifs=fimo_motifs, 
                                         largewindow=largewindow, 
@@ -423,34 +500,130 @@ def auc_simulate_and_plot(distances, use_config=True, output_type=None,
     return [motif, auc, corrected_auc, hits, gc, fpkm, p, corrected_p]
 
 #==============================================================================
-def permute_auc(distances=None, trend=None, permutations=None):
+_rng = None
+_rng_pid = None
+
+def get_rng():
+    '''Returns a numpy random Generator unique to the current process. The
+        Generator is created on first use within each worker so that forked
+        processes do not share (and repeat) the parent's random stream.
+
+    Returns
+    -------
+    _rng : numpy.random.Generator
+        a Generator seeded from fresh OS entropy for this process
+    '''
+    global _rng, _rng_pid
+    if _rng is None or _rng_pid != os.getpid():
+        _rng = np.random.default_rng()
+        _rng_pid = os.getpid()
+
+    return _rng
+
+#==============================================================================
+def permute_auc(distances=None, trend=None, permutations=None, 
+                max_block_bytes=2**24):
     '''Generates permutations of the distances and calculates AUC for each 
-        permutation.
+        permutation. The trapezoid integral of a cumulative sum is a linear 
+        function of the summed values, trapz(cumsum(x)) == dot(x, weights) - 
+        sum(x)/2 with weights = [n-0.5, n-1, ..., 1], so only the positions 
+        that the non-zero scores (motif hits) land on need to be simulated. 
+        These positions are drawn in 2-D blocks (one permutation per row) and 
+        all AUCs in a block are scored with a single matrix-vector product. 
+        Block size is bounded by max_block_bytes to keep memory usage constant
+        regardless of the number of permutations.
+
     Parameters
     ----------
     distances : list or array
         normalized distances 
         
+    trend : list or array
+        the expected (uniform) cumulative score used as the AUC baseline
+
     permutations : int
         number of times to permute (default=1000)
+
+    max_block_bytes : int
+        upper bound on the size of a single permutation block in bytes
         
     Returns
     -------
-    es_permute : list 
-        list of AUC calculated for permutations 
+    es_permute : array 
+        array of AUC calculated for permutations 
        
     '''
-    es_permute = np.zeros(permutations)
+    distances = np.asarray(distances, dtype=np.float64)
     triangle_area = np.trapz(trend)
-    for i in range(permutations):
-        random_distances = np.random.permutation(distances)
-        cum_distances = np.cumsum(random_distances)
-        es = np.trapz(cum_distances)
-        auc = es - triangle_area
-        es_permute[i] = auc*2
+    n = len(distances)
+    weights = np.arange(n, 0, -1, dtype=np.float64)
+    weights[0] -= 0.5
+    hit_indexes = np.flatnonzero(distances)
+    hit_scores = distances[hit_indexes]
+    h = len(hit_indexes)
+    offset = np.sum(hit_scores)/2.0 + triangle_area
+
+    es_permute = np.zeros(permutations)
+    if h == 0:
+        es_permute[:] = -offset*2
+        return es_permute
+
+    rng = get_rng()
+    block_size = int(max(1, min(permutations, max_block_bytes // (h*8))))
+    for start in range(0, permutations, block_size):
+        stop = min(start + block_size, permutations)
+        positions = np.empty((stop - start, h), dtype=np.int64)
+        for row in positions:
+            row[:] = rng.choice(n, size=h, replace=False)
+        es_permute[start:stop] = (np.dot(weights[positions], hit_scores) 
+                                    - offset)*2
 
     return es_permute
 
+#==============================================================================
+def analytic_auc_null(distances=None, trend=None):
+    '''Calculates the exact mean and standard deviation of the AUC under 
+        random permutation of the distances, i.e. the moments that permute_auc
+        estimates by simulation. Since the AUC is a linear function of the 
+        permuted scores, dot(x, weights) (see permute_auc), its permutation 
+        moments follow from the combinatorial central limit theorem:
+            mean = n * mean(weights) * mean(x)
+            var  = sum((weights - mean(weights))**2) * 
+                    sum((x - mean(x))**2) / (n - 1)
+
+    Parameters
+    ----------
+    distances : list or array
+        normalized distances 
+        
+    trend : list or array
+        the expected (uniform) cumulative score used as the AUC baseline
+
+    Returns
+    -------
+    mu : float
+        mean AUC across all permutations of distances
+
+    sigma : float
+        standard deviation of the AUC across all permutations of distances
+    '''
+    distances = np.asarray(distances, dtype=np.float64)
+    triangle_area = np.trapz(trend)
+    n = len(distances)
+    weights = np.arange(n, 0, -1, dtype=np.float64)
+    weights[0] -= 0.5
+    total = np.sum(distances)
+
+    mu = (np.mean(weights)*total - total/2.0 - triangle_area)*2
+    if n < 2:
+        return mu, 0.0
+
+    variance = (np.sum(np.square(weights - np.mean(weights))) 
+                * np.sum(np.square(distances - total/n)) / (n - 1))
+    sigma = np.sqrt(variance)*2
+
+    return mu, sigma
+
 #==============================================================================
 def permute_auc_bootstrap(original_distances=None, trend=None, permutations=None, bootstrap=False):
     '''Generates permutations of the original_ and calculates AUC for each 
@@ -508,16 +681,8 @@ def permute_auc_bootstrap(original_distances=None, trend=None, permutations=None
     binwidth = 1.0/float(len(distances_abs))
     normalized_score = [(float(x)/total)*binwidth for x in score]
 
-    es_permute = []
-    triangle_area = np.trapz(trend)
-
-    normalized_distances = normalized_score
-    for i in range(permutations):
-        random_distances = np.random.permutation(normalized_distances)
-        cum_distances = np.cumsum(random_distances)
-        es = np.trapz(cum_distances)
-        auc = es - triangle_area
-        es_permute.append(auc*2)
+    es_permute = permute_auc(distances=normalized_score, trend=trend, 
+                                permutations=permutations)
 
     return es_permute
 
@@ -659,13 +824,15 @@ def anderson_darling(distances):
     return [motif, stat, hits, sig]
 
 #==============================================================================
-def md_score(distances, smallwindow=None):
+def md_score(distances, smallwindow=None, matrices=(None, None)):
     '''Calculate md score
     '''
     distances1, distances2 = distances
-    motif = distances1[0]
-    distances1 = [abs(float(x)) for x in distances1[1:] if x != '.']
-    distances2 = [abs(float(x)) for x in distances2[1:] if x != '.']
+    matrix1, matrix2 = matrices
+    motif, distances1 = get_motif_distances(distances1, matrix=matrix1)
+    _, distances2 = get_motif_distances(distances2, matrix=matrix2)
+    distances1 = np.abs(distances1[~np.isnan(distances1)])
+    distances2 = np.abs(distances2[~np.isnan(distances2)])
     d1_total = float(len(distances1))
     d2_total = float(len(distances2))
     # print(motif)
@@ -676,8 +843,8 @@ def md_score(distances, smallwindow=None):
     # print("md2sum: ", sum([1.0 if d <= smallwindow else 0.0 for d in distances2]))
     # print("md2tot: ", d2_total)
     try:
-        md1 = sum([1.0 if d <= smallwindow else 0.0 for d in distances1])/d1_total
-        md2 = sum([1.0 if d <= smallwindow else 0.0 for d in distances2])/d2_total
+        md1 = np.count_nonzero(distances1 <= smallwindow)/d1_total
+        md2 = np.count_nonzero(distances2 <= smallwindow)/d2_total
     except ZeroDivisionError:
         return [motif, 0, 0, 1, 1]
 
@@ -711,10 +878,11 @@ def md_score_p(results):
     return results
 
 #==============================================================================
-def get_gc(motif=None, motif_database=None, alphabet=['A','C','G','T']):
+def get_gc(motif=None, motif_database=None):
     '''
-    Obtain a pssm model from a meme formatted database file. Warning: If there are multiple
-    motif matches, this function will return the last match in the database.
+    Obtain the GC content of a motif PSSM within a meme formatted database file. 
+    Warning: If there are multiple motif matches, this function will return the 
+    last match in the database.
     
     Parameters
     ----------
@@ -725,29 +893,10 @@ def get_gc(motif=None, motif_database=None, alphabet=['A','C','G','T']):
         
     Returns
     -------
-    PSSM : list or array
-        a list of lists where each corresponding to position then alphabet probability
+    gc : float
+        the mean G + C probability across positions of the motif PSSM, NaN if
+        the motif is not within motif_database
     '''
-    motif_hit = False
-    PSSM = list()
-    with open(motif_database,'r') as F:
-        for line in F:
-            if 'MOTIF' in line:
-                if motif in line:
-                    motif_hit = True
-                else:
-                    motif_hit = False
-            elif motif_hit and 'URL' not in line and 'letter-probability' not in line and line != '\n':
-                acgt_probabilities = [float(x) for x in line.strip('\n').split()]
-                total_prob = sum(acgt_probabilities)
-                acgt_probabilities = [x/total_prob for x in acgt_probabilities] #Convert to probabilities
-                PSSM.append(acgt_probabilities)
-
-    gc = 0
-    for base in PSSM:
-        gc += base[alphabet.index('C')]
-        gc += base[alphabet.index('G')]
-    
-    gc = gc/float(len(PSSM))
+    database = motifdb.load(motifdatabase=motif_database)
     
-    return gc
+    return database.gc_content(motif)
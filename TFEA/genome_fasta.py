@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module extracts region sequences from a genome fasta file in-process,
+    in place of running bedtools getfasta for each set of regions. The genome
+    is memory-mapped and sequences are sliced using its .fai index (created
+    if missing, as bedtools and samtools do) into a single packed uint8
+    buffer, with each sequence followed by a newline. Several region sets
+    share one buffer, with offsets marking each sequence. Buffers are saved as
+    sequence files (.seq, one sequence per line) for in-process scanners and
+    as fasta files only when an external tool (i.e. FIMO) needs them.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import sys
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import exceptions
+from TFEA import ranked_table
+
+#Constants
+#==============================================================================
+SUFFIX = '.seq'
+SEPARATOR = ord('\n')
+#Number of bases to extract at once
+BLOCKSIZE = 2**22
+
+#Main Script
+#==============================================================================
+def read_sets(sets=None, genomefasta=None, indexdir=None):
+    '''Reads the sequences of several region sets into a single buffer. Each
+        set is either a fasta file or a bed file whose regions are extracted
+        from genomefasta.
+
+    Parameters
+    ----------
+    sets : list
+        (fastafile, bedfile) for each set. The fasta file is used if it is
+        not False, otherwise the bed file
+    genomefasta : str or pathlib.Path
+        full path to the genome fasta file
+    indexdir : str or pathlib.Path
+        folder for the genome index if the genome's folder is not writable
+
+    Returns
+    -------
+    buffer : array
+        uint8 array of all sequences, each followed by a newline
+    offsets : array
+        int64 array with the start of each sequence within buffer and the
+        total length as the last value
+    bounds : array
+        int64 array with the index of the first sequence of each set and the
+        total number of sequences as the last value
+    names : list
+        the name of each sequence (chrom:start-stop for extracted regions)
+    '''
+    buffers = list()
+    names = list()
+    counts = list()
+    for fastafile, bedfile in sets:
+        if fastafile:
+            set_names, set_buffer, _ = read_fasta(fastafile=fastafile)
+        else:
+            table = ranked_table.load(bedfile=bedfile)
+            set_buffer, _ = extract(genomefasta=genomefasta,
+                                    chroms=table.chroms, starts=table.starts,
+                                    stops=table.stops, indexdir=indexdir)
+            set_names = [f'{chrom}:{start}-{stop}' for chrom, start, stop
+                            in table.regions()]
+        buffers.append(set_buffer)
+        names += set_names
+        counts.append(len(set_names))
+
+    buffer = np.concatenate(buffers) if buffers else np.zeros(0, np.uint8)
+    bounds = np.zeros(len(counts) + 1, dtype=np.int64)
+    bounds[1:] = np.cumsum(counts)
+
+    return buffer, sequence_offsets(buffer=buffer), bounds, names
+
+#Functions
+#==============================================================================
+_fai = dict()
+
+def read_fai(genomefasta=None, indexdir=None):
+    '''Reads the .fai index of a genome fasta file, creating it if it does
+        not exist or is older than the fasta file. If the genome's folder is
+        not writable (i.e. a shared reference), the index is created within
+        indexdir instead (the system temporary folder if not given). Results
+        are cached per process.
+
+    Returns
+    -------
+    index : dict
+        chrom -> (length, offset, bases per line, bytes per line)
+    '''
+    fai = Path(str(genomefasta) + '.fai')
+    if not is_current(fai=fai, genomefasta=genomefasta):
+        try:
+            write_fai(genomefasta=genomefasta, fai=fai)
+        except OSError:
+            name = hashlib.sha1(str(Path(genomefasta).resolve()).encode())
+            fai = Path(indexdir if indexdir else tempfile.gettempdir()) / \
+                    f'{Path(genomefasta).name}.{name.hexdigest()[:16]}.fai'
+            if not is_current(fai=fai, genomefasta=genomefasta):
+                Path(fai.parent).mkdir(exist_ok=True, parents=True)
+                write_fai(genomefasta=genomefasta, fai=fai)
+    key = str(fai)
+    if key in _fai:
+        return _fai[key]
+
+    index = dict()
+    with open(fai) as F:
+        for line in F:
+            chrom, length, offset, linebases, linewidth = line.split('\t')[:5]
+            index[chrom] = (int(length), int(offset), int(linebases),
+                            int(linewidth))
+    _fai[key] = index
+
+    return index
+
+#==============================================================================
+def is_current(fai=None, genomefasta=None):
+    '''Whether a .fai index exists and is not older than its fasta file
+    '''
+    return (fai.exists()
+            and os.stat(fai).st_mtime_ns >= os.stat(genomefasta).st_mtime_ns)
+
+#==============================================================================
+def write_fai(genomefasta=None, fai=None):
+    '''Writes a samtools faidx compatible index of a fasta file. The index is
+        written to a temporary file first, so an unwritable folder fails 
+        before the fasta file is read.
+    '''
+    temp_fai = fai.with_name(f'{fai.name}.{os.getpid()}.tmp')
+    with open(temp_fai, 'w') as outfile:
+        records = list()
+        with open(genomefasta, 'rb') as F:
+            offset = 0
+            for line in F:
+                if line[:1] == b'>':
+                    records.append([line[1:].split()[0].decode(), 0,
+                                    offset + len(line), 0, 0])
+                elif records and line.strip():
+                    if records[-1][3] == 0:
+                        records[-1][3] = len(line.rstrip(b'\r\n'))
+                        records[-1][4] = len(line)
+                    records[-1][1] += len(line.rstrip(b'\r\n'))
+                offset += len(line)
+        outfile.writelines('\t'.join(map(str, record)) + '\n'
+                            for record in records)
+    if not records:
+        temp_fai.unlink()
+        raise exceptions.InputError(f"No sequences found in {genomefasta}")
+    os.replace(temp_fai, fai)
+
+    return fai
+
+#==============================================================================
+_genomes = dict()
+
+def load_genome(genomefasta=None):
+    '''Memory-maps a genome fasta file. Maps are cached per process.
+    '''
+    stat = os.stat(genomefasta)
+    identity = (stat.st_ino, stat.st_size)
+    key = str(genomefasta)
+    if key not in _genomes or _genomes[key][0] != identity:
+        _genomes[key] = (identity, np.memmap(genomefasta, dtype=np.uint8,
+                                                mode='r'))
+
+    return _genomes[key][1]
+
+#==============================================================================
+def extract(genomefasta=None, chroms=None, starts=None, stops=None,
+            blocksize=BLOCKSIZE, indexdir=None):
+    '''Extracts the sequences of regions from a genome fasta file into a
+        packed buffer. Regions are clipped to the chromosome and regions on
+        chromosomes missing from the genome are empty, so that sequences stay
+        aligned with regions.
+
+    Parameters
+    ----------
+    genomefasta : str or pathlib.Path
+        full path to the genome fasta file
+    chroms : array
+        the chromosome of each region
+    starts, stops : array
+        0-based, half-open coordinates of each region
+    indexdir : str or pathlib.Path
+        folder for the genome index if the genome's folder is not writable
+
+    Returns
+    -------
+    buffer : array
+        uint8 array of sequences, each followed by a newline
+    offsets : array
+        int64 array with the start of each sequence within buffer and the
+        total length as the last value
+    '''
+    index = read_fai(genomefasta=genomefasta, indexdir=indexdir)
+    genome = load_genome(genomefasta=genomefasta)
+    chroms = np.asarray(chroms, dtype=str)
+    names, codes = np.unique(chroms, return_inverse=True)
+    missing = [chrom for chrom in names if chrom not in index]
+    if missing:
+        print(f"\tWARNING: chromosomes not found in {genomefasta}: "
+                f"{', '.join(missing)}", file=sys.stderr)
+    fields = np.array([index.get(chrom, (0, 0, 1, 1)) for chrom in names],
+                        dtype=np.int64).reshape(-1, 4)
+    length, offset, linebases, linewidth = fields[codes].T
+    starts = np.clip(np.asarray(starts, dtype=np.int64), 0, length)
+    stops = np.clip(np.asarray(stops, dtype=np.int64), starts, length)
+
+    sizes = stops - starts
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes + 1)
+    buffer = np.full(offsets[-1], SEPARATOR, dtype=np.uint8)
+
+    #Gather bases for blocks of regions, skipping newlines within the genome
+    first = 0
+    while first < len(sizes):
+        last = max(first + 1, np.searchsorted(offsets, offsets[first]
+                                                + blocksize, side='right') - 1)
+        block = np.arange(first, last)
+        total = np.sum(sizes[block])
+        region = np.repeat(block, sizes[block])
+        within = np.arange(total) - np.repeat(np.cumsum(sizes[block])
+                                                - sizes[block], sizes[block])
+        position = starts[region] + within
+        buffer[offsets[region] + within] = genome[offset[region]
+                                    + position//linebases[region]
+                                    *linewidth[region]
+                                    + position % linebases[region]]
+        first = last
+
+    return buffer, offsets
+
+#==============================================================================
+def sequence_offsets(buffer=None):
+    '''Returns the start of each newline-terminated sequence within a buffer
+        and the total length as the last value
+    '''
+    offsets = np.zeros(1, dtype=np.int64)
+
+    return np.concatenate([offsets, np.flatnonzero(buffer == SEPARATOR) + 1])
+
+#==============================================================================
+def read_fasta(fastafile=None):
+    '''Reads a fasta file into a packed buffer
+
+    Returns
+    -------
+    names : list
+        the name of each sequence
+    buffer : array
+        uint8 array of sequences, each followed by a newline
+    offsets : array
+        int64 array with the start of each sequence within buffer and the
+        total length as the last value
+    '''
+    names = list()
+    sequences = list()
+    sequence = list()
+    with open(fastafile, 'rb') as F:
+        for line in F:
+            if line[:1] == b'>':
+                if names:
+                    sequences.append(b''.join(sequence) + b'\n')
+                names.append(line[1:].decode().strip('\n'))
+                sequence = list()
+            else:
+                sequence.append(line.strip())
+    if names:
+        sequences.append(b''.join(sequence) + b'\n')
+    buffer = np.frombuffer(b''.join(sequences), dtype=np.uint8)
+
+    return names, buffer, sequence_offsets(buffer=buffer)
+
+#==============================================================================
+def unique(buffer=None, offsets=None):
+    '''Returns a buffer containing each distinct sequence of a buffer once
+
+    Returns
+    -------
+    unique_buffer : array
+        uint8 array of distinct sequences, each followed by a newline
+    indexes : array
+        int64 array with the index of each input sequence within
+        unique_buffer
+    '''
+    distinct = dict()
+    indexes = np.zeros(len(offsets) - 1, dtype=np.int64)
+    data = buffer.tobytes()
+    for i, (start, stop) in enumerate(zip(offsets[:-1].tolist(),
+                                            offsets[1:].tolist())):
+        indexes[i] = distinct.setdefault(data[start:stop], len(distinct))
+    unique_buffer = np.frombuffer(b''.join(distinct), dtype=np.uint8)
+
+    return unique_buffer, indexes
+
+#==============================================================================
+def subset(buffer=None, offsets=None, positions=None):
+    '''Returns a buffer containing the sequences at the given positions, in
+        that order
+    '''
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    return np.concatenate([buffer[start:stop] for start, stop 
+                            in zip(offsets[positions].tolist(), 
+                                    offsets[positions + 1].tolist())])
+
+#==============================================================================
+def write_sequences(path=None, buffer=None):
+    '''Writes a buffer as a sequence file (one sequence per line)
+    '''
+    with open(path, 'wb') as outfile:
+        outfile.write(buffer.tobytes())
+
+    return path
+
+#==============================================================================
+def read_sequences(path=None):
+    '''Memory-maps a sequence file (one sequence per line)
+
+    Returns
+    -------
+    buffer : array
+        uint8 array of sequences, each followed by a newline
+    offsets : array
+        int64 array with the start of each sequence within buffer and the
+        total length as the last value
+    '''
+    if os.path.getsize(path) == 0:
+        buffer = np.zeros(0, dtype=np.uint8)
+    else:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+
+    return buffer, sequence_offsets(buffer=buffer)
+
+#==============================================================================
+def write_fasta(path=None, buffer=None, offsets=None, names=None):
+    '''Writes the sequences of a buffer as a fasta file, one line per
+        sequence (as bedtools getfasta does)
+    '''
+    data = buffer.tobytes()
+    with open(path, 'wb') as outfile:
+        outfile.writelines(b'>' + name.encode() + b'\n' + data[start:stop]
+                            for name, start, stop
+                            in zip(names, offsets[:-1].tolist(),
+                                    offsets[1:].tolist()))
+
+    return path
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+'''This file contains scripts to convert a folder of genome-wide motif hit bed
+    files (for use with the 'genome hits' scanner) into a single compact index
+    that can be memory-mapped. For each motif and chromosome, the index holds
+    int32 hit starts sorted by position along with the running maximum of hit
+    stops. Usage:
+
+        TFEA index-genomehits --genomehits DIR --output INDEX_DIR
+
+    The resulting INDEX_DIR can then be given to TFEA using --genomehits in
+    place of the original folder of bed files.
+'''
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import sys
+import time
+import datetime
+import argparse
+from pathlib import Path
+
+import ujson
+import numpy as np
+
+from TFEA import exceptions
+
+#Main Function
+#==============================================================================
+def main(args=None):
+    '''Main executable script
+    '''
+    parser = parse_arguments()
+    if args is not None and len(args) == 0:
+        parser.print_help()
+        sys.exit(1)
+
+    inputs = vars(parser.parse_args(args))
+    genomehits = Path(inputs['genomehits'])
+    if inputs['output'] is None:
+        output = genomehits.parent / (genomehits.name + '_index')
+    else:
+        output = Path(inputs['output'])
+
+    start_time = time.time()
+    print("Indexing genome hits...", flush=True, file=sys.stderr)
+    build(genomehits=genomehits, output=output)
+    total_time = time.time() - start_time
+    print("done in: " + str(datetime.timedelta(seconds=int(total_time))),
+            file=sys.stderr)
+    print("Index written to:", output, file=sys.stderr)
+
+#Secondary Functions
+#==============================================================================
+def parse_arguments():
+    '''Parse user arguments
+    '''
+    parser = argparse.ArgumentParser(prog='TFEA index-genomehits',
+                                        description=("Convert a folder of "
+                                        "genome-wide motif hit bed files into "
+                                        "a memory-mappable index for use with "
+                                        "the 'genome hits' scanner."))
+    parser.add_argument('--genomehits', '-g', required=True, help=("A folder "
+                        "containing bed files with pre-calculated motif hits "
+                        "to a genome."))
+    parser.add_argument('--output', '-o', help=("Full path to the output index "
+                        "folder. Default: GENOMEHITS_index"))
+    return parser
+
+#==============================================================================
+def build(genomehits=None, output=None):
+    '''Reads every bed file within a genome hits folder and writes an index
+        folder containing:
+            starts.bin - int32 hit starts, sorted within each motif/chromosome
+            ends.bin - int32 running maximum of hit stops
+            index.json - motif and chromosome offsets into the above
+
+    Parameters
+    ----------
+    genomehits : pathlib.Path
+        full path to a folder of motif hit bed files
+    output : pathlib.Path
+        full path to the index folder to create
+
+    Returns
+    -------
+    output : pathlib.Path
+        full path to the index folder
+    '''
+    from TFEA import scanner
+    if not genomehits.is_dir():
+        raise exceptions.InputError(f"GENOMEHITS folder not found: {genomehits}")
+    output.mkdir(exist_ok=True, parents=True)
+
+    offsets = dict()
+    position = 0
+    motif_files = sorted(os.listdir(genomehits))
+    with open(output / 'starts.bin', 'wb') as starts_out, \
+            open(output / 'ends.bin', 'wb') as ends_out:
+        for i, motif_file in enumerate(motif_files, 1):
+            motif = motif_name(motif_file)
+            offsets[motif] = dict()
+            hits = scanner.read_genomehits(bedfile=genomehits / motif_file)
+            for chrom in sorted(hits):
+                starts, ends = hits[chrom]
+                if (len(starts) > 0 and
+                        max(starts[-1], ends[-1]) > np.iinfo(np.int32).max):
+                    raise exceptions.InputError(("Motif hit coordinates "
+                                        f"exceed int32 range in {motif_file}"))
+                starts.astype(np.int32).tofile(starts_out)
+                ends.astype(np.int32).tofile(ends_out)
+                offsets[motif][chrom] = [position, position + len(starts)]
+                position += len(starts)
+            print(f'\r\t Completed: {i}/{len(motif_files)} ', end=' ',
+                    flush=True, file=sys.stderr)
+    print('', file=sys.stderr)
+
+    with open(output / 'index.json', 'w') as outfile:
+        ujson.dump(dict(motifs=offsets, size=position), outfile)
+
+    return output
+
+#==============================================================================
+def motif_name(motif_file):
+    '''Returns the motif name corresponding to a motif hit bed file name
+    '''
+    motif_file = Path(motif_file).name
+    if motif_file.endswith('.bed'):
+        motif_file = motif_file[:-len('.bed')]
+
+    return motif_file
+
+#==============================================================================
+def is_index(genomehits=None):
+    '''Whether a genome hits path points to an index created by build
+    '''
+    return (Path(genomehits) / 'index.json').exists()
+
+#==============================================================================
+_indexes = dict()
+
+def load(genomehits=None):
+    '''Opens an index created by build. The hit arrays are memory-mapped and
+        cached per process.
+
+    Parameters
+    ----------
+    genomehits : pathlib.Path
+        full path to an index folder
+
+    Returns
+    -------
+    offsets : dict
+        motif -> chromosome -> [start, stop] offsets into starts and ends
+    starts : numpy.memmap
+        int32 hit starts
+    ends : numpy.memmap
+        int32 running maximum of hit stops
+    '''
+    key = str(genomehits)
+    if key not in _indexes:
+        genomehits = Path(genomehits)
+        with open(genomehits / 'index.json') as F:
+            index = ujson.load(F)
+        if index['size'] > 0:
+            starts = np.memmap(genomehits / 'starts.bin', dtype=np.int32,
+                                mode='r', shape=(index['size'],))
+            ends = np.memmap(genomehits / 'ends.bin', dtype=np.int32,
+                                mode='r', shape=(index['size'],))
+        else:
+            starts = np.zeros(0, dtype=np.int32)
+            ends = np.zeros(0, dtype=np.int32)
+        _indexes[key] = (index['motifs'], starts, ends)
+
+    return _indexes[key]
+
+#==============================================================================
+def motifs(genomehits=None):
+    '''Returns the names of all motifs within an index
+    '''
+    offsets, _, _ = load(genomehits=genomehits)
+
+    return sorted(offsets)
+
+#==============================================================================
+def motif_hits(genomehits=None, motif=None):
+    '''Returns the hits of a single motif from an index in the format returned
+        by scanner.read_genomehits. Arrays are views into the memory-mapped
+        index so no hits are copied.
+
+    Parameters
+    ----------
+    genomehits : pathlib.Path
+        full path to an index folder
+    motif : str
+        the name of a motif within the index
+
+    Returns
+    -------
+    hits : dict
+        chromosome -> (starts, ends) as int32 arrays
+
+    Raises
+    ------
+    InputError
+        If motif is not within the index
+    '''
+    offsets, starts, ends = load(genomehits=genomehits)
+    motif = motif_name(motif)
+    if motif not in offsets:
+        raise exceptions.InputError(f"Motif not found in genome hits index: {motif}")
+
+    return {chrom: (starts[i:j], ends[i:j])
+                for chrom, (i, j) in offsets[motif].items()}
+
+#Independent script functionality
+#==============================================================================
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains interval operations on bed regions held in memory,
+    used by the COMBINE module in place of chains of pybedtools calls that
+    each write a temporary file. Regions are stored per chromosome as int64
+    arrays of starts and stops ({chrom: (starts, stops)}). Operations that
+    bedtools would follow with a sort (merge, intersect) return regions
+    sorted by start; per-region operations (center, extend, filters) keep the
+    order of their input, as BedTool.each() and filter() do.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+from collections import defaultdict
+
+import numpy as np
+
+#Functions
+#==============================================================================
+def read_bed(bedfile=None):
+    '''Reads the chrom, start and stop of each region in a bed file. Header,
+        track and browser lines are skipped.
+
+    Parameters
+    ----------
+    bedfile : str or pathlib.Path
+        full path to a bed file
+
+    Returns
+    -------
+    regions : dict
+        chrom -> (starts, stops) int64 arrays, in file order
+    '''
+    positions = defaultdict(list)
+    with open(bedfile) as F:
+        for line in F:
+            if (line[0] == '#' or line.strip() == ''
+                    or line.startswith(('track', 'browser'))):
+                continue
+            linelist = line.strip('\n').split('\t')
+            positions[linelist[0]].append((int(linelist[1]),
+                                            int(linelist[2])))
+
+    regions = dict()
+    for chrom, chrom_positions in positions.items():
+        chrom_positions = np.array(chrom_positions,
+                                    dtype=np.int64).reshape(-1, 2)
+        regions[chrom] = (chrom_positions[:, 0], chrom_positions[:, 1])
+
+    return regions
+
+#==============================================================================
+def from_arrays(chroms=None, starts=None, stops=None):
+    '''Groups regions given as parallel arrays by chromosome, keeping their
+        order
+    '''
+    chroms = np.asarray(chroms, dtype=str)
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+
+    return {chrom: (starts[chroms == chrom], stops[chroms == chrom])
+            for chrom in np.unique(chroms).tolist()}
+
+#==============================================================================
+def sort(regions=None):
+    '''Sorts regions within each chromosome by start, then stop
+    '''
+    sorted_regions = dict()
+    for chrom, (starts, stops) in regions.items():
+        order = np.lexsort((stops, starts))
+        sorted_regions[chrom] = (starts[order], stops[order])
+
+    return sorted_regions
+
+#==============================================================================
+def concatenate(region_sets=None):
+    '''Concatenates a list of region sets (as bedtools cat without merging)
+    '''
+    concatenated = dict()
+    for chrom in sorted(set().union(*region_sets)):
+        concatenated[chrom] = (np.concatenate([regions[chrom][0] for regions
+                                    in region_sets if chrom in regions]),
+                                np.concatenate([regions[chrom][1] for regions
+                                    in region_sets if chrom in regions]))
+
+    return concatenated
+
+#==============================================================================
+def merge(region_sets=None):
+    '''Merges overlapping and book-ended regions across a list of region sets
+        (as bedtools sort | bedtools merge)
+
+    Parameters
+    ----------
+    region_sets : list
+        region dicts ({chrom: (starts, stops)}) to merge together
+
+    Returns
+    -------
+    merged : dict
+        chrom -> (starts, stops) of non-overlapping regions sorted by start
+    '''
+    merged = dict()
+    for chrom, (starts, stops) in sort(concatenate(region_sets)).items():
+        if len(starts) == 0:
+            continue
+        reach = np.maximum.accumulate(stops)
+
+        #A new region begins at every region starting past all previous ones
+        first = np.flatnonzero(np.append(True, starts[1:] > reach[:-1]))
+        last = np.append(first[1:], len(starts)) - 1
+        merged[chrom] = (starts[first], reach[last])
+
+    return merged
+
+#==============================================================================
+def intersect(a=None, b=None):
+    '''Reports the overlapping part of every pair of overlapping regions
+        between two region sets (as bedtools intersect -a a -b b). A region
+        of a overlapping several regions of b is reported once per overlap.
+
+    Returns
+    -------
+    intersected : dict
+        chrom -> (starts, stops) of the overlaps sorted by start
+    '''
+    intersected = dict()
+    for chrom in set(a).intersection(b):
+        a_starts, a_stops = a[chrom]
+        b_starts, b_stops = sort({chrom: b[chrom]})[chrom]
+        reach = np.maximum.accumulate(b_stops)
+
+        #Regions of b before lo end before the region of a starts and
+        # regions from hi onwards start after it ends
+        lo = np.searchsorted(reach, a_starts, side='right')
+        hi = np.searchsorted(b_starts, a_stops, side='left')
+        counts = np.maximum(hi - lo, 0)
+        a_index = np.repeat(np.arange(len(a_starts)), counts)
+        b_index = (np.arange(np.sum(counts)) + np.repeat(lo - np.cumsum(counts)
+                                                        + counts, counts))
+        starts = np.maximum(a_starts[a_index], b_starts[b_index])
+        stops = np.minimum(a_stops[a_index], b_stops[b_index])
+        overlapping = starts < stops
+        if np.any(overlapping):
+            intersected[chrom] = (starts[overlapping], stops[overlapping])
+
+    return sort(intersected)
+
+#==============================================================================
+def intersect_all(region_sets=None):
+    '''Intersects a list of region sets in turn, reporting the parts of the
+        first set's regions overlapped by every other set
+    '''
+    intersected = region_sets[0]
+    for regions in region_sets[1:]:
+        intersected = intersect(a=intersected, b=regions)
+
+    return sort(intersected)
+
+#==============================================================================
+def center(regions=None):
+    '''Replaces each region by its center base
+    '''
+    centered = dict()
+    for chrom, (starts, stops) in regions.items():
+        centers = ((starts + stops)/2).astype(np.int64)
+        centered[chrom] = (centers, centers + 1)
+
+    return centered
+
+#==============================================================================
+def extend(regions=None, size=0):
+    '''Extends each region by size on both sides, without going below 0
+    '''
+    return {chrom: (np.maximum(starts - size, 0), stops + size)
+            for chrom, (starts, stops) in regions.items()}
+
+#==============================================================================
+def filter_size(regions=None, above=None, below=None):
+    '''Keeps regions longer than above and shorter than below (either may be
+        None)
+    '''
+    filtered = dict()
+    for chrom, (starts, stops) in regions.items():
+        keep = np.ones(len(starts), dtype=bool)
+        if above is not None:
+            keep &= stops - starts > above
+        if below is not None:
+            keep &= stops - starts < below
+        filtered[chrom] = (starts[keep], stops[keep])
+
+    return filtered
+
+#==============================================================================
+def remove_invalid(regions=None):
+    '''Removes regions with a negative start or a stop before their start (as
+        BedTool.remove_invalid)
+    '''
+    valid_regions = dict()
+    for chrom, (starts, stops) in regions.items():
+        valid = (starts >= 0) & (starts <= stops)
+        valid_regions[chrom] = (starts[valid], stops[valid])
+
+    return valid_regions
+
+#==============================================================================
+def count(regions=None):
+    '''Returns the number of regions
+    '''
+    return sum(len(starts) for starts, _ in regions.values())
+
+#==============================================================================
+def write_bed(regions=None, bedfile=None, name=None):
+    '''Writes regions to a bed file with chromosomes in lexicographic order
+
+    Parameters
+    ----------
+    regions : dict
+        chrom -> (starts, stops)
+    bedfile : str or pathlib.Path
+        full path to the bed file to write
+    name : str
+        if not None, written as a fourth (name) column of every region
+
+    Returns
+    -------
+    bedfile : str or pathlib.Path
+        full path to the bed file written
+    '''
+    suffix = '\n' if name is None else f'\t{name}\n'
+    with open(bedfile, 'w') as outfile:
+        for chrom in sorted(regions):
+            starts, stops = regions[chrom]
+            outfile.writelines(f'{chrom}\t{start}\t{stop}{suffix}'
+                                for start, stop in zip(starts.tolist(),
+                                                        stops.tolist()))
+
+    return bedfile
@@ -40,6 +40,20 @@ def run():
         parser.print_help()
         sys.exit(1)
 
+    #Standalone commands
+    #==============================================================================
+    '''Utility commands that prepare inputs for TFEA (i.e. TFEA index-genomehits)
+        are run and exit before any pipeline arguments are parsed.
+    '''
+    if sys.argv[1] == 'index-genomehits':
+        from TFEA import genomehits_index
+        genomehits_index.main(sys.argv[2:])
+        sys.exit()
+    if sys.argv[1] == 'build-coverage':
+        from TFEA import coverage
+        coverage.main(sys.argv[2:])
+        sys.exit()
+
     #TEST module
     #==============================================================================
     '''If test flag specified, run unittests and exit.
@@ -117,50 +131,66 @@ def run():
         mp.log_to_stderr()
         multiprocess.current_mem_usage(config.vars['JOBID'])
 
-    #COMBINE module
-    #==============================================================================
-    '''This module is a pre-processing step where a user may specify how to handle
-        multiple bed file inputs. The goal is to arrive at a single bed file to
-        input into subsequent modules.
-    '''
-    if config.vars['COMBINE'] != False:
-        from TFEA import combine
-        combine.main()
-
-    #RANK module
+    #Worker processes
     #==============================================================================
-    '''This module decides how to rank regions within the bed files. If genome
-        hits specified then the ranked output will only contain the center of each
-        region (since we will perform bedtools closest later)
+    '''A single pool of worker processes is started here and reused by all 
+        modules. Workers are stopped immediately if any module fails.
     '''
-    if config.vars['RANK'] != False:
-        from TFEA import rank
-        rank.main()
-
-    #SCANNER module
-    #==============================================================================
-    '''This module returns motif distances to regions of interest. This is
-        accomplished either by scanning regions on the fly using fimo or homer, or 
-        by running bedtools closest on region centers compared to a database of
-        motif hits across the genome.
-    '''
-    from TFEA import scanner
-    scanner.main()
+    multiprocess.start_pool(cpus=config.vars['CPUS'])
+    try:
+        #COMBINE module
+        #==========================================================================
+        '''This module is a pre-processing step where a user may specify how to handle
+            multiple bed file inputs. The goal is to arrive at a single bed file to
+            input into subsequent modules.
+        '''
+        if config.vars['COMBINE'] != False:
+            from TFEA import combine
+            combine.main()
+
+        #RANK module
+        #==========================================================================
+        '''This module decides how to rank regions within the bed files. If genome
+            hits specified then the ranked output will only contain the center of each
+            region (since we will perform bedtools closest later)
+        '''
+        if config.vars['RANK'] != False:
+            from TFEA import rank
+            rank.main()
+
+        #Ranking results are given to each worker once rather than being sent 
+        # along with every task
+        multiprocess.share(shared={key: config.vars[key] for key in 
+                                    ['PVALS', 'FCS', 'META_PROFILE']})
+
+        #SCANNER module
+        #==========================================================================
+        '''This module returns motif distances to regions of interest. This is
+            accomplished either by scanning regions on the fly using fimo or homer, or 
+            by finding the closest hit to region centers within a database of
+            motif hits across the genome.
+        '''
+        from TFEA import scanner
+        scanner.main()
         
-    #ENRICHMENT module
-    #==============================================================================
-    '''Where the bulk of TFEA analysis occurs. Some components of plotting module 
-        are contained within this enrichment module
-    '''
-    from TFEA import enrichment
-    enrichment.main()
+        #ENRICHMENT module
+        #==========================================================================
+        '''Where the bulk of TFEA analysis occurs. Some components of plotting module 
+            are contained within this enrichment module
+        '''
+        from TFEA import enrichment
+        enrichment.main()
         
-    #OUTPUT module
-    #==============================================================================
-    '''A module to write output to either a txt or html file
-    '''
-    from TFEA import output
-    output.main()
+        #OUTPUT module
+        #==========================================================================
+        '''A module to write output to either a txt or html file
+        '''
+        from TFEA import output
+        output.main()
+    except BaseException:
+        multiprocess.stop_pool(terminate=True)
+        raise
+    multiprocess.stop_pool()
 
     print("TFEA done. Output in:", config.vars['OUTPUT'], file=sys.stderr)
 
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module estimates markov background models for FIMO in-process, in
+    place of running fasta-get-markov. K-mers are counted on both strands of
+    region sequences (packed buffers from genome_fasta) with vectorized
+    base-4 indexing, and written as MEME background files. Files are named by
+    a hash of what they were computed from (genome, regions, window, order),
+    so a cache folder can reuse them across runs.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import hashlib
+from pathlib import Path
+
+import ujson
+import numpy as np
+
+from TFEA import pwm
+
+#Constants
+#==============================================================================
+#Increment if the format or meaning of background files changes
+VERSION = 1
+ALPHABET = 'ACGT'
+#Number of bases counted at once
+BLOCKSIZE = 2**24
+
+#Main Script
+#==============================================================================
+def cached_background(cachedir=None, fields=None, sequences=None, order=1,
+                        source=''):
+    '''Returns a MEME background file for the given key fields, computing it
+        only if it is not already within cachedir.
+
+    Parameters
+    ----------
+    cachedir : pathlib.Path
+        full path to the folder in which to keep background files
+    fields : dict
+        values identifying the sequences counted (i.e. genome, region set
+        hash and window)
+    sequences : function object
+        called without arguments on a cache miss. Returns a packed buffer of
+        sequences (output of genome_fasta)
+    order : int
+        the order of the markov model
+    source : str
+        description of the sequences written to the file header
+
+    Returns
+    -------
+    background_file : pathlib.Path
+        full path to the background file
+    '''
+    order = int(order)
+    key = dict(fields, version=VERSION, order=order)
+    digest = hashlib.sha1(ujson.dumps(key, sort_keys=True).encode()).hexdigest()
+    background_file = Path(cachedir) / f'markov_background.{digest}.txt'
+    if background_file.exists():
+        os.utime(background_file)
+        return background_file
+
+    Path(cachedir).mkdir(exist_ok=True, parents=True)
+    temp_file = background_file.with_name(f'{background_file.name}.'
+                                            f'{os.getpid()}.tmp')
+    write_background(path=temp_file, frequencies=kmer_frequencies(
+                                        buffer=sequences(), order=order),
+                        source=source)
+    os.replace(temp_file, background_file)
+
+    return background_file
+
+#Functions
+#==============================================================================
+def genome_key(genomefasta=None):
+    '''Identifies a genome fasta file by its path, size and modification time
+    '''
+    stat = os.stat(genomefasta)
+
+    return f'{Path(genomefasta).resolve()}:{stat.st_size}:{stat.st_mtime_ns}'
+
+#==============================================================================
+def buffer_hash(buffer=None):
+    '''Returns the sha1 hex digest of a packed buffer of sequences
+    '''
+    return hashlib.sha1(np.ascontiguousarray(buffer).data).hexdigest()
+
+#==============================================================================
+def kmer_frequencies(buffer=None, order=1, both_strands=True,
+                        blocksize=BLOCKSIZE):
+    '''Counts all k-mers up to length order + 1 within a packed buffer of
+        sequences. K-mers containing non-ACGT bases or spanning two
+        sequences are skipped.
+
+    Parameters
+    ----------
+    buffer : array
+        uint8 array of sequences, each followed by a newline
+    order : int
+        the order of the markov model
+    both_strands : boolean
+        whether to also count the reverse complement of each sequence (as
+        fasta-get-markov does by default)
+
+    Returns
+    -------
+    frequencies : list
+        for each k from 1 to order + 1, a float64 array of the frequency of
+        each k-mer in lexicographic (base 4) order
+    '''
+    counts = [np.zeros(4**k, dtype=np.int64) for k in range(1, order + 2)]
+    for start in range(0, max(len(buffer), 1), blocksize):
+        codes = pwm.encode(np.ascontiguousarray(
+                            buffer[start:start + blocksize + order]))
+        invalid = np.concatenate([[0], np.cumsum(codes > 3)])
+        index = np.zeros(len(codes), dtype=np.int64)
+        for k in range(1, order + 2):
+            windows = len(codes) - k + 1
+            #Windows starting past this block are counted by the next block
+            windows = min(windows, blocksize)
+            if windows <= 0:
+                break
+            index = index[:windows]*4 + (codes[k - 1:k - 1 + windows] & 3)
+            valid = invalid[k:k + windows] == invalid[:windows]
+            counts[k - 1] += np.bincount(index[valid], minlength=4**k)
+
+    frequencies = list()
+    for k, kmer_counts in enumerate(counts, 1):
+        if both_strands:
+            kmer_counts = kmer_counts + kmer_counts[reverse_complements(k=k)]
+        total = np.sum(kmer_counts)
+        frequencies.append(kmer_counts/total if total > 0
+                            else np.full(4**k, 1/4**k))
+
+    return frequencies
+
+#==============================================================================
+def reverse_complements(k=None):
+    '''Returns the index of the reverse complement of each k-mer
+    '''
+    kmers = np.arange(4**k)
+    complements = np.zeros(4**k, dtype=np.int64)
+    for position in range(k):
+        base = (kmers // 4**position) % 4
+        complements = complements*4 + (3 - base)
+
+    return complements
+
+#==============================================================================
+def write_background(path=None, frequencies=None, source=''):
+    '''Writes k-mer frequencies as a MEME markov background file
+    '''
+    with open(path, 'w') as outfile:
+        outfile.write(f'# {len(frequencies) - 1}-order Markov frequencies '
+                        f'from {source}\n')
+        for k, kmer_frequencies in enumerate(frequencies, 1):
+            outfile.write(f'# order {k - 1}\n')
+            kmers = [''.join(ALPHABET[(i // 4**position) % 4]
+                                for position in reversed(range(k)))
+                        for i in range(4**k)]
+            outfile.writelines(f'{kmer} {frequency:.3e}\n' for kmer, frequency
+                                in zip(kmers, kmer_frequencies.tolist()))
+
+    return path
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module parses a MEME formatted motif database once per process into a
+    MotifDatabase shared by the scanners, enrichment, plotting and simulation
+    modules, which previously each re-read the whole database for every
+    motif. Motif matrices are stored concatenated in a single array with
+    per-motif offsets, alongside their lengths, nsites, GC content, record
+    text and the database background. Databases are cached by path and
+    parsed again only if the file's size or modification time changes.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+
+import numpy as np
+
+from TFEA import exceptions
+
+#Constants
+#==============================================================================
+ALPHABET = 'ACGT'
+#nsites used for pseudocounts when a motif does not specify it
+DEFAULT_NSITES = 20
+
+#Main Script
+#==============================================================================
+_databases = dict()
+
+def load(motifdatabase=None):
+    '''Returns the parsed MotifDatabase of a MEME formatted file. Databases
+        are cached per process and re-parsed if the file changes.
+
+    Parameters
+    ----------
+    motifdatabase : str or pathlib.Path
+        full path to a MEME formatted (.meme) motif database
+
+    Returns
+    -------
+    database : MotifDatabase
+        the parsed database
+    '''
+    stat = os.stat(motifdatabase)
+    identity = (stat.st_size, stat.st_mtime_ns)
+    key = str(motifdatabase)
+    if key not in _databases or _databases[key][0] != identity:
+        _databases[key] = (identity, parse(motifdatabase=motifdatabase))
+
+    return _databases[key][1]
+
+#Functions
+#==============================================================================
+def parse(motifdatabase=None):
+    '''Parses a MEME formatted motif database in a single pass. Rows of each
+        motif's letter-probability matrix are normalized to sum to one. If a
+        motif name occurs more than once, the last motif is kept.
+
+    Returns
+    -------
+    database : MotifDatabase
+        the parsed database
+    '''
+    with open(motifdatabase) as F:
+        lines = F.readlines()
+
+    header = list()
+    records = dict()
+    matrices = dict()
+    nsites = dict()
+    background = np.full(4, 0.25)
+    name = None
+    skip = False
+    for i, line in enumerate(lines):
+        if line.startswith('MOTIF'):
+            name = line.split()[1]
+            records[name] = list()
+            matrices[name] = list()
+            nsites[name] = DEFAULT_NSITES
+        if name is None:
+            header.append(line)
+        else:
+            records[name].append(line.rstrip())
+
+        #Background frequencies are on the line following their title
+        if skip:
+            skip = False
+        elif line.startswith('Background letter frequencies'):
+            values = lines[i + 1].split() if i + 1 < len(lines) else []
+            frequencies = dict(zip(values[0::2], values[1::2]))
+            background = np.array([float(frequencies[base])
+                                    for base in ALPHABET])
+            skip = True
+        elif line.startswith('MOTIF'):
+            continue
+        elif line.startswith('letter-probability'):
+            fields = line.replace('=', ' = ').split()
+            if 'nsites' in fields:
+                nsites[name] = float(fields[fields.index('nsites') + 2])
+        elif name is not None and line.strip() != '' and 'URL' not in line:
+            try:
+                row = [float(x) for x in line.split()]
+            except ValueError:
+                continue
+            if len(row) == 4:
+                matrices[name].append(np.array(row)/np.sum(row))
+
+    header = ''.join(header)
+    names = list(records)
+    return MotifDatabase(names=names,
+                        matrices=[matrices[name] for name in names],
+                        nsites=[nsites[name] for name in names],
+                        records=[header + '\n'.join(records[name])
+                                    for name in names],
+                        background=background)
+
+#Classes
+#==============================================================================
+class MotifDatabase(object):
+    '''The motifs of a MEME formatted database
+
+    Attributes
+    ----------
+    names : list
+        the name of each motif, in database order
+    index : dict
+        motif name -> position within names
+    probabilities : array
+        float64 (total width x 4) array of the A, C, G, T probabilities of
+        every motif, concatenated
+    offsets : array
+        int64 array with the first row of each motif within probabilities and
+        the total number of rows as the last value
+    lengths : array
+        int64 array with the width of each motif
+    nsites : array
+        float64 array with the nsites of each motif
+    gc : array
+        float64 array with the mean G + C probability of each motif (NaN for
+        motifs without a matrix)
+    records : list
+        the text of each motif as a single-motif database: the database
+        header (alphabet, strands and background) followed by the motif
+    background : array
+        A, C, G, T background frequencies within the database (uniform if not
+        specified)
+    '''
+    def __init__(self, names=None, matrices=None, nsites=None, records=None,
+                    background=None):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.lengths = np.array([len(rows) for rows in matrices],
+                                dtype=np.int64)
+        self.offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(self.lengths)
+        self.probabilities = np.zeros((self.offsets[-1], 4))
+        for i, rows in enumerate(matrices):
+            if rows:
+                self.probabilities[self.offsets[i]:self.offsets[i + 1]] = rows
+        self.nsites = np.array(nsites, dtype=np.float64)
+        self.records = records
+        self.background = background
+
+        #Summed row by row (C then G) as enrichment has always reported it
+        self.gc = np.full(len(names), np.nan)
+        for i in range(len(names)):
+            if self.lengths[i] > 0:
+                self.gc[i] = sum(self.pssm(names[i])[:, 1:3].ravel().tolist())
+                self.gc[i] = self.gc[i]/float(self.lengths[i])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, motif):
+        return motif in self.index
+
+    def pssm(self, motif=None):
+        '''Returns the (width x 4) A, C, G, T probability matrix of a motif
+        '''
+        if motif not in self.index:
+            raise exceptions.InputError(f"Motif not found in database: {motif}")
+        i = self.index[motif]
+
+        return self.probabilities[self.offsets[i]:self.offsets[i + 1]]
+
+    def gc_content(self, motif=None):
+        '''Returns the mean G + C probability of a motif, or NaN if the motif
+            is not within the database
+        '''
+        if motif not in self.index:
+            return np.nan
+
+        return self.gc[self.index[motif]]
+
+    def record(self, motif=None):
+        '''Returns the text of a motif as a single-motif database
+        '''
+        if motif not in self.index:
+            raise exceptions.InputError(f"Motif not found in database: {motif}")
+
+        return self.records[self.index[motif]]
+
+    def write_motif(self, motif=None, path=None):
+        '''Writes a single-motif MEME database, i.e. for tools that would
+            otherwise read the whole database to find one motif
+        '''
+        with open(path, 'w') as outfile:
+            outfile.write(self.record(motif) + '\n')
+
+        return path
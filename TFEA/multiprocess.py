@@ -15,6 +15,7 @@ __email__ = 'Jonathan.Rubin@colorado.edu'
 #Imports
 #==============================================================================
 import os
+import time
 import multiprocessing as mp
 import subprocess
 import resource
@@ -25,6 +26,13 @@ from contextlib import closing
 
 from TFEA import config
 
+#Constants
+#==============================================================================
+#Target time in seconds for a worker to process one chunk of arguments
+CHUNK_TIME = 0.2
+#Minimum number of chunks per worker, so that fast workers can take on more
+CHUNKS_PER_CPU = 4
+
 #Main Script
 #==============================================================================
 def main(function=None, args=None, kwargs=None, debug=False, jobid=None, cpus=1):
@@ -69,6 +77,7 @@ def main(function=None, args=None, kwargs=None, debug=False, jobid=None, cpus=1)
     if cpus == 1: #If only one processor requested, do not use multiprocess module
         print(f'\t Completed: 0/{len(args)} ', end=' ', file=sys.stderr)
         results = list()
+        kwargs = unpack_shared(kwargs)
         # print_in_place(f'\t Completed: 0/{len(args)} ', file=sys.stderr)
         for i, arg in enumerate(args, 1):
             x = function(arg, **kwargs)
@@ -78,22 +87,20 @@ def main(function=None, args=None, kwargs=None, debug=False, jobid=None, cpus=1)
                 # current_mem_usage(jobid, in_place=True)
             results.append(x)
         print('', file=sys.stderr)
+    elif _pool is not None and cpus <= _pool_cpus: #Reuse the persistent pool
+        print(f'\t Completed: 0/{len(args)} ', end=' ', file=sys.stderr)
+        results = dispatch(pool=_pool, function=function, args=args, 
+                            kwargs=kwargs, debug=debug, jobid=jobid, cpus=cpus)
+        print('', file=sys.stderr)
     else:
         print(f'\t Completed: 0/{len(args)} ', end=' ', file=sys.stderr)
-        with mp.Pool(cpus) as p:
+        #kwargs are given to each worker once when it starts
+        with mp.Pool(cpus, initializer=initialize_worker, 
+                        initargs=(_shared, kwargs)) as p:
             p.daemon = False #Allow child processes to spawn new processes
-            results = list()
-            # print_in_place(f'\t Completed: 0/{len(args)} ', file=sys.stderr)
-            for i, x in enumerate(p.imap_unordered(helper_single, [(function, arg, kwargs, debug) for arg in args]), 1):
-                # sys.stderr.write("\033[K")
-                # sys.stderr.write(f'\r\t Completed: {i}/{len(args)} ')
-                # sys.stderr.flush()
-                print(f'\r\t Completed: {i}/{len(args)} ', end=' ', flush=True, file=sys.stderr)
-                # print_in_place(f'\t Completed: {i}/{len(args)} ', file=sys.stderr)
-                if debug:
-                    current_mem_usage(jobid, processes=cpus, end=' ')
-                    # current_mem_usage(jobid, in_place=True)
-                results.append(x)
+            results = dispatch(pool=p, function=function, args=args, 
+                                kwargs=None, debug=debug, jobid=jobid, 
+                                cpus=cpus)
             p.close()
             p.join()
         print('', file=sys.stderr)
@@ -126,6 +133,229 @@ def main(function=None, args=None, kwargs=None, debug=False, jobid=None, cpus=1)
 
     return results
 
+#Persistent Pool
+#==============================================================================
+_pool = None
+_pool_cpus = None
+_shared = dict()
+_kwargs = None
+
+class Shared(object):
+    '''A handle to read-only state given to start_pool. Only the key is 
+        pickled when this object is sent to a worker process; it is replaced
+        by its value before the worker calls the desired function.
+
+    Parameters
+    ----------
+    key : str
+        a key within the shared state given to start_pool
+    '''
+    def __init__(self, key):
+        self.key = key
+
+    @property
+    def value(self):
+        return _shared[self.key]
+
+#==============================================================================
+def start_pool(cpus=1, shared=None):
+    '''Starts a pool of worker processes that is reused by every call to main
+        with at most this number of cpus until stop_pool is called. Each 
+        worker is initialized once with shared, a dictionary of read-only 
+        state that can be passed to main as keyword arguments using 
+        shared_value. If cpus is 1, no processes are started and main runs in
+        serial.
+
+    Parameters
+    ----------
+    cpus : int
+        the number of worker processes to start
+    shared : dict
+        read-only state to give to each worker
+    '''
+    global _pool, _pool_cpus, _shared
+    stop_pool()
+    _shared = dict() if shared is None else dict(shared)
+    if cpus > 1:
+        _pool = mp.Pool(cpus, initializer=initialize_worker, 
+                        initargs=(_shared,))
+        _pool_cpus = cpus
+
+#==============================================================================
+def share(shared=None):
+    '''Adds read-only state to the state given to start_pool, i.e. once an 
+        earlier module has produced it. If the persistent pool is running, its
+        workers are restarted so that each is given the new state once.
+
+    Parameters
+    ----------
+    shared : dict
+        read-only state to give to each worker
+    '''
+    global _shared
+    merged = dict(_shared)
+    merged.update(shared)
+    if _pool is not None:
+        start_pool(cpus=_pool_cpus, shared=merged)
+    else:
+        _shared = merged
+
+#==============================================================================
+def stop_pool(terminate=False):
+    '''Shuts down the persistent pool started by start_pool, if any
+
+    Parameters
+    ----------
+    terminate : boolean
+        Whether to stop workers immediately (i.e. after an error) rather than
+        waiting for outstanding tasks to finish
+    '''
+    global _pool, _pool_cpus
+    if _pool is not None:
+        if terminate:
+            _pool.terminate()
+        else:
+            _pool.close()
+        _pool.join()
+    _pool = None
+    _pool_cpus = None
+
+#==============================================================================
+def initialize_worker(shared, kwargs=None):
+    '''Runs once within each worker process when a pool is started
+    '''
+    global _shared, _kwargs
+    _shared = shared
+    _kwargs = kwargs
+
+#==============================================================================
+def shared_value(key, value):
+    '''Returns a Shared handle to value if it was given to start_pool under
+        key, otherwise returns value unchanged. Use this when building keyword
+        arguments for main so that large read-only values are not pickled and
+        sent with every argument.
+    '''
+    if key in _shared and _shared[key] is value:
+        return Shared(key)
+
+    return value
+
+#==============================================================================
+def unpack_shared(kwargs):
+    '''Replaces any Shared handles within kwargs with their values
+    '''
+    return {key: (value.value if isinstance(value, Shared) else value)
+                for key, value in kwargs.items()}
+
+#Task Dispatch
+#==============================================================================
+def dispatch(pool=None, function=None, args=None, kwargs=None, debug=False, 
+                jobid=None, cpus=1):
+    '''Runs function on each arg within a pool, sending args to workers in
+        chunks. The first cpus args are sent one at a time and timed; the 
+        remaining args are then sent in chunks sized so that each chunk runs 
+        for about CHUNK_TIME seconds, while leaving several chunks per worker
+        to balance load.
+
+    Parameters
+    ----------
+    pool : multiprocessing.Pool
+        the pool to run function in
+    function : function object
+        A python function object to process some arguments
+    args : list
+        A list of arguments to be input into given function
+    kwargs : dict or None
+        keyword arguments to input into given function. If None, the keyword 
+        arguments given to each worker when the pool was started are used
+    debug : boolean
+        Whether to print memory usage information of running processes
+
+    Returns
+    -------
+    results : list
+        The result of processing each arg, in order of completion
+    '''
+    args = list(args)
+    results = list()
+    times = list()
+    probe = args[:cpus] if len(args) > CHUNKS_PER_CPU*cpus else args
+    size = None
+    for chunk_args in [probe, args[len(probe):]]:
+        if len(chunk_args) == 0:
+            continue
+        if size is None:
+            size = 1
+        else:
+            size = chunksize(tasks=len(chunk_args), cpus=cpus, 
+                                task_time=sum(times)/len(times))
+        chunks = [(function, chunk_args[i:i+size], kwargs, debug) 
+                    for i in range(0, len(chunk_args), size)]
+        for chunk in pool.imap_unordered(helper_chunk, chunks):
+            for x, elapsed in chunk:
+                results.append(x)
+                times.append(elapsed)
+            print(f'\r\t Completed: {len(results)}/{len(args)} ', end=' ', 
+                    flush=True, file=sys.stderr)
+            if debug:
+                current_mem_usage(jobid, processes=cpus, end=' ')
+
+    return results
+
+#==============================================================================
+def chunksize(tasks=None, cpus=1, task_time=None, chunk_time=CHUNK_TIME, 
+                chunks_per_cpu=CHUNKS_PER_CPU):
+    '''Chooses how many tasks to send to a worker at once given the number of
+        tasks and the measured time per task
+
+    Parameters
+    ----------
+    tasks : int
+        the number of tasks to send
+    cpus : int
+        the number of worker processes
+    task_time : float
+        the average time to run a single task in seconds
+    chunk_time : float
+        the desired time to run a single chunk in seconds
+    chunks_per_cpu : int
+        the minimum number of chunks to give each worker
+
+    Returns
+    -------
+    size : int
+        the number of tasks per chunk
+    '''
+    balanced = max(1, tasks//(chunks_per_cpu*cpus))
+    if task_time <= 0:
+        return balanced
+
+    return int(max(1, min(balanced, chunk_time/task_time)))
+
+#==============================================================================
+def helper_chunk(args):
+    '''Runs a function on a chunk of arguments within a worker process
+
+    Parameters
+    ----------
+    args : tuple
+        (function, list of arguments, kwargs or None, debug)
+
+    Returns
+    -------
+    results : list
+        (result, seconds taken) for each argument
+    '''
+    function, chunk_args, kwargs, debug = args
+    kwargs = unpack_shared(_kwargs if kwargs is None else kwargs)
+    results = list()
+    for arg in chunk_args:
+        start_time = time.perf_counter()
+        x = function(arg, **kwargs)
+        results.append((x, time.perf_counter() - start_time))
+
+    return results
+
 #Functions
 #==============================================================================
 def helper(function, arg, kwargs, debug, i, jobid):
@@ -184,6 +414,7 @@ def helper_single(args):
         arguments.
     '''
     function, arg, kwargs, debug = args
+    kwargs = unpack_shared(kwargs)
     # if debug:
     #     print(f"Process #{i}, pid:{os.getpid()} running {function.__name__}",
     #             file=sys.stderr)
@@ -1,6 +1,4 @@
 import sys
-sys.path.append('C:\\Users\\Jacob\\Dropbox\\0DOWELL\\muMerge\\mumerge\\')
-import os
 import socket
 import argparse
 import time
@@ -11,9 +9,10 @@ import numpy as np
 from collections import defaultdict
 from collections import Counter
 from functools import reduce
+from functools import partial
 from itertools import combinations
 
-import mumerge_test_unit as mt
+from TFEA import multiprocess
 
 ### SOME LOW LEVEL FUNCTIONS THAT GET UTILIZED IN THE MAJOR FUNCTIONS #########
 def normal(x, pos, sig, scale):
@@ -26,6 +25,15 @@ def normal(x, pos, sig, scale):
     return coeff * np.exp(-arg)
 
 
+def log_normal(x, pos, sig, scale):
+    '''
+    Calculates the natural log of normal(), without underflowing far from pos
+    '''
+    arg = ((x - pos) / sig) ** 2 / 2.0
+    coeff = scale / np.sqrt(2 * np.pi) / sig
+    return np.log(coeff) - arg
+
+
 def overlap_check(a, b):
     '''
     Check to see if the two ordered tuples, 'a' and 'b', overlap with one 
@@ -125,7 +133,9 @@ def inputs_processor():
         'output': None,
         'weights': None,
         'verbose': False,
-        'width_ratio': None
+        'width_ratio': None,
+        'processes': 1,
+        'merge': False
     }
 
     parser = argparse.ArgumentParser(description=description_text)
@@ -168,6 +178,14 @@ def inputs_processor():
             "to combine the sample bedfiles. If not specified, mumerge will "
             "generate one directly from the sample bedfiles.")
     )
+    # NUMBER OF WORKER PROCESSES (OPTIONAL)
+    parser.add_argument(
+        '-p', '--processes',
+        type=int,
+        help=("Number of worker processes. Chromesomes are merged in "
+            "parallel (default: 1)."),
+        default=1
+    )
     # VERBOSE TOGGLE (OPTIONAL)
     parser.add_argument(
         '-v', '--verbose',
@@ -216,29 +234,21 @@ def inputs_processor():
             # Assign bedfiles and sampids (input must have 3 columns)
             bedfiles, sampids, groups = zip(*samples)
             
-            # Pull set of groups and initialize list to contain group structure
-            groups = sorted(set(groups))
-            grouped_samps = []
-            # Loop over all group names
-            for group in groups:
-                samp_group = []
-                # Loop over all samples and assign their samp ID's to group
-                for sample in samples:
-                    if sample[group_col] == group:
-                        samp_group.append(sample[sampid_col])
-                grouped_samps.append(sorted(samp_group))
+            # Group the sample ID's by their group (column order as in header)
+            grouped_samps = groupings_builder(
+                [sample[sampid_col] for sample in samples],
+                [sample[group_col] for sample in samples]
+            )
 
             # if/else to determine how to handle merged bedfile
             if args.merged:
                 # User defined bedfile
                 union_bedfile = args.merged
             else:
-                # Generate merged bed file
+                # Merged bed file, generated from the sample bedfiles (same 
+                # as 'bedtools sort | bedtools merge') in the main script
                 union_bedfile = args.output + "_BEDTOOLS_MERGE.bed"
-
-                os.system("cat " + " ".join(bedfiles)
-                    + " | bedtools sort -i stdin | bedtools merge -i stdin > "
-                    + union_bedfile)
+                outdict['merge'] = True
 
     else:
         raise TypeError("Please specify input file with '-i' flag. "
@@ -252,6 +262,7 @@ def inputs_processor():
     outdict['output'] = args.output
     outdict['weights'] = None
     outdict['width_ratio'] = args.width
+    outdict['processes'] = max(args.processes, 1)
 
     return outdict
 
@@ -334,6 +345,87 @@ def bedfile_reader(file, bedGraph=False, print_header=False, count=False):
     else:
         return bed_list
 
+###############################################################################
+# This function groups sample ID's into the 'groupings' structure used by 
+# combined_prob_calculator()
+def groupings_builder(sampids, groups):
+    '''
+    Takes a sample ID and a group name for each sample and returns a list of 
+    lists of sample ID's, one list per group, of the form 
+    [[cond1_rep1, cond1_rep2, ...], [cond2_rep1, cond2_rep2, ...], ...]. 
+    Groups and the sample ID's within them are sorted.
+    '''
+    grouped_samps = []
+    # Loop over all group names and assign their samp ID's to group
+    for group in sorted(set(groups)):
+        samp_group = [sampid for sampid, samp_group in zip(sampids, groups) 
+                        if samp_group == group]
+        grouped_samps.append(sorted(samp_group))
+    return grouped_samps
+
+###############################################################################
+# This function reads the calls in a sample bedfile (i.e. tfit output) once, 
+# so that they can be shared between the merged bedfile and the tfit dict
+def read_calls(filename):
+    '''
+    Reads a sample bedfile into a dict of the form {'chr#': (starts, stops)} 
+    where 'starts' and 'stops' are int arrays of the calls on that chromesome 
+    in file order. Header ('#'), 'track' and 'browser' lines are skipped. 
+    Lines should be of the form "chr#  start  stop  [parameters]"
+    '''
+    calls = defaultdict(list)
+    with open(filename, 'r') as f:
+        for line in f:
+            if (line[0] == '#' or not line.strip() 
+                    or line.startswith(('track', 'browser'))):
+                continue
+            line = line.strip('\n').split('\t')
+            calls[line[0]].append((int(line[1]), int(line[2])))
+
+    for chromesome, positions in calls.items():
+        positions = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        calls[chromesome] = (positions[:, 0], positions[:, 1])
+    return dict(calls)
+
+###############################################################################
+# This function merges the calls of all samples into the regions over which 
+# they are combined (replaces 'bedtools sort | bedtools merge')
+def merge_regions(call_sets):
+    '''
+    Takes a list of dicts output by read_calls() and returns the merged 
+    regions as a list of tuples [('chr#', start, stop), ...], sorted by 
+    chromesome and start. As with bedtools merge, overlapping and book-ended 
+    calls are merged.
+    '''
+    regions = []
+    for chromesome in sorted(set().union(*call_sets)):
+        starts = np.concatenate([calls[chromesome][0] for calls in call_sets 
+                                if chromesome in calls])
+        stops = np.concatenate([calls[chromesome][1] for calls in call_sets 
+                                if chromesome in calls])
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        reach = np.maximum.accumulate(stops[order])
+
+        # A new region begins at every call starting past all previous calls
+        first = np.flatnonzero(np.append(True, starts[1:] > reach[:-1]))
+        last = np.append(first[1:], len(starts)) - 1
+        regions.extend((chromesome, start, stop) for start, stop 
+                        in zip(starts[first].tolist(), reach[last].tolist()))
+    return regions
+
+###############################################################################
+# This function writes regions to a bedfile
+def write_bed(regions, filename):
+    '''
+    Writes regions, an iterable of ('chr#', start, stop) (i.e. the output of 
+    merge_regions() or run()), as lines of a bedfile.
+    '''
+    with open(filename, 'w') as f:
+        for chromesome, start, stop in regions:
+            f.write("\t".join([str(chromesome), str(start), str(stop)]) + "\n")
+    return filename
+
 ###############################################################################
 ### USED IN MU_DICT_GENERATOR() 
 ###############################################################################
@@ -361,65 +453,71 @@ def tfit_dict_initializer(interest_regions,
             tfit_dict[chromesome][(start, stop)] = []             
     return tfit_dict
 
+###############################################################################
+# This function builds sorted arrays of the region boundaries in the tfit dict
+# so that tfit calls can be assigned to regions with a binary search
+def region_index(tfit_dict):
+    '''
+    Returns a dict of the form {'chr#': (starts, stops, keys)} where 'starts' 
+    and 'stops' are int arrays of the region boundaries for that chromesome 
+    (sorted by start) and 'keys' are the matching (start, stop) keys in the 
+    tfit_dict. Used by tfit_file_reader() to look up the region containing 
+    each tfit call with np.searchsorted() instead of scanning all regions.
+    '''
+    index = {}
+    for chromesome, regions in tfit_dict.items():
+        keys = sorted(regions.keys())
+        bounds = np.array(keys, dtype=np.int64).reshape(-1, 2)
+        index[chromesome] = (bounds[:, 0], bounds[:, 1], keys)
+    return index
+
 ###############################################################################
 # This function scans a single tfit file and populates the tfit call regions 
 # into the provided dict
-def tfit_file_reader(filename, sampid, tfit_dict):
+def tfit_file_reader(filename, sampid, tfit_dict, index=None, calls=None):
     '''
     This function scans a tfit file and populates the tfit call regions into 
     the provided dict and returns that dict with the updated information. Must 
-    provide a sample ID.
-    TODO: This function is computationally intensive (I think). Might be the
-    bottleneck. I should reevaluate the 'region_key = next()' approach
+    provide a sample ID. Calls are assigned to regions per chromesome with a 
+    binary search over the sorted region starts ('index', the output of 
+    region_index(), is built from tfit_dict if not provided). Calls that do 
+    not land entirely within a region are skipped. If the file was already 
+    read with read_calls(), its output can be passed as 'calls'.
     '''
-    with open(filename, 'r') as f:
-            
-            # Loop over the header lines and print them out
-            line = f.readline().strip('\n')
-            while line[0] == '#':
-                #print(line)
-                line = f.readline().strip('\n')
-
-            # First non-header line
-            line = line.split('\t')
-            chromesome = line[0]
-            start = int(line[1])
-            stop = int(line[2])
-            coverage = 0
-
-            try:
-                region_key = next(
-                    key for key in tfit_dict[chromesome].keys()
-                    if start >= int(key[0]) and stop <= int(key[1])
-                    )
-                val = tuple([start, stop, coverage, sampid])
-                tfit_dict[chromesome][region_key].append(val)
-            except Exception:
-                print("No region found...")     # CHANGE THIS!!!
-
-            # Loop over all the lines in tfit file and compare the to regions 
-            # in dict
-            for line in f:
+    if index is None:
+        index = region_index(tfit_dict)
+    if calls is None:
+        calls = read_calls(filename)
+
+    coverage = 0
+    for chromesome, (call_starts, call_stops) in calls.items():
+        if chromesome not in index or len(index[chromesome][2]) == 0:
+            continue
+        starts, stops, keys = index[chromesome]
+        positions = np.stack([call_starts, call_stops], axis=1)
+
+        # The only candidate region (merged regions don't overlap) is the last 
+        # one starting at or before the call
+        idx = np.searchsorted(starts, positions[:, 0], side='right') - 1
+        found = (idx >= 0) & (stops[np.maximum(idx, 0)] >= positions[:, 1])
+
+        # If regions do overlap (user supplied merge file), an earlier region 
+        # may still contain the call. Fall back to scanning for those calls.
+        reach = np.maximum.accumulate(stops)[np.maximum(idx, 0)]
+        nested = ~found & (idx >= 0) & (reach >= positions[:, 1])
+
+        for (start, stop), i, hit, scan in zip(positions.tolist(), 
+                                                idx.tolist(), 
+                                                found.tolist(), 
+                                                nested.tolist()):
+            if scan:
+                i = next(j for j in range(i + 1) 
+                        if start >= starts[j] and stop <= stops[j])
+            elif not hit:
+                continue
+            val = tuple([start, stop, coverage, sampid])
+            tfit_dict[chromesome][keys[i]].append(val)
 
-                # Read and split non-header lines. Lines should be of the form 
-                # "chr#  start  stop  [parameters]"
-                line = line.strip('\n').split('\t')
-                chromesome = line[0]
-                start = int(line[1])
-                stop = int(line[2])
-                coverage = 0
-        
-                # Find start_stop_key in which the start_stop region in the 
-                # line lands
-                try:
-                    region_key = next(
-                        key for key in tfit_dict[chromesome].keys()
-                        if start >= int(key[0]) and stop <= int(key[1])
-                        )
-                    val = tuple([start, stop, coverage, sampid])
-                    tfit_dict[chromesome][region_key].append(val)
-                except StopIteration:
-                    continue
     return tfit_dict
 
 ###############################################################################
@@ -435,15 +533,17 @@ def tfit_file_reader(filename, sampid, tfit_dict):
 def mu_dict_generator(tfit_filenames, 
                       interest_regions, 
                       sampids = ["sampid_NA"],
-                      verbose = False):
+                      verbose = False,
+                      calls = None):
     '''
     At its core this function calls tfit_dict_initializer() on the interest 
     regions (i.e. the results of bedtools merge) and then loops over a list of 
     sample tfit files, calling tfit_file_reader() on each one and subsequently 
-    appending the results to the output dict 'tfit_dict'.
+    appending the results to the output dict 'tfit_dict'. 'calls' is an 
+    optional dict {filename: read_calls(filename)} of files already read.
 
     TODO: 1) write docstring, 2) incorporate ability to read in actual tfit 
-    model, 3) fix next() issue...
+    model
     '''
     
     assert isinstance(tfit_filenames, (list, tuple)), (
@@ -478,77 +578,106 @@ def mu_dict_generator(tfit_filenames,
     # using "interest_regions" list
     tfit_dict = tfit_dict_initializer(interest_regions)
 
+    # Sorted region boundaries per chromesome, shared by all the tfit files
+    index = region_index(tfit_dict)
+
     # Zip together sample id's with filenames (both strings)
     id_and_files = list(zip(sampids, tfit_filenames))
     
     #Loop over all the filenames in the tfit_filenames list and scan through 
     # each one (tfit_file_reader() is user defined)
     for (sampid, file) in id_and_files:
-        tfit_dict = tfit_file_reader(file, sampid, tfit_dict)
+        tfit_dict = tfit_file_reader(file, sampid, tfit_dict, index=index, 
+                                     calls=(calls or {}).get(file))
     
     return dict(tfit_dict)
 
 ### USED IN LIKELIHOOD_CALCULATOR #############################################
 
-# This function generates the list of y-values at the corresponding x-values 
+# This function generates the array of y-values at the corresponding x-values 
 # for a given distribution
-def prob_list_generator(xvals, params=None, dist="normal", width=1.0):
+def prob_list_generator(xvals, params=None, dist="normal", width=1.0, 
+                        log=False):
     '''
-    This generates the y-values for the distribution of a mu tfit call. This 
-    list should be the same length and order as the xvals list. The values
-    should be normalized to the number of mu calls in that region.
+    This generates the y-values for the distribution of mu tfit calls. 
+    'params' is (start, stop) for a single call or (starts, stops) arrays for 
+    several calls, in which case the output is a 2-D array (calls x bases). 
+    Each row is the same length and order as the xvals array. If log=True, 
+    the natural log of the values is returned instead.
 
-    calls: normal()
+    calls: normal(), log_normal()
     '''
-    if dist == "normal":
-        mu_pos = round((params[1] + params[0]) / 2)
-
-        # sigma = (1/2-bed region) * width_ratio
-        mu_sig = ((params[1] - params[0]) / 2 ) * width    ## THIS IS A KEY FACTOR IN INTERPRETTING TFIT INTERVALS!!
-
-        # evaluate the normal dist at all points in xvals
-        y_i = [normal(x, mu_pos, mu_sig, 1) for x in xvals]
-    elif dist == "uni":
-        y_i = (1 if x >= params[0] and x <= params[1] else 0 for x in xvals)
-    else:
-        raise ValueError("Must specify either 'normal' or 'uni' for 'dist'")
+    xvals = np.asarray(xvals)
+    starts = np.asarray(params[0], dtype=np.float64)[..., None]
+    stops = np.asarray(params[1], dtype=np.float64)[..., None]
+    if starts.ndim == 1:
+        starts, stops = starts[0], stops[0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if dist == "normal":
+            mu_pos = np.round((stops + starts) / 2)
+
+            # sigma = (1/2-bed region) * width_ratio
+            mu_sig = ((stops - starts) / 2 ) * width    ## THIS IS A KEY FACTOR IN INTERPRETTING TFIT INTERVALS!!
+
+            # evaluate the normal dist at all points in xvals
+            if log:
+                y_i = log_normal(xvals, mu_pos, mu_sig, 1)
+            else:
+                y_i = normal(xvals, mu_pos, mu_sig, 1)
+        elif dist == "uni":
+            y_i = ((xvals >= starts) & (xvals <= stops)).astype(np.float64)
+            if log:
+                y_i = np.log(y_i)
+        else:
+            raise ValueError("Must specify either 'normal' or 'uni' for 'dist'")
     return y_i
 
 ###############################################################################
 # THIS IS ONE OF THE TWO FUNCTIONS I'M USING TO AVOID SOME LOGICAL CHECKS IN 
 # THE PROB_CALCULATOR()
-def prob_product(sample_prob_list):
+def prob_product(sample_prob_list, log=False):
     '''
-    This just calculates the product of a list of probabilty lists
+    This just calculates the product of a list (or 2-D array, one row per 
+    sample) of probabilty arrays. Rows are multiplied in order. If log=True, 
+    the inputs are log probabilities and are summed instead.
     '''
     #joint_prob_id = "Joint_Prob"
-    joint_prob_list = [prod(i) for i in zip(*sample_prob_list)]
+    if log:
+        return np.add.reduce(np.asarray(sample_prob_list), axis=0)
+    joint_prob_list = np.multiply.reduce(np.asarray(sample_prob_list), axis=0)
     return joint_prob_list
 
 
 # THIS IS ONE OF THE TWO FUNCTIONS I'M USING TO AVOID SOME LOGICAL CHECKS IN 
 # THE PROB_CALCULATOR()
-def prob_sum(sample_prob_list):
+def prob_sum(sample_prob_list, log=False):
     '''
-    This calculates the sum of a list of probability lists
+    This calculates the sum of a list (or 2-D array, one row per sample) of 
+    probability arrays. Rows are added in order. If log=True, the inputs are 
+    log probabilities and the log of the sum is returned.
     '''
     #joint_prob_id = "Cummulative_Prob"
-    joint_prob_list = [sum(i) for i in zip(*sample_prob_list)]
+    if log:
+        return np.logaddexp.reduce(np.asarray(sample_prob_list), axis=0)
+    joint_prob_list = np.add.reduce(np.asarray(sample_prob_list), axis=0)
     return joint_prob_list
 
 ###############################################################################
-# This function generates lists of probabilities values from the tfit_dict 
+# This function generates arrays of probabilities values from the tfit_dict 
 # (mu, sig)
-def prob_list_formatter(region, mu_list, dist="normal", width=1.0):
+def prob_list_formatter(region, mu_list, dist="normal", width=1.0, log=False):
     '''
     DOCSTRING
     This function sort of supplants the mu_viz_prep() function I wrote in the
-    jupyter notebook
-    calls: prob_list_generator()?
+    jupyter notebook. Returns a dict {'sampID': array} with the summed 
+    distributions of each sample's calls over the bases of the region (log 
+    probabilities if log=True).
+    calls: prob_list_generator()
     TODO: Rewrite docstring
     '''
     # Define base position values in the region
-    xvals = [x for x in  range(region[0], region[1])]
+    xvals = np.arange(region[0], region[1])
 
     # Unzip the input mu_list. mu_list should be list of tuples of format 
     # (start, stop, cov, 'sampID')
@@ -558,32 +687,33 @@ def prob_list_formatter(region, mu_list, dist="normal", width=1.0):
     except TypeError:
         print(("'mu_list' is not of the right format -- list of tuples" 
               "(start, stop, cov, 'sampID')"))
-
-    # Intermediate dict, to grop together all the values for each sample
-    region_dict = defaultdict(list)
-    region_dict = {sample : [] for sample in samp_list}
-
-    # Loop over all the mu in the initial mu_list input and generate a y_i 
-    # array for either normal or uni distributions
-    for mu in mu_list:
-        values = prob_list_generator(xvals, mu, dist=dist, width=width)
-        id = mu[3]
-        region_dict[id].append(values)
-
-    # Collapse all the lists for each sample into a single probability list
-    for id, probs in region_dict.items():
-        region_dict[id] = prob_sum(probs)
-
-    return dict(region_dict)
+    starts = np.array(starts)
+    stops = np.array(stops)
+    samples = np.array(samples)
+
+    # Generate a 2-D array (calls x bases) of either normal or uni 
+    # distributions for each sample's calls and collapse it into a single 
+    # probability array
+    region_dict = {}
+    for sample in samp_list:
+        calls = samples == sample
+        values = prob_list_generator(xvals, 
+                                    (starts[calls], stops[calls]), 
+                                    dist=dist, 
+                                    width=width, 
+                                    log=log)
+        region_dict[sample] = prob_sum(values, log=log)
+
+    return region_dict
 
 ###############################################################################
 # This function calculates joint/cummulative probabilties for two or more 
-# equal length lists of probabilty data
-def combined_prob_calculator(sample_prob_dict, groups=None):
+# equal length arrays of probabilty data
+def combined_prob_calculator(sample_prob_dict, groups=None, log=False):
     '''
     This calculates the combined probability by taking the product WITHIN 
     groups and sum BETWEEN groups. This assumes that each of the probability 
-    lists contained in sample_prob_dict have been properly normalized. 
+    arrays contained in sample_prob_dict have been properly normalized. 
     
     'sample_prob_dict' of the form {'sampID': [y_1, ..., y_i]} where y_i are
     probability values for positions x_i
@@ -592,28 +722,27 @@ def combined_prob_calculator(sample_prob_dict, groups=None):
     where each element is a string corresponding to the sampleID for that 
     particular sample.
 
+    If log=True, sample_prob_dict holds log probabilities and the log of the 
+    combined probability is returned.
+
     Calls: normalizer()?
     TODO: Update docstring, code review of commented out lines
     NOTE: THE WEIGHTING SCHEME COULD BE ADDED INTO THIS FUNCTION
     '''
     # First, define a uniform dist to be added for samples with no tfit calls
-    list_len = len(list(sample_prob_dict.values())[0])
-    uni_list = [1 / list_len for i in range(list_len)]
+    list_len = len(next(iter(sample_prob_dict.values())))
+    uni_list = np.full(list_len, 1 / list_len)
+    if log:
+        uni_list = np.log(uni_list)
 
     cond_list = []
     for condition in groups:
-        rep_list = []
-        rep_num = len(condition)
-        counter = 0
-        for replicate in condition:
-            if replicate in sample_prob_dict.keys():
-                rep_list.append(sample_prob_dict[replicate])
-            else:
-                rep_list.append(uni_list)
-                counter = counter + 1
-
-        rep_product = prob_product(rep_list)
-        if counter < rep_num:
+        # 2-D array (replicates x bases), one row per replicate
+        rep_list = [sample_prob_dict.get(replicate, uni_list) 
+                    for replicate in condition]
+        
+        if any(replicate in sample_prob_dict for replicate in condition):
+            rep_product = prob_product(rep_list, log=log)
 #            rep_len = len(rep_list)
 #            rep_product = [i ** (1/rep_len) for i in rep_product]
 #            rep_product = normalizer(rep_product, scaler=1, integral=True)
@@ -621,7 +750,9 @@ def combined_prob_calculator(sample_prob_dict, groups=None):
         else:
             continue
     
-    combined_prob = prob_sum(cond_list)
+    if len(cond_list) == 0:
+        return np.zeros(0)
+    combined_prob = prob_sum(cond_list, log=log)
 
     return combined_prob
 
@@ -629,10 +760,10 @@ def combined_prob_calculator(sample_prob_dict, groups=None):
 ## This function locates the positions of the local maxima in a list
 def maxima_loc(samp_list, shift=0):
     '''
-    Input is a list (representing probabilities). Output is a list of indicies
-    where extremum (local maxima) are located, ranked by value. List of tuples
-    of the form [(index, value), ...]. Can be shifted to appropriate region by 
-    setting 'shift' equal to non-zero integer. 
+    Input is an array (representing probabilities). Output is a list of 
+    indicies where extremum (local maxima) are located, ranked by value. List 
+    of tuples of the form [(index, value), ...]. Can be shifted to appropriate 
+    region by setting 'shift' equal to non-zero integer. 
 
     NOTE: I adjusted the inequalities (first one from '>' to '>=') so as to 
     pick up subsequent bases with identical probabilities, *BUT* only counts 
@@ -641,11 +772,12 @@ def maxima_loc(samp_list, shift=0):
     TODO: May want to incorporate some way of determining mu for regions of 
     uniform probability (i.e. flat profiles)
     '''
+    samp_list = np.asarray(samp_list)
+    diffs = np.diff(samp_list)
+    indicies = np.flatnonzero((diffs[:-1] >= 0) & (diffs[1:] < 0)) + 1
     
-    maxima_indicies = [(i+1+shift, val) 
-                       for i, val in enumerate(samp_list[1:-1]) 
-                       if (samp_list[i+1] - samp_list[i]) >= 0
-                       and (samp_list[i+2] - samp_list[i+1]) < 0]
+    maxima_indicies = list(zip((indicies + shift).tolist(), 
+                                samp_list[indicies].tolist()))
     
     return maxima_indicies
 
@@ -755,22 +887,199 @@ def collision_resolver(mu_sig_list):
 ## This function defines the boundaries of the bed region, using the updated
 # sigmas (from sigma_assigner()) and outputs a list of strings formatted as 
 # bedfile regions.
+def bed_region_formatter(mu_sig_list, width=1.0):
+    '''
+    Takes input list of new (mu, sigma) tuples and outputs list of 
+    (start, stop) tuples of the bed regions.
+    '''
+    return [(round(mu[0] - mu[1] / width), round(mu[0] + mu[1] / width)) 
+            for mu in mu_sig_list]
+
+
 def bed_line_formatter(chromosome, mu_sig_list, width=1.0):
     '''
     Takes input list of new (mu, sigma) tuples and outputs list of strings 
     formatted as bedfile lines.
     '''
     bed_lines = []
-    for mu in mu_sig_list:
-        start = str(round(mu[0] - mu[1] / width))
-        stop = str(round(mu[0] + mu[1] / width))
-        bed_lines.append("\t".join([chromosome, start, stop]) + "\n")
+    for start, stop in bed_region_formatter(mu_sig_list, width=width):
+        bed_lines.append("\t".join([chromosome, str(start), str(stop)]) + "\n")
 #        avg = str(round((int(start) + int(stop)) / 2))
 #        bed_lines.append("\t".join([chromosome, start, stop, avg]) + "\n")
 
     return bed_lines
 
 
+###############################################################################
+## This function runs the merge (probability profiles, maxima, sigmas and 
+# collisions) over every region of one chromesome. Chromesomes are independent
+# so this is the unit of work handed to the worker processes.
+def chromosome_merger(item, num_samps=1, groupings=None, width=1.0):
+    '''
+    Takes a tuple ('chr#', {(start, stop): [(mu_start, mu_stop, cov, 'ID'), 
+    ...]}) for a single chromesome of the tfit_dict and returns a tuple of 
+    (chromesome, [(start, stop), ...], miscall lines), with the regions 
+    processed in sorted order.
+    '''
+    chromosome, regions = item
+    bed_regions = []
+    miscalls = []
+    for region in sorted(regions.keys()):
+
+        # Select Tfit calls for one region
+        mu_list = regions[region]
+
+        # Calculate average number of tfit calls per sample (rounds up)
+        avg_num_mu = math.ceil(len(mu_list) / num_samps) + 1    ## I'M JUST TESTING HOW THIS IMPACTS THE DELTA MU TEST (THE +1)
+
+        # Generate prob dict (func of base pos) for region of tfit calls
+        sample_prob_dict = prob_list_formatter(region, 
+                                                mu_list, 
+                                                dist="normal",
+                                                width=width) #CHECK!!!
+
+        # Calculate combined probability array (function of base position),
+        # from 'groups' and the probability lists in sample_prob_dict() 
+        comb_prob = combined_prob_calculator(sample_prob_dict, 
+                                                groups=groupings) #FIX!!!
+
+        # Locate local maxima (shifted to range of 'region')
+        potential_mu = maxima_loc(comb_prob, shift=region[0]) #CHECK!!!
+
+        # Products of distant calls can underflow to zero and leave no maxima.
+        # Redo those regions with log probabilities (same maxima, no underflow)
+        if len(potential_mu) == 0 and np.any(comb_prob == 0):
+            sample_prob_dict = prob_list_formatter(region, 
+                                                    mu_list, 
+                                                    dist="normal",
+                                                    width=width, 
+                                                    log=True)
+            comb_prob = combined_prob_calculator(sample_prob_dict, 
+                                                    groups=groupings, 
+                                                    log=True)
+            potential_mu = maxima_loc(comb_prob, shift=region[0])
+
+        # Determine which updated mu locations to keep
+        new_mu = mu_ranker(potential_mu, avg_num_mu) #MISSING!!!!
+
+        # If new_mu is empty, log in 'miscalls' and skip to next region
+        if len(new_mu) == 0:
+            miscalls.append("\n" + "\t".join([str(chromosome), 
+                                                str(region[0]), 
+                                                str(region[1]), 
+                                                str(mu_list)]))
+            continue
+
+        # Extract (mu, sig) tuples for region from compiled tfit_dict
+        old_mu_sig = mu_sig_extract(mu_list, width=width) #DONE!!!
+
+        # Calculate updated sigma values for each updated mu location
+        new_mu_sig = sigma_assigner(new_mu, old_mu_sig) #DONE!!!
+
+        # Address collisions between updated (mu, sig) in the same region
+        final_mu_sig = collision_resolver(new_mu_sig) #CHECK!!!
+
+        # Convert final (mu, sig) to bed regions
+        bed_regions.extend(bed_region_formatter(
+            final_mu_sig, 
+            width=width
+        )) #DONE!!!
+
+    return chromosome, bed_regions, miscalls
+
+###############################################################################
+## This function runs chromosome_merger() over every chromesome of the 
+# tfit_dict, in parallel if 'processes' > 1
+def merge_chromosomes(tfit_dict, num_samps=1, groupings=None, width=1.0, 
+                      processes=1):
+    '''
+    Generator yielding the (chromesome, regions, miscall lines) output of 
+    chromosome_merger() for each chromesome of the tfit_dict, in sorted 
+    chromesome order. Chromesomes are merged by the TFEA multiprocess module 
+    using 'processes' worker processes (its persistent pool if running).
+    '''
+    chromosomes = sorted(tfit_dict.items())
+    if processes > 1:
+        results = multiprocess.main(function=chromosome_merger, 
+                                    args=chromosomes, 
+                                    kwargs=dict(num_samps=num_samps, 
+                                                groupings=groupings, 
+                                                width=width), 
+                                    cpus=max(1, min(processes, 
+                                                    len(chromosomes))))
+        yield from sorted(results, key=operator.itemgetter(0))
+    else:
+        merger = partial(chromosome_merger, 
+                        num_samps=num_samps, 
+                        groupings=groupings, 
+                        width=width)
+        yield from map(merger, chromosomes)
+
+###############################################################################
+## This function is the library entry point, merging sample bedfiles in-process
+# without the input file, log and intermediate bedfiles of the main script
+def run(beds, groups, sampids=None, merged=None, width=1.0, processes=1, 
+        calls=None):
+    '''
+    Runs muMerge on a list of sample bedfiles and returns the merged regions.
+
+    'beds' is a list of bedfiles (i.e. tfit calls) and 'groups' the group 
+    (condition) of each one. If 'sampids' is not specified, samples are named 
+    by their group and their (1-based) order within it. 'merged' is a list of 
+    tuples [('chr#', start, stop), ...] of the regions over which to combine 
+    the samples; by default the merge of all calls (merge_regions()). 
+    'calls' is a dict {bedfile: read_calls(bedfile)} shared between runs over 
+    the same bedfiles. Bedfiles missing from it are read and added to it.
+
+    Returns a structured array with fields 'chrom', 'start' and 'stop', 
+    sorted by chromesome.
+    '''
+    if sampids is None:
+        counts = Counter()
+        sampids = []
+        for group in groups:
+            counts[group] += 1
+            sampids.append("{}{}".format(group, counts[group]))
+
+    if calls is None:
+        calls = {}
+    for bed in beds:
+        if bed not in calls:
+            calls[bed] = read_calls(bed)
+
+    if merged is None:
+        merged = merge_regions([calls[bed] for bed in beds])
+
+    tfit_dict = mu_dict_generator(list(beds), 
+                                merged, 
+                                sampids=list(sampids), 
+                                calls=calls)
+
+    chroms = []
+    starts = []
+    stops = []
+    for chromosome, regions, miscalls in merge_chromosomes(
+                                        tfit_dict, 
+                                        num_samps=len(beds), 
+                                        groupings=groupings_builder(sampids, 
+                                                                    groups), 
+                                        width=width, 
+                                        processes=processes):
+        chroms.extend([chromosome] * len(regions))
+        starts.extend(region[0] for region in regions)
+        stops.extend(region[1] for region in regions)
+
+    chroms = np.array(chroms, dtype=str)
+    regions = np.zeros(len(chroms), dtype=[('chrom', chroms.dtype), 
+                                            ('start', np.int64), 
+                                            ('stop', np.int64)])
+    regions['chrom'] = chroms
+    regions['start'] = starts
+    regions['stop'] = stops
+
+    return regions
+
+
 ###############################################################################
 ## MAIN
 ###############################################################################
@@ -784,137 +1093,97 @@ What do I have to do?
     6) Gotta fix the input parser and unpacking to be more flexible...
 '''
 
-# Start timing
-start = time.time()
-
-## Arg parse, define variables (bedfiles, sampids, groups), generate merged bed
-inputs = inputs_processor() # TEST!!!
-tfit_filenames = inputs['bedfiles']
-sampids = inputs['sampids']
-groupings = inputs['groupings']
-union_bedfile = inputs['merged']
-outfilename = inputs['output']
-verbose = inputs['verbose']
-weights = inputs['weights']
-width_ratio = inputs['width_ratio']
-
-num_samps = len(tfit_filenames)
-
-## Define output files and open 'log' file 'miscall' files
-outbedfile = outfilename + "_MUMERGE.bed"
-logfile = open(outfilename + '.log', 'w')
-miscallfilename = outfilename + '_MISCALLS.bed'
-miscallfile = open(miscallfilename, 'w')
-
-## Writes the initial, summary data in the miscalls and log files
-log_initializer(tfit_filenames, groupings, miscallfile, logfile)
-
-if verbose:
-    sys.stdout.write("\nGenerating 'bedtools merge' bedfile...\n")
-## Load merged bedfile
-merge_regions = bedfile_reader(union_bedfile,
-                            bedGraph=False,
-                            print_header=False,
-                            count=False)
-if verbose:
-    sys.stdout.write("Building Tfit-regions dictionary...\n")
-## Generate tfit dictionary, of form 
-# {'chr#': {(reg_start,reg_stop): [(mu_start,mu_stop,cov,'sampID'), ...]}}
-tfit_dict = mu_dict_generator(list(tfit_filenames),
-                            merge_regions,
-                            sampids = list(sampids),
-                            verbose = verbose)
-
-# Count up the total number of regions (to be logged and printed out)
-total = 0
-for region_list in tfit_dict.values():
-    total += len(region_list)
-logfile.write("\nTotal number of bedfile regions: {}\n".format(total))
-
-# Check to make sure no regions are empty, then generate distribution of tfit
-# calls. Write to log file.
-call_num = []
-for chrome, region in tfit_dict.items():
-    for interval, calls in region.items():
-        call_num.append(len(calls))
-call_hist = Counter(call_num)
-del(call_num)
-logfile.write("\nDistribution of number of Tfit calls for a sample, within a "
-    "region, across all samples (#calls: #instances):\n{}\n"
-    .format(dict(call_hist)))
-
-count = 1
-with open(outbedfile, 'w') as output:
-        
-    ## Loop over every region in the tfit_dict (key1 = 'chr#', key2 = region)
-    for chromosome in sorted(tfit_dict.keys()):
-        for region in sorted(tfit_dict[chromosome].keys()):
-            
+if __name__ == '__main__':
+
+    # Start timing
+    start = time.time()
+
+    ## Arg parse, define variables (bedfiles, sampids, groups), generate merged bed
+    inputs = inputs_processor() # TEST!!!
+    tfit_filenames = inputs['bedfiles']
+    sampids = inputs['sampids']
+    groupings = inputs['groupings']
+    union_bedfile = inputs['merged']
+    outfilename = inputs['output']
+    verbose = inputs['verbose']
+    weights = inputs['weights']
+    width_ratio = inputs['width_ratio']
+    processes = inputs['processes']
+
+    num_samps = len(tfit_filenames)
+
+    ## Define output files and open 'log' file 'miscall' files
+    outbedfile = outfilename + "_MUMERGE.bed"
+    logfile = open(outfilename + '.log', 'w')
+    miscallfilename = outfilename + '_MISCALLS.bed'
+    miscallfile = open(miscallfilename, 'w')
+
+    ## Writes the initial, summary data in the miscalls and log files
+    log_initializer(tfit_filenames, groupings, miscallfile, logfile)
+
+    ## Read the calls of all samples once
+    sample_calls = {f: read_calls(f) for f in tfit_filenames}
+
+    if verbose:
+        sys.stdout.write("\nGenerating 'bedtools merge' bedfile...\n")
+    if inputs['merge']:
+        write_bed(merge_regions(list(sample_calls.values())), union_bedfile)
+    ## Load merged bedfile
+    interest_regions = bedfile_reader(union_bedfile,
+                                bedGraph=False,
+                                print_header=False,
+                                count=False)
+    if verbose:
+        sys.stdout.write("Building Tfit-regions dictionary...\n")
+    ## Generate tfit dictionary, of form 
+    # {'chr#': {(reg_start,reg_stop): [(mu_start,mu_stop,cov,'sampID'), ...]}}
+    tfit_dict = mu_dict_generator(list(tfit_filenames),
+                                interest_regions,
+                                sampids = list(sampids),
+                                verbose = verbose,
+                                calls = sample_calls)
+
+    # Count up the total number of regions (to be logged and printed out)
+    total = 0
+    for region_list in tfit_dict.values():
+        total += len(region_list)
+    logfile.write("\nTotal number of bedfile regions: {}\n".format(total))
+
+    # Check to make sure no regions are empty, then generate distribution of tfit
+    # calls. Write to log file.
+    call_num = []
+    for chrome, region in tfit_dict.items():
+        for interval, calls in region.items():
+            call_num.append(len(calls))
+    call_hist = Counter(call_num)
+    del(call_num)
+    logfile.write("\nDistribution of number of Tfit calls for a sample, within a "
+        "region, across all samples (#calls: #instances):\n{}\n"
+        .format(dict(call_hist)))
+
+    ## Merge each chromesome in a worker process, writing the results to the 
+    # output in sorted chromesome order
+    count = 0
+    with open(outbedfile, 'w') as output:
+        for chromosome, regions, miscalls in merge_chromosomes(
+                                                tfit_dict, 
+                                                num_samps=num_samps, 
+                                                groupings=groupings, 
+                                                width=width_ratio, 
+                                                processes=processes):
+            output.writelines("\t".join([chromosome, str(start), str(stop)]) 
+                                + "\n" for start, stop in regions)
+            miscallfile.writelines(miscalls)
+
             # Status counter and update at stdout
             if verbose:
+                count += len(tfit_dict[chromosome])
                 sys.stdout.write("\rProcessed {} of {} regions"
                                    .format(count, total))
-                count += 1
-
-            # Select Tfit calls for one region
-            mu_list = tfit_dict[chromosome][region]
-#            print(chromosome, region, (region[0]+region[1])/2, mu_list)
-
-            # Calculate average number of tfit calls per sample (rounds up)
-            avg_num_mu = math.ceil(len(mu_list) / num_samps) + 1    ## I'M JUST TESTING HOW THIS IMPACTS THE DELTA MU TEST (THE +1)
-
-            # Generate prob dict (func of base pos) for region of tfit calls
-            sample_prob_dict = prob_list_formatter(region, 
-                                                    mu_list, 
-                                                    dist="normal",
-                                                    width=width_ratio) #CHECK!!!
-
-            # Calculate combined probability array (function of base position),
-            # from 'groups' and the probability lists in sample_prob_dict() 
-            comb_prob = combined_prob_calculator(sample_prob_dict, 
-                                                    groups=groupings) #FIX!!!
-
-            # Locate local maxima (shifted to range of 'region')
-            potential_mu = maxima_loc(comb_prob, shift=region[0]) #CHECK!!!
-            
-
-            # Determine which updated mu locations to keep
-            new_mu = mu_ranker(potential_mu, avg_num_mu) #MISSING!!!!
-
-            # If new_mu is empty, log in 'miscalls' and skip to next region
-            if len(new_mu) == 0:
-                miscallfile.write("\n")
-                miscallfile.write("\t".join([str(chromosome), 
-                                            str(region[0]), 
-                                            str(region[1]), 
-                                            str(mu_list)]))
-                continue
-
-            # Extract (mu, sig) tuples for region from compiled tfit_dict
-            old_mu_sig = mu_sig_extract(mu_list, width=width_ratio) #DONE!!!
-#            print(new_mu, "LEN(OLD):", len(old_mu_sig), chromosome, region)
-
-            # Calculate updated sigma values for each updated mu location
-            new_mu_sig = sigma_assigner(new_mu, old_mu_sig) #DONE!!!
-
-            # Address collisions between updated (mu, sig) in the same region
-            final_mu_sig = collision_resolver(new_mu_sig) #CHECK!!!
-
-            # Convert final (mu, sig) to bed line format and write to output
-            bedlines = bed_line_formatter(
-                chromosome, 
-                final_mu_sig, 
-                width=width_ratio
-            ) #DONE!!!
-            
-            # Write updated bedlines to output file
-            for line in bedlines:
-                output.write(line)
 
-sys.stdout.write("\n")
-end = time.time()
+    sys.stdout.write("\n")
+    end = time.time()
 
-logfile.write("\nRun time: {} sec\n".format(end - start))
-logfile.close()
-miscallfile.close()
-sys.exit(0)
\ No newline at end of file
+    logfile.write("\nRun time: {} sec\n".format(end - start))
+    logfile.close()
+    miscallfile.close()
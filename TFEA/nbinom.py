@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains an in-process negative binomial test for differential
+    counts between two conditions, modelled on the DESeq2 procedure, for use
+    with --rank nb in place of running DESeq2 through Rscript. All steps are
+    vectorized over regions:
+        1. median-of-ratios size factors
+        2. region-wise dispersion estimates maximizing the Cox-Reid adjusted
+            likelihood
+        3. a parametric (a0 + a1/mean) dispersion trend fit with a gamma GLM
+        4. maximum a posteriori dispersions shrunk towards the trend
+        5. a negative binomial GLM fit (~ batch + condition) and Wald test of
+            the condition coefficient
+    Results are written in the format of the DESeq2 results table written by
+    the R script in the RANK module, so they can be parsed in the same way.
+    They are an approximation of DESeq2 and differ from it where: 
+        - the prior variance of dispersions is always estimated with the
+            trigamma approximation, which DESeq2 replaces by simulation with
+            few residual degrees of freedom (i.e. 2 vs 2 samples with a batch)
+        - independent filtering and Cook's distance outlier cutoffs are not
+            applied to p-values
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import sys
+
+import numpy as np
+from scipy import stats
+from scipy.special import gammaln, polygamma
+
+from TFEA import exceptions
+
+#Constants
+#==============================================================================
+MIN_DISP = 1e-8
+#Fitted means below this value are raised to it while fitting (as in DESeq2)
+MIN_MU = 0.5
+#Ridge penalty on natural log coefficients (DESeq2 uses 1e-6 on log2 scale)
+RIDGE = 1e-6/np.log(2)**2
+GLM_MAXIT = 100
+GLM_TOL = 1e-8
+#Number of log-dispersion values per level of the grid search, and levels
+GRID_SIZE = 20
+GRID_LEVELS = 3
+#Dispersions further than this many SDs above the trend are not shrunk
+OUTLIER_SD = 2
+#Number of regions for which to search dispersions at once
+BLOCKSIZE = 10000
+
+#Main Script
+#==============================================================================
+def write_results(count_file=None, count_matrix=None, conditions=None,
+                    batch='', res_file=None):
+    '''Tests each region of a count file for differential counts between two
+        conditions and writes a DESeq2-formatted results table.
+
+    Parameters
+    ----------
+    count_file : pathlib.Path
+        full path to a count file with a header line, containing the chrom,
+        start, stop, region name and counts for each sample
+    count_matrix : pathlib.Path
+        full path to the count matrix (.npy) saved alongside count_file. If it
+        does not exist, counts are read from count_file
+    conditions : list
+        0 for each sample of condition 1 and 1 for each sample of condition 2
+    batch : str
+        comma-separated batch of each sample. Empty if there are no batches
+    res_file : pathlib.Path
+        full path to the results table to write
+
+    Returns
+    -------
+    res_file : pathlib.Path
+        full path to the results table
+    '''
+    names = list()
+    with open(count_file) as F:
+        F.readline()
+        for line in F:
+            names.append(line.split('\t', 4)[3])
+    if count_matrix is not None and count_matrix.exists():
+        counts = np.load(count_matrix)
+    else:
+        counts = np.loadtxt(count_file, skiprows=1, ndmin=2,
+                            usecols=range(4, 4 + len(conditions)))
+
+    batch = [x.strip().strip('"\'') for x in batch.split(',')] if batch else None
+    results = nbinom_test(counts=counts, conditions=conditions, batch=batch)
+
+    columns = ['baseMean', 'log2FoldChange', 'lfcSE', 'fc', 'stat', 'pvalue',
+                'padj']
+    with open(res_file, 'w') as outfile:
+        outfile.write('\t'.join(f'"{column}"' for column in columns) + '\n')
+        outfile.writelines(f'"{name}"\t'
+                            + '\t'.join('NA' if np.isnan(value)
+                                        else format(value, '.15g')
+                                        for value in row) + '\n'
+                            for name, row in zip(names, np.column_stack(
+                                    [results[column] for column in columns])))
+
+    return res_file
+
+#Functions
+#==============================================================================
+def nbinom_test(counts=None, conditions=None, batch=None):
+    '''Tests each region (row) of a count matrix for differential counts
+        between two conditions.
+
+    Parameters
+    ----------
+    counts : array
+        (regions x samples) count matrix. Values are rounded to integers
+    conditions : list
+        0 for each sample of condition 1 and 1 for each sample of condition 2
+    batch : list or None
+        the batch of each sample
+
+    Returns
+    -------
+    results : dict
+        baseMean, log2FoldChange (condition 2 over 1), lfcSE, fc, stat,
+        pvalue and padj arrays, NaN for regions without counts. Also
+        sizeFactors and dispersion
+    '''
+    counts = np.round(np.asarray(counts, dtype=np.float64))
+    sf = size_factors(counts=counts)
+    X = design_matrix(conditions=conditions, batch=batch)
+    samples, coefficients = X.shape
+    base_mean = (counts/sf).mean(axis=1)
+    nonzero = counts.sum(axis=1) > 0
+    y = counts[nonzero]
+
+    #Without residual degrees of freedom, dispersions are estimated blind to
+    # the design (as with DESeq method="blind")
+    X_disp = X if samples > coefficients else np.ones((samples, 1))
+    max_disp = max(10, samples)
+    disp_gene, mu = gene_dispersions(counts=y, sf=sf, X=X_disp,
+                                        max_disp=max_disp)
+    disp_fit = fit_trend(means=base_mean[nonzero], disps=disp_gene)
+
+    #Shrink region-wise dispersions towards the trend
+    above_min = disp_gene >= 100*MIN_DISP
+    residuals = np.log(disp_gene[above_min]) - np.log(disp_fit[above_min])
+    #Normal-consistent median absolute deviation, as in R's mad
+    var_log_disp = ((1.4826*np.median(np.abs(residuals
+                                            - np.median(residuals))))**2
+                    if len(residuals) > 0 else 0.0)
+    df = samples - X_disp.shape[1]
+    prior_var = max(var_log_disp - polygamma(1, df/2.0), 0.25)
+    disp_map = dispersion_grid(counts=y, mu=mu, X=X_disp, max_disp=max_disp,
+                                prior_mean=np.log(disp_fit),
+                                prior_var=prior_var)
+    outliers = (np.log(disp_gene) > np.log(disp_fit)
+                                    + OUTLIER_SD*np.sqrt(var_log_disp))
+    dispersion = np.clip(np.where(outliers, disp_gene, disp_map), MIN_DISP,
+                            max_disp)
+
+    beta, _, sigma = fit_glm(counts=y, sf=sf, X=X, alpha=dispersion)
+    log2fc = beta[:, -1]/np.log(2)
+    lfcse = np.sqrt(sigma[:, -1, -1])/np.log(2)
+    stat = log2fc/lfcse
+    pvalue = 2*stats.norm.sf(np.abs(stat))
+
+    results = dict(baseMean=base_mean, sizeFactors=sf)
+    for name, values in [('log2FoldChange', log2fc), ('lfcSE', lfcse),
+                            ('fc', 2**log2fc), ('stat', stat),
+                            ('pvalue', pvalue), ('dispersion', dispersion)]:
+        results[name] = np.full(len(counts), np.nan)
+        results[name][nonzero] = values
+    results['padj'] = adjust_pvalues(pvalues=results['pvalue'])
+
+    return results
+
+#==============================================================================
+def size_factors(counts=None):
+    '''Median-of-ratios size factors: the median ratio of each sample's counts
+        to the geometric mean counts of each region, over regions with no
+        zero counts
+
+    Raises
+    ------
+    InputError
+        If every region has a zero count in at least one sample
+    '''
+    with np.errstate(divide='ignore'):
+        log_counts = np.log(counts)
+    log_means = log_counts.mean(axis=1)
+    usable = np.isfinite(log_means)
+    if not np.any(usable):
+        raise exceptions.InputError(("Every region has a zero count in at "
+                                        "least one sample. Size factors "
+                                        "cannot be estimated."))
+
+    return np.exp(np.median(log_counts[usable] - log_means[usable, np.newaxis],
+                            axis=0))
+
+#==============================================================================
+def design_matrix(conditions=None, batch=None):
+    '''Returns the (samples x coefficients) design matrix of ~ batch +
+        condition: an intercept, one column for each batch but the first
+        (sorted) and the condition last
+
+    Raises
+    ------
+    InputError
+        If the batches are confounded with the conditions
+    '''
+    columns = [np.ones(len(conditions))]
+    if batch:
+        if len(batch) != len(conditions):
+            raise exceptions.InputError(("BATCH must contain one value per "
+                                            "sample."))
+        for level in sorted(set(batch))[1:]:
+            columns.append((np.array(batch) == level).astype(np.float64))
+    columns.append(np.asarray(conditions, dtype=np.float64))
+    X = np.column_stack(columns)
+    if np.linalg.matrix_rank(X) < X.shape[1]:
+        raise exceptions.InputError(("The design matrix is not full rank. "
+                                        "BATCH may be confounded with the "
+                                        "conditions."))
+
+    return X
+
+#==============================================================================
+def log_likelihood(counts=None, mu=None, alpha=None):
+    '''Negative binomial log likelihood summed over the last axis
+    '''
+    size = 1/alpha
+
+    return np.sum(gammaln(counts + size) - gammaln(size) - gammaln(counts + 1)
+                    + size*np.log(size/(size + mu))
+                    + counts*np.log(mu/(size + mu)), axis=-1)
+
+#==============================================================================
+def weighted_crossproduct(X=None, weights=None):
+    '''Returns X^T W X for each row of weights (diagonal of W)
+    '''
+    return np.einsum('ij,...i,ik->...jk', X, weights, X)
+
+#==============================================================================
+def fit_glm(counts=None, sf=None, X=None, alpha=None):
+    '''Fits a negative binomial GLM with a log link to each region by
+        iteratively reweighted least squares
+
+    Parameters
+    ----------
+    counts : array
+        (regions x samples) counts
+    sf : array
+        size factor of each sample
+    X : array
+        (samples x coefficients) design matrix
+    alpha : array
+        dispersion of each region
+
+    Returns
+    -------
+    beta : array
+        (regions x coefficients) natural log coefficients
+    mu : array
+        (regions x samples) fitted means
+    sigma : array
+        (regions x coefficients x coefficients) covariance of beta
+    '''
+    log_sf = np.log(sf)
+    ridge = RIDGE*np.eye(X.shape[1])
+    alpha = np.asarray(alpha)[:, np.newaxis]
+    beta = np.linalg.lstsq(X, np.log(counts/sf + 0.1).T, rcond=None)[0].T
+    deviance = np.full(len(counts), np.inf)
+    for _ in range(GLM_MAXIT):
+        mu = np.maximum(np.exp(beta @ X.T + log_sf), MIN_MU)
+        weights = mu/(1 + alpha*mu)
+        z = np.log(mu) - log_sf + (counts - mu)/mu
+        beta = np.linalg.solve(weighted_crossproduct(X=X, weights=weights)
+                                + ridge, np.einsum('ij,gi->gj', X,
+                                                    weights*z)[..., np.newaxis]
+                                )[..., 0]
+        mu = np.maximum(np.exp(beta @ X.T + log_sf), MIN_MU)
+        new_deviance = -2*log_likelihood(counts=counts, mu=mu, alpha=alpha)
+        converged = (np.abs(new_deviance - deviance)
+                        /(np.abs(new_deviance) + 0.1) < GLM_TOL)
+        deviance = new_deviance
+        if np.all(converged):
+            break
+
+    xtwx = weighted_crossproduct(X=X, weights=mu/(1 + alpha*mu))
+    inverse = np.linalg.inv(xtwx + ridge)
+
+    return beta, mu, inverse @ xtwx @ inverse
+
+#==============================================================================
+def linear_mu(normalized=None, X=None):
+    '''Fitted values of a least squares fit of X to each row of normalized
+    '''
+    hat = X @ np.linalg.inv(X.T @ X) @ X.T
+
+    return normalized @ hat.T
+
+#==============================================================================
+def gene_dispersions(counts=None, sf=None, X=None, max_disp=None):
+    '''Estimates the dispersion of each region by maximizing the Cox-Reid
+        adjusted likelihood given fitted means. Means come from a least
+        squares fit of the normalized counts when every sample belongs to a
+        distinct group of the design, and otherwise from a GLM fit using a
+        rough method of moments dispersion.
+
+    Returns
+    -------
+    disp_gene : array
+        the dispersion of each region
+    mu : array
+        (regions x samples) fitted means
+    '''
+    samples, coefficients = X.shape
+    normalized = counts/sf
+    if samples > coefficients:
+        mu = np.maximum(linear_mu(normalized=normalized, X=X), 1)
+        rough = np.maximum(np.sum(((normalized - mu)**2 - mu)/mu**2, axis=1)
+                            /(samples - coefficients), 0)
+    else:
+        rough = np.full(len(counts), np.inf)
+    means = normalized.mean(axis=1)
+    moments = ((normalized.var(axis=1, ddof=1) - np.mean(1/sf)*means)
+                /means**2)
+    alpha = np.clip(np.minimum(rough, moments), MIN_DISP, max_disp)
+
+    if len(np.unique(X, axis=0)) == coefficients:
+        mu = np.maximum(linear_mu(normalized=normalized, X=X)*sf, MIN_MU)
+    else:
+        _, mu, _ = fit_glm(counts=counts, sf=sf, X=X, alpha=alpha)
+
+    disp_gene = dispersion_grid(counts=counts, mu=mu, X=X, max_disp=max_disp)
+
+    return np.clip(disp_gene, MIN_DISP, max_disp), mu
+
+#==============================================================================
+def dispersion_grid(counts=None, mu=None, X=None, max_disp=None,
+                    prior_mean=None, prior_var=None, blocksize=BLOCKSIZE):
+    '''Maximizes the Cox-Reid adjusted log likelihood (plus a normal prior on
+        the log dispersion if prior_mean is given) of each region over a grid
+        of log dispersions, refining the grid around the maximum GRID_LEVELS
+        times
+
+    Returns
+    -------
+    dispersions : array
+        the dispersion of each region
+    '''
+    dispersions = np.zeros(len(counts))
+    for start in range(0, len(counts), blocksize):
+        block = slice(start, start + blocksize)
+        y = counts[block][:, np.newaxis, :]
+        block_mu = mu[block][:, np.newaxis, :]
+        lower = np.full(len(y), np.log(MIN_DISP))
+        upper = np.full(len(y), np.log(max_disp))
+        for _ in range(GRID_LEVELS):
+            grid = np.linspace(lower, upper, GRID_SIZE, axis=1)
+            alpha = np.exp(grid)[..., np.newaxis]
+            weights = block_mu/(1 + alpha*block_mu)
+            objective = (log_likelihood(counts=y, mu=block_mu, alpha=alpha)
+                        - 0.5*np.linalg.slogdet(weighted_crossproduct(
+                                                X=X, weights=weights))[1])
+            if prior_mean is not None:
+                objective -= ((grid - prior_mean[block][:, np.newaxis])**2
+                                /(2*prior_var))
+            best = grid[np.arange(len(y)), np.argmax(objective, axis=1)]
+            step = (upper - lower)/(GRID_SIZE - 1)
+            lower, upper = best - step, best + step
+        dispersions[block] = np.exp(best)
+
+    return dispersions
+
+#==============================================================================
+def fit_trend(means=None, disps=None):
+    '''Fits the dispersion trend a0 + a1/mean with a gamma-family GLM
+        (identity link), iteratively excluding regions far from the trend. If
+        the fit fails, the (trimmed) mean dispersion is used.
+
+    Returns
+    -------
+    disp_fit : array
+        the trend dispersion of each region
+    '''
+    all_means = means
+    use = disps > 100*MIN_DISP
+    means = means[use]
+    disps_used = disps[use]
+    coefficients = np.array([0.1, 1.0])
+    try:
+        for _ in range(10):
+            residuals = disps_used/(coefficients[0] + coefficients[1]/means)
+            good = (residuals > 1e-4) & (residuals < 15)
+            old = coefficients
+            coefficients = gamma_identity_glm(
+                            X=np.column_stack([np.ones(good.sum()),
+                                                1/means[good]]),
+                            y=disps_used[good], start=coefficients)
+            if not np.all(coefficients > 0):
+                raise ValueError("Dispersion trend coefficients not positive.")
+            if np.sum(np.log(coefficients/old)**2) < 1e-6:
+                break
+        else:
+            raise ValueError("Dispersion trend fit did not converge.")
+    except (ValueError, np.linalg.LinAlgError) as error:
+        print(f"\t{error} Using the mean dispersion.", file=sys.stderr)
+        trimmed = stats.trim_mean(disps_used, 0.001) if len(disps_used) else 0.1
+
+        return np.full(len(disps), trimmed)
+
+    return coefficients[0] + coefficients[1]/all_means
+
+#==============================================================================
+def gamma_identity_glm(X=None, y=None, start=None, maxit=25, tol=1e-8):
+    '''Fits a gamma-family GLM with an identity link by iteratively
+        reweighted least squares, as R's glm(family=Gamma(link="identity"))
+    '''
+    coefficients = start
+    deviance = np.inf
+    for _ in range(maxit):
+        fitted = X @ coefficients
+        if np.any(fitted <= 0):
+            raise ValueError("Dispersion trend fit is not positive.")
+        weights = 1/fitted**2
+        coefficients = np.linalg.solve(X.T @ (X*weights[:, np.newaxis]),
+                                        X.T @ (weights*y))
+        fitted = X @ coefficients
+        if np.any(fitted <= 0):
+            raise ValueError("Dispersion trend fit is not positive.")
+        new_deviance = 2*np.sum((y - fitted)/fitted - np.log(y/fitted))
+        if abs(new_deviance - deviance)/(abs(new_deviance) + 0.1) < tol:
+            break
+        deviance = new_deviance
+
+    return coefficients
+
+#==============================================================================
+def adjust_pvalues(pvalues=None):
+    '''Benjamini-Hochberg adjusted p-values, ignoring NaN
+    '''
+    padj = np.full(len(pvalues), np.nan)
+    tested = np.flatnonzero(~np.isnan(pvalues))
+    order = tested[np.argsort(pvalues[tested])]
+    adjusted = pvalues[order]*len(order)/np.arange(1, len(order) + 1)
+    padj[order] = np.minimum(np.minimum.accumulate(adjusted[::-1])[::-1], 1)
+
+    return padj
@@ -30,13 +30,14 @@ from matplotlib.ticker import FormatStrFormatter
 import subprocess
 import warnings
 import pathlib
-import ujson
-from statistics import mean, median
+from statistics import median
 
 import numpy as np
 from scipy import stats
 
 from TFEA import exceptions
+from TFEA import ranked_table
+from TFEA import motif_database
 
 ## GC Decorator
 import gc
@@ -144,53 +145,53 @@ def plot_individual_graphs(use_config=True, distances=None, figuredir=None,
     #Initiate meta plots
     if type(meta_profile_dict) == pathlib.PosixPath: #or type(meta_profile_dict) == dict and len(meta_profile_dict) != 0:
         
-        q1posprofile1 = [ujson.loads((meta_profile_dict / f'q1posprofile1_{i}').read_text()) for i in q1_meta_retain]
-        q1posprofile1 = [x for x in map(mean, zip(*q1posprofile1))]
+        q1posprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q1posprofile1', retain=q1_meta_retain)
         
-        q1negprofile1 = [ujson.loads((meta_profile_dict / f'q1negprofile1_{i}').read_text()) for i in q1_meta_retain]
-        q1negprofile1 = [x for x in map(mean, zip(*q1negprofile1))]
+        q1negprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q1negprofile1', retain=q1_meta_retain)
         
-        q1posprofile2 = [ujson.loads((meta_profile_dict / f'q1posprofile2_{i}').read_text()) for i in q1_meta_retain]
-        q1posprofile2 = [x for x in map(mean, zip(*q1posprofile2))]
+        q1posprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q1posprofile2', retain=q1_meta_retain)
         
-        q1negprofile2 = [ujson.loads((meta_profile_dict / f'q1negprofile2_{i}').read_text()) for i in q1_meta_retain]
-        q1negprofile2 = [x for x in map(mean, zip(*q1negprofile2))]
+        q1negprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q1negprofile2', retain=q1_meta_retain)
         
-        q2posprofile1 = [ujson.loads((meta_profile_dict / f'q2posprofile1_{i}').read_text()) for i in q2_meta_retain]
-        q2posprofile1 = [x for x in map(mean, zip(*q2posprofile1))]
+        q2posprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q2posprofile1', retain=q2_meta_retain)
         
-        q2negprofile1 = [ujson.loads((meta_profile_dict / f'q2negprofile1_{i}').read_text()) for i in q2_meta_retain]
-        q2negprofile1 = [x for x in map(mean, zip(*q2negprofile1))]
+        q2negprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q2negprofile1', retain=q2_meta_retain)
         
-        q2posprofile2 = [ujson.loads((meta_profile_dict / f'q2posprofile2_{i}').read_text()) for i in q2_meta_retain]
-        q2posprofile2 = [x for x in map(mean, zip(*q2posprofile2))]
+        q2posprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q2posprofile2', retain=q2_meta_retain)
         
-        q2negprofile2 = [ujson.loads((meta_profile_dict / f'q2negprofile2_{i}').read_text()) for i in q2_meta_retain]
-        q2negprofile2 = [x for x in map(mean, zip(*q2negprofile2))]
+        q2negprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q2negprofile2', retain=q2_meta_retain)
         
-        q3posprofile1 = [ujson.loads((meta_profile_dict / f'q3posprofile1_{i}').read_text()) for i in q3_meta_retain]
-        q3posprofile1 = [x for x in map(mean, zip(*q3posprofile1))]
+        q3posprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q3posprofile1', retain=q3_meta_retain)
         
-        q3negprofile1 = [ujson.loads((meta_profile_dict / f'q3negprofile1_{i}').read_text()) for i in q3_meta_retain]
-        q3negprofile1 = [x for x in map(mean, zip(*q3negprofile1))]
+        q3negprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q3negprofile1', retain=q3_meta_retain)
         
-        q3posprofile2 = [ujson.loads((meta_profile_dict / f'q3posprofile2_{i}').read_text()) for i in q3_meta_retain]
-        q3posprofile2 = [x for x in map(mean, zip(*q3posprofile2))]
+        q3posprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q3posprofile2', retain=q3_meta_retain)
         
-        q3negprofile2 = [ujson.loads((meta_profile_dict / f'q3negprofile2_{i}').read_text()) for i in q3_meta_retain]
-        q3negprofile2 = [x for x in map(mean, zip(*q3negprofile2))]
+        q3negprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q3negprofile2', retain=q3_meta_retain)
         
-        q4posprofile1 = [ujson.loads((meta_profile_dict / f'q4posprofile1_{i}').read_text()) for i in q4_meta_retain]
-        q4posprofile1 = [x for x in map(mean, zip(*q4posprofile1))]
+        q4posprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q4posprofile1', retain=q4_meta_retain)
         
-        q4negprofile1 = [ujson.loads((meta_profile_dict / f'q4negprofile1_{i}').read_text()) for i in q4_meta_retain]
-        q4negprofile1 = [x for x in map(mean, zip(*q4negprofile1))]
+        q4negprofile1 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q4negprofile1', retain=q4_meta_retain)
         
-        q4posprofile2 = [ujson.loads((meta_profile_dict / f'q4posprofile2_{i}').read_text()) for i in q4_meta_retain]
-        q4posprofile2 = [x for x in map(mean, zip(*q4posprofile2))]
+        q4posprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q4posprofile2', retain=q4_meta_retain)
         
-        q4negprofile2 = [ujson.loads((meta_profile_dict / f'q4negprofile2_{i}').read_text()) for i in q4_meta_retain]
-        q4negprofile2 = [x for x in map(mean, zip(*q4negprofile2))]
+        q4negprofile2 = meta_profile_mean(folder=meta_profile_dict, 
+                                        key='q4negprofile2', retain=q4_meta_retain)
         # #UJSON
         # meta_profile_dict = ujson.loads(meta_profile_dict.read_text())
         
@@ -612,8 +613,16 @@ def plot_global_gc(results, p_cutoff=None, title=None, xlabel=None,
 #==============================================================================
 @force_gc
 def meme_logo(motif_file, motif_ID, figuredir, plot_format=None):
-    '''Runs meme2images that creates logo images
+    '''Runs meme2images that creates logo images. meme2images is given a
+        single-motif database written from the parsed motif_file rather than
+        reading all of motif_file for each motif.
     '''
+    database = motif_database.load(motifdatabase=motif_file)
+    single_motif_file = None
+    if motif_ID in database:
+        single_motif_file = database.write_motif(motif_ID, 
+                    figuredir / ('.' + motif_ID.replace('.', '_') + '.meme'))
+        motif_file = single_motif_file
     meme2images_command = ['meme2images', '-rc', '-eps', '-motif', motif_ID, 
                             motif_file, figuredir]
     motif_ID = motif_ID.replace('.', '_')
@@ -627,8 +636,50 @@ def meme_logo(motif_file, motif_ID, figuredir, plot_format=None):
         subprocess.check_output(imagemagick_rc_command, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
         print(e.stderr.decode(), flush=True, file=sys.stdout)
+    finally:
+        if single_motif_file is not None:
+            os.remove(single_motif_file)
     return
 
+#==============================================================================
+_meta_profiles = dict()
+
+def meta_profile_mean(folder=None, key=None, retain=None):
+    '''Returns the mean meta-profile of a subset of regions within a 
+        quartile. Profiles are memory-mapped once per process from the 
+        float32 .npy files written by rank.meta_profile_quartiles, and the 
+        precomputed sum over all regions is used when no region is excluded.
+
+    Parameters
+    ----------
+    folder : pathlib.Path
+        full path to the meta-profile folder
+    key : str
+        the quartile, strand and condition of the profiles (i.e. 
+        'q1posprofile1')
+    retain : list
+        indexes of the regions (rows) within the quartile to average
+
+    Returns
+    -------
+    profile : list
+        the mean profile, or an empty list if retain is empty
+    '''
+    path = folder / f'{key}.npy'
+    stat = os.stat(path)
+    identity = (stat.st_ino, stat.st_size)
+    if str(path) not in _meta_profiles or _meta_profiles[str(path)][0] != identity:
+        _meta_profiles[str(path)] = (identity, np.load(path, mmap_mode='r'), 
+                                        np.load(folder / f'{key}.sum.npy'))
+    _, profiles, sums = _meta_profiles[str(path)]
+
+    if len(retain) == 0:
+        return []
+    if len(retain) == len(profiles):
+        return (sums/len(profiles)).tolist()
+
+    return profiles[retain].mean(axis=0, dtype=np.float64).tolist()
+
 #==============================================================================
 @force_gc
 def metaplot(posprofile1, negprofile1, posprofile2, negprofile2, ax=None, 
@@ -798,7 +849,7 @@ def fillplot(ax=None, xvals=None, yvals=None, xlimits=None, ylimits=None):
 #==============================================================================
 @force_gc
 def plot_deseq_MA(deseq_file=None, label1=None, label2=None, figuredir=None, 
-                    dpi=100, basemean_cut=0, plot_format=None):
+                    dpi=100, basemean_cut=0, plot_format=None, results=None):
     '''Plots the DE-Seq MA-plot using the full regions of interest and saves it
     to the figuredir directory created in TFEA output folder
 
@@ -816,42 +867,29 @@ def plot_deseq_MA(deseq_file=None, label1=None, label2=None, figuredir=None,
     figuredir : string
         full path to figure directory in output directory (created by TFEA)
 
+    results : dict
+        the deseq file already parsed by ranked_table.read_deseq. If None, 
+        deseqfile is parsed
+
     Returns
     -------
     None
     '''
-    up_x = list()
-    up_y = list()
-    up_p = list()
-    dn_x = list()
-    dn_y = list()
-    dn_p = list()
-    with open(deseq_file,'r') as F:
-        header = F.readline().strip('\n').split('\t')
-        basemean_index = header.index('"baseMean"')
-        log2fc_index = header.index('"log2FoldChange"')
-        for line in F:
-            line = line.strip('\n').split('\t')
-            try:
-                log2fc = float(line[log2fc_index+1])
-                basemean = math.log(float(line[basemean_index+1]),10)
-                pval = float(line[-2])
-                if log2fc > 0:
-                    up_x.append(basemean)
-                    up_y.append(log2fc)
-                    up_p.append(pval)
-                else:
-                    dn_x.append(basemean)
-                    dn_y.append(log2fc)
-                    dn_p.append(pval)
-            except:
-                pass
-
-    x = [x for _,x in sorted(zip(up_p,up_x))] \
-        + [x for _,x in sorted(zip(dn_p,dn_x),reverse=True)]
-
-    y = [y for _,y in sorted(zip(up_p,up_y))] \
-        + [y for _,y in sorted(zip(dn_p,dn_y),reverse=True)]
+    if results is None:
+        results = ranked_table.read_deseq(deseq_file=deseq_file)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        basemean = np.log10(results['baseMean'])
+    log2fc = results['log2FoldChange']
+    pval = results['pvalue']
+    valid = np.isfinite(basemean) & ~np.isnan(log2fc) & ~np.isnan(pval)
+    up = valid & (log2fc > 0)
+    dn = valid & ~(log2fc > 0)
+
+    #Up regions by increasing and down regions by decreasing p-value
+    x = np.concatenate([basemean[up][np.lexsort((basemean[up], pval[up]))], 
+                basemean[dn][np.lexsort((basemean[dn], pval[dn]))][::-1]])
+    y = np.concatenate([log2fc[up][np.lexsort((log2fc[up], pval[up]))], 
+                log2fc[dn][np.lexsort((log2fc[dn], pval[dn]))][::-1]])
 
     c = np.linspace(0, 1, len(x))
 
@@ -150,11 +150,18 @@ def read_arguments():
                                     'mergeall', 'tfitclean', 
                                     'tfitremovesmall'], dest='COMBINE')
     module_switches.add_argument('--rank', help=("Method for ranking combined "
-                                    "bed file"), choices=['deseq', 'fc', False], 
+                                    "bed file. 'nb' performs an approximate "
+                                    "negative binomial test in-process "
+                                    "without R. It is modelled on DESeq2 but "
+                                    "its results are not validated against "
+                                    "DESeq2. Default: deseq"), 
+                                    choices=['deseq', 'fc', 'nb', False], 
                                     dest='RANK')
     module_switches.add_argument('--scanner', help=("Method for scanning fasta "
-                                    "files for motifs. Default: fimo"), 
-                                    choices=['fimo', 'genome hits'], 
+                                    "files for motifs. 'pwm' scans all motifs "
+                                    "in-process without calling fimo. "
+                                    "Default: fimo"), 
+                                    choices=['fimo', 'pwm', 'genome hits'], 
                                     dest='SCANNER')
     module_switches.add_argument('--enrichment', help=("Method for calculating "
                                     "enrichment. Default: auc"), choices=['auc', 
@@ -167,14 +174,27 @@ def read_arguments():
                                     "calling FIMO motif hits. Default: 1e-6"), 
                                     dest='FIMO_THRESH')
     scanner_options.add_argument('--fimo_background', help=("Options for "
-                                    "choosing mononucleotide background "
-                                    "distribution to use with FIMO. Default: largewindow"
+                                    "choosing the background distribution to "
+                                    "use with the fimo and pwm scanners. "
+                                    "Default: largewindow "
                                     "{'largewindow', 'smallwindow', int, file}"),
                                     dest='FIMO_BACKGROUND')
     scanner_options.add_argument('--genomehits', help=("A folder containing "
                                     "bed files with pre-calculated motif hits "
                                     "to a genome. For use with 'genome hits' "
                                     "scanner option."), dest='GENOMEHITS')
+    scanner_options.add_argument('--scan-cache', help=("A folder in which to "
+                                    "cache motif distances so that re-running "
+                                    "TFEA on the same regions does not rescan "
+                                    "motifs. May be shared between projects. "
+                                    "For use with 'fimo' and 'pwm' scanner "
+                                    "options. Default: False"), 
+                                    dest='SCAN_CACHE')
+    scanner_options.add_argument('--scan-cache-size', help=("Maximum size of "
+                                    "the scan cache in gigabytes. Least "
+                                    "recently used motif distances are removed "
+                                    "beyond this size. Default: 10"), 
+                                    dest='SCAN_CACHE_SIZE')
     scanner_options.add_argument('--singlemotif', help=("Option to run "
                                     "analysis on a subset of motifs within "
                                     "specified motif database or genome hits. "
@@ -188,6 +208,13 @@ def read_arguments():
                                         "permutations to perfrom for "
                                         "calculating p-value. Default: 1000"), 
                                         dest='PERMUTATIONS')
+    enrichment_options.add_argument('--null', help=("Method for obtaining the "
+                                        "null distribution of the E-score. "
+                                        "'analytic' computes its exact mean "
+                                        "and variance, 'permutation' "
+                                        "simulates it. Default: permutation"), 
+                                        choices=['permutation', 'analytic'], 
+                                        dest='NULL')
     enrichment_options.add_argument('--largewindow', help=("The size (bp) of a "
                                         "large window around input regions "
                                         "that captures background. Default: "
@@ -249,6 +276,13 @@ def read_arguments():
                                 "corresponding to motifs. Motif name must "
                                 "be in the 4th column and match what is in "
                                 "the database."), dest='MOTIF_ANNOTATIONS')
+    misc_options.add_argument('--coverage-cache', help=("A folder in which to "
+                                "cache the coverage of bam or bedGraph files "
+                                "so that they are only read once. May be "
+                                "shared between projects or prepared with "
+                                "'TFEA build-coverage'. Default: a folder "
+                                "within the temp directory"), 
+                                dest='COVERAGE_CACHE')
     misc_options.add_argument('--bootstrap', help=("Amount to subsample motif"
                                 "hits to. Set to False to turn off."
                                 " Default: False"), dest='BOOTSTRAP')
@@ -333,7 +367,10 @@ def read_arguments():
                     'FIMO_BACKGROUND': ['largewindow', [int, str]], 
                     'SINGLEMOTIF': [False, [bool, str]], 
                     'GENOMEHITS': [False, [Path, bool]],
+                    'SCAN_CACHE': [False, [Path, bool]],
+                    'SCAN_CACHE_SIZE': [10.0, [float]],
                     'PERMUTATIONS': [1000, [int]], 
+                    'NULL': ['permutation', [str]],
                     'LARGEWINDOW': [1500, [int]], 
                     'SMALLWINDOW': [150, [int]], 
                     'PADJCUTOFF': [0.1, [float]], 
@@ -346,6 +383,7 @@ def read_arguments():
                     'BOOTSTRAP': [False, [int, bool]],
                     'VENV': ['.',[Path]],
                     'MOTIF_ANNOTATIONS': [False, [Path, bool]],
+                    'COVERAGE_CACHE': [False, [Path, bool]],
                     'BASEMEAN_CUT': [0, [int]],
                     'RERUN': [False, ['PosixList', bool]],
                     'GC': [True, [bool]],
@@ -557,8 +595,8 @@ def verify_arguments(parser=None):
 
     #Verify rank module
     if not config.vars['RANK']:
-        if not config.vars['RANKED_FILE'] and not config.vars['FASTA_FILE'] and config.vars['SCANNER'] == 'fimo':
-            raise exceptions.InputError('SCANNER module set to "fimo" but RANK module switched off without RANKED_FILE or FASTA_FILE')
+        if not config.vars['RANKED_FILE'] and not config.vars['FASTA_FILE'] and config.vars['SCANNER'] in ['fimo', 'pwm']:
+            raise exceptions.InputError(f'SCANNER module set to "{config.vars["SCANNER"]}" but RANK module switched off without RANKED_FILE or FASTA_FILE')
         if config.vars['MDD']:
             if not config.vars['MDD_BEDFILE1'] and not config.vars['MDD_FASTA1']:
                 raise exceptions.InputError('RANK module switched off but MDD module switched on without MDD_BEDFILE1 or MDD_FASTA1')
@@ -575,8 +613,8 @@ def verify_arguments(parser=None):
     #Verify scanner module
     if not config.vars['GENOMEHITS'] and config.vars['SCANNER'] == 'genome hits':
         raise exceptions.InputError('SCANNER set to "genome hits" without specifying GENOMEHITS')
-    if not config.vars['FIMO_MOTIFS'] and config.vars['SCANNER'] == 'fimo':
-        raise exceptions.InputError('SCANNER set to "fimo" without specifying FIMO_MOTIFS')
+    if not config.vars['FIMO_MOTIFS'] and config.vars['SCANNER'] in ['fimo', 'pwm']:
+        raise exceptions.InputError(f'SCANNER set to "{config.vars["SCANNER"]}" without specifying FIMO_MOTIFS')
 
     if not config.vars['FASTA_FILE'] and not config.vars['GENOMEFASTA']:
         raise exceptions.InputError('User inputs require GENOMEFASTA')
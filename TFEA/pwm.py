@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains an in-process position weight matrix (PWM) scanner
+    that can be used in place of FIMO within the SCANNER module. The motif
+    database and fasta file are each read once per process, sequences are
+    encoded as uint8 arrays and all windows are scored with vectorized
+    log-odds lookups. Motif hits are called using p-values from the exact
+    score distribution of each (integer scaled) PSSM, following FIMO.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import exceptions
+from TFEA import genome_fasta
+from TFEA import motif_database
+
+#Constants
+#==============================================================================
+ALPHABET = 'ACGT'
+#Integer range of scaled PSSM scores used to compute p-values (as in MEME)
+PSSM_RANGE = 1000
+#Pseudocount added to motif counts, weighted by the background (FIMO default)
+MOTIF_PSEUDO = 0.1
+#nsites assumed for motifs that do not specify it (MEME default)
+DEFAULT_NSITES = 20
+#Score given to any window containing a non-ACGT base or sequence boundary
+INVALID_SCORE = -10**7
+#Number of bases scored at once
+CHUNK_SIZE = 2**22
+
+#Main Script
+#==============================================================================
+def scan(motif, fasta_file=None, motifdatabase=None, background=None,
+            thresh=None, largewindow=None):
+    '''Scans all sequences within a fasta file for a single motif and returns
+        the distance of the best scoring hit to the center of each sequence.
+        This is a drop-in replacement for scanner.fimo.
+
+    Parameters
+    ----------
+    motif : str
+        the name of a motif within motifdatabase
+    fasta_file : str
+        full path to a fasta file or sequence file (.seq) to scan
+    motifdatabase : str
+        full path to a MEME formatted (.meme) motif database
+    background : list or None
+        A, C, G, T background frequencies. If None, the background within
+        motifdatabase is used
+    thresh : float
+        p-value threshold for calling motif hits
+    largewindow : int
+        half-length of each sequence. Distances are relative to this position
+
+    Returns
+    -------
+    motif : str
+        the name of the motif
+    distances : array
+        float32 array with the distance of the best hit within each sequence
+        or NaN if there was no hit
+    '''
+    names, codes, offsets = read_fasta(fastafile=fasta_file)
+    database = motif_database.load(motifdatabase=motifdatabase)
+    if motif not in database:
+        raise exceptions.InputError(f"Motif not found in {motifdatabase}: {motif}")
+    if background is None:
+        background = database.background
+    background = np.asarray(background, dtype=np.float64)
+    background = background/np.sum(background)
+
+    probabilities = database.pssm(motif)
+    nsites = database.nsites[database.index[motif]]
+    scores = log_odds(probabilities=probabilities, background=background,
+                        nsites=nsites)
+    scaled, threshold = pvalue_threshold(scores=scores,
+                                            background=background,
+                                            thresh=thresh)
+    distances = best_hit_distances(codes=codes, offsets=offsets,
+                                    scores=scores, scaled=scaled,
+                                    threshold=threshold,
+                                    largewindow=largewindow)
+
+    return [motif, distances]
+
+#Functions
+#==============================================================================
+def read_meme(motifdatabase=None):
+    '''Parses a MEME formatted motif database. The parsed database is shared
+        with other modules through motif_database.load.
+
+    Parameters
+    ----------
+    motifdatabase : str
+        full path to a MEME formatted (.meme) motif database
+
+    Returns
+    -------
+    motifs : dict
+        motif name -> (probabilities, nsites) where probabilities is a
+        (width x 4) array of A, C, G, T probabilities
+    background : array
+        A, C, G, T background frequencies within the database (uniform if not
+        specified)
+    '''
+    database = motif_database.load(motifdatabase=motifdatabase)
+    motifs = {motif: (database.pssm(motif), nsites) for motif, nsites
+                in zip(database.names, database.nsites.tolist())}
+
+    return motifs, database.background
+
+#==============================================================================
+def read_background(bgfile=None):
+    '''Reads 0-order A, C, G, T frequencies from a MEME markov background
+        file (i.e. the output of fasta-get-markov)
+    '''
+    frequencies = dict()
+    with open(bgfile) as F:
+        for line in F:
+            values = line.split()
+            if len(values) == 2 and values[0].upper() in ALPHABET:
+                frequencies[values[0].upper()] = float(values[1])
+
+    return np.array([frequencies[base] for base in ALPHABET])
+
+#==============================================================================
+def fasta_background(fastafile=None):
+    '''Calculates 0-order A, C, G, T frequencies from the sequences within a
+        fasta file.
+    '''
+    _, codes, _ = read_fasta(fastafile=fastafile)
+
+    return frequencies(codes=codes)
+
+#==============================================================================
+def frequencies(codes=None):
+    '''Calculates 0-order A, C, G, T frequencies of encoded sequences
+    '''
+    counts = np.bincount(codes, minlength=5)[:4].astype(np.float64)
+
+    return counts/np.sum(counts)
+
+#==============================================================================
+_fasta = dict()
+
+def read_fasta(fastafile=None):
+    '''Reads a fasta file and encodes all sequences into a single uint8 array
+        (A=0, C=1, G=2, T=3, other=4) with a separator between sequences.
+        Sequence files written by genome_fasta (.seq) are also accepted.
+        Results are cached per process.
+
+    Parameters
+    ----------
+    fastafile : str
+        full path to a fasta file or sequence file
+
+    Returns
+    -------
+    names : list
+        the name of each sequence
+    codes : array
+        uint8 array of encoded sequences, each followed by a separator (4)
+    offsets : array
+        int64 array with the start of each sequence within codes and the
+        total length as the last value
+    '''
+    key = str(fastafile)
+    if key in _fasta:
+        return _fasta[key]
+
+    if Path(fastafile).suffix == genome_fasta.SUFFIX:
+        buffer, offsets = genome_fasta.read_sequences(path=fastafile)
+        names = [f'region{i}' for i in range(len(offsets) - 1)]
+        _fasta[key] = (names, encode(buffer), offsets)
+
+        return _fasta[key]
+
+    names = list()
+    sequences = list()
+    sequence = list()
+    with open(fastafile, 'rb') as F:
+        for line in F:
+            if line[:1] == b'>':
+                if names:
+                    sequences.append(b''.join(sequence))
+                names.append(line[1:].decode().strip('\n'))
+                sequence = list()
+            else:
+                sequence.append(line.strip())
+    if names:
+        sequences.append(b''.join(sequence))
+
+    lengths = np.array([len(s) + 1 for s in sequences], dtype=np.int64)
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    codes = encode(b'\x00'.join(sequences) + b'\x00')
+
+    _fasta[key] = (names, codes, offsets)
+
+    return _fasta[key]
+
+#==============================================================================
+def encode(sequence):
+    '''Encodes a bytes DNA sequence as a uint8 array (A=0, C=1, G=2, T=3,
+        other=4)
+    '''
+    table = np.full(256, 4, dtype=np.uint8)
+    for i, base in enumerate(ALPHABET):
+        table[ord(base)] = i
+        table[ord(base.lower())] = i
+
+    return table[np.frombuffer(sequence, dtype=np.uint8)]
+
+#==============================================================================
+def log_odds(probabilities=None, background=None, nsites=DEFAULT_NSITES,
+                pseudocount=MOTIF_PSEUDO):
+    '''Converts a letter-probability matrix into a log2-odds PSSM, adding a
+        background-weighted pseudocount to motif counts as FIMO does.
+
+    Parameters
+    ----------
+    probabilities : array
+        (width x 4) array of A, C, G, T probabilities
+    background : array
+        A, C, G, T background frequencies
+    nsites : float
+        the number of sites the motif was built from
+
+    Returns
+    -------
+    scores : array
+        (width x 4) array of log2-odds scores
+    '''
+    probabilities = ((probabilities*nsites + pseudocount*background)
+                        / (nsites + pseudocount))
+
+    return np.log2(probabilities/background)
+
+#==============================================================================
+def pvalue_threshold(scores=None, background=None, thresh=None,
+                        score_range=PSSM_RANGE):
+    '''Scales a PSSM to integers and computes the exact distribution of
+        window scores under a 0-order background. Returns the minimum scaled
+        score whose p-value (probability of a score at least as high) is
+        below thresh.
+
+    Parameters
+    ----------
+    scores : array
+        (width x 4) array of log2-odds scores
+    background : array
+        A, C, G, T background frequencies
+    thresh : float
+        p-value threshold
+
+    Returns
+    -------
+    scaled : array
+        (width x 4) int array of scaled scores
+    threshold : int
+        the minimum scaled window score that is a motif hit
+    '''
+    small = np.min(scores)
+    large = np.max(scores)
+    scale = np.floor(score_range/(large - small)) if large > small else 1.0
+    scaled = np.round((scores - small)*scale).astype(np.int64)
+
+    #Distribution of the sum of scaled scores, one motif position at a time
+    distribution = np.ones(1)
+    for row in scaled:
+        new_distribution = np.zeros(len(distribution) + np.max(row))
+        for base in range(4):
+            new_distribution[row[base]:row[base] + len(distribution)] += \
+                                        distribution*background[base]
+        distribution = new_distribution
+
+    pvalues = np.cumsum(distribution[::-1])[::-1]
+    hits = np.flatnonzero(pvalues < thresh)
+    threshold = hits[0] if len(hits) > 0 else len(pvalues)
+
+    return scaled, int(threshold)
+
+#==============================================================================
+def window_scores(codes=None, matrix=None):
+    '''Scores every window within an encoded sequence using a (width x 5)
+        lookup matrix (the 5th column scoring non-ACGT bases)
+    '''
+    width = len(matrix)
+    n = len(codes) - width + 1
+    if n <= 0:
+        return np.zeros(0, dtype=matrix.dtype)
+    scores = np.zeros(n, dtype=matrix.dtype)
+    for j in range(width):
+        scores += matrix[j][codes[j:j + n]]
+
+    return scores
+
+#==============================================================================
+def best_hit_distances(codes=None, offsets=None, scores=None, scaled=None,
+                        threshold=None, largewindow=None):
+    '''Scans both strands of all encoded sequences and returns the distance
+        of the highest scoring hit within each sequence. Ties are broken by
+        the earliest position and then the + strand, as in FIMO output.
+
+    Parameters
+    ----------
+    codes : array
+        output of read_fasta
+    offsets : array
+        output of read_fasta
+    scores : array
+        (width x 4) array of log2-odds scores
+    scaled : array
+        (width x 4) int array of scaled scores
+    threshold : int
+        the minimum scaled window score that is a motif hit
+    largewindow : int
+        half-length of each sequence
+
+    Returns
+    -------
+    distances : array
+        float32 array of hit distances relative to the center of each
+        sequence, NaN if no hit
+    '''
+    width = len(scores)
+    invalid = np.full((width, 1), INVALID_SCORE)
+    strands = list()
+    for strand, (raw, integer) in enumerate([(scores, scaled),
+                                    (scores[::-1, ::-1], scaled[::-1, ::-1])]):
+        strands.append((strand, np.hstack([raw, invalid]).astype(np.float64),
+                        np.hstack([integer, invalid]).astype(np.int32)))
+
+    positions = list()
+    hit_scores = list()
+    hit_strands = list()
+    for start in range(0, len(codes), CHUNK_SIZE):
+        chunk = codes[start:start + CHUNK_SIZE + width - 1]
+        for strand, raw, integer in strands:
+            windows = np.flatnonzero(window_scores(codes=chunk,
+                                                    matrix=integer) >= threshold)
+            if len(windows) == 0:
+                continue
+            raw_scores = np.zeros(len(windows))
+            for j in range(width):
+                raw_scores += raw[j][chunk[windows + j]]
+            positions.append(windows + start)
+            hit_scores.append(raw_scores)
+            hit_strands.append(np.full(len(windows), strand))
+
+    distances = np.full(len(offsets) - 1, np.nan, dtype=np.float32)
+    if len(positions) == 0:
+        return distances
+    positions = np.concatenate(positions)
+    hit_scores = np.concatenate(hit_scores)
+    hit_strands = np.concatenate(hit_strands)
+
+    #Keep the best hit within each sequence
+    sequence = np.searchsorted(offsets, positions, side='right') - 1
+    order = np.lexsort((hit_strands, positions, -hit_scores, sequence))
+    sequence = sequence[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sequence[1:] != sequence[:-1]
+    best = order[first]
+
+    #FIMO coordinates are 1-based, distance is from the center of the hit
+    start = positions[best] - offsets[sequence[first]] + 1
+    stop = start + width - 1
+    distances[sequence[first]] = (start + stop)/2.0 - largewindow
+
+    return distances
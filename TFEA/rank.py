@@ -19,19 +19,25 @@ import os
 import sys
 import time
 import datetime
+import tempfile
 import subprocess
-import warnings
-import ujson
 from pathlib import Path
 from multiprocessing import Manager
 
 from pybedtools import BedTool
-import HTSeq as hts
 import numpy as np
 
+from TFEA import coverage
 from TFEA import exceptions
 from TFEA import multiprocess
+from TFEA import nbinom
 from TFEA import plot
+from TFEA import ranked_table
+
+#Constants
+#==============================================================================
+#Number of regions for which to compute meta-profiles at once
+PROFILE_BLOCKSIZE = 1024
 
 #Main Script
 #==============================================================================
@@ -39,7 +45,8 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
             bam1=None, bam2=None, tempdir=None, label1=None, label2=None, 
             largewindow=None, mdd=False, mdd_bedfile1=False, mdd_bedfile2=False, 
             motif_annotations=False, debug=False, jobid=None, figuredir=None, 
-            output_type=None, basemean_cut=None, plot_format=None):
+            output_type=None, basemean_cut=None, plot_format=None, cpus=1, 
+            coverage_cache=False):
     '''This is the main script of the RANK module which takes as input a
         count file and bam files and ranks the regions within the count file
         according to a user specified 
@@ -76,6 +83,12 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
         bed files
     mdd : boolean
         a switch which determines whether to create bed files for mdd analysis
+    cpus : int
+        the number of processes to use when counting reads
+    coverage_cache : pathlib.Path or boolean
+        Full path to a folder in which to cache the coverage of bam or 
+        bedGraph files (see the coverage module). If False, the coverage is 
+        cached within tempdir
 
     Returns
     -------
@@ -115,39 +128,51 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
         motif_annotations = config.vars['MOTIF_ANNOTATIONS']
         debug = config.vars['DEBUG']
         jobid = config.vars['JOBID']
+        cpus = config.vars['CPUS']
         output_type = config.vars['OUTPUT_TYPE']
         basemean_cut = config.vars['BASEMEAN_CUT']
         plot_format = config.vars['PLOT_FORMAT']
         meta_profile_dict = {}
         metaprofile = config.vars['METAPROFILE']
         batch = config.vars['BATCH']
+        coverage_cache = config.vars['COVERAGE_CACHE']
     print("Ranking regions...", flush=True, file=sys.stderr)
+    cachedir = coverage_cache if coverage_cache else tempdir / 'coverage'
 
     #Begin by counting reads from bam files over the combined_file produced
     # by the combine module
     if bam1 and bam2:
         count_file = count_reads(bedfile=combined_file, bam1=bam1, bam2=bam2, 
-                            tempdir=tempdir, label1=label1, label2=label2)
+                            tempdir=tempdir, label1=label1, label2=label2, 
+                            cachedir=cachedir, debug=debug, jobid=jobid, 
+                            cpus=cpus)
         sample_number = len(bam1+bam2)
     elif bg1 and bg2:
         count_file = count_reads_bedtools(bedfile=combined_file, bg1=bg1, 
                                         bg2=bg2, tempdir=tempdir, label1=label1, 
-                                        label2=label2)
+                                        label2=label2, cachedir=cachedir, 
+                                        debug=debug, jobid=jobid, cpus=cpus)
         sample_number = len(bg1+bg2)
-    millions_mapped = sum_reads(count_file=count_file, sample_number=sample_number)
+    millions_mapped = sum_reads(count_file=count_file, 
+                                sample_number=sample_number, 
+                                count_matrix=tempdir / "count_file.npy")
     if motif_annotations:
         if bam1 and bam2:
             motif_fpkm = motif_count_reads(bedfile=motif_annotations, 
                                             bam1=bam1, bam2=bam2, 
                                             tempdir=tempdir, 
                                             label1=label1, label2=label2, 
-                                            millions_mapped=millions_mapped)
+                                            millions_mapped=millions_mapped, 
+                                            cachedir=cachedir, debug=debug, 
+                                            jobid=jobid, cpus=cpus)
         elif bg1 and bg2:
             motif_fpkm = motif_count_reads_bg(bedfile=motif_annotations, 
                                             bg1=bg1, bg2=bg2, 
                                             tempdir=tempdir, 
                                             label1=label1, label2=label2, 
-                                            millions_mapped=millions_mapped)
+                                            millions_mapped=millions_mapped, 
+                                            cachedir=cachedir, debug=debug, 
+                                            jobid=jobid, cpus=cpus)
         if use_config:
             config.vars['MOTIF_FPKM'] = motif_fpkm
         
@@ -155,7 +180,7 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
     if os.stat(count_file).st_size == 0:
         raise exceptions.FileEmptyError("Error in RANK module. Counting failed.")
 
-    if rank == 'deseq' or rank == 'fc':
+    if rank == 'deseq' or rank == 'fc' or rank == 'nb':
         if bam1 and bam2:
             ranked_file, pvals, fcs = deseq(bam1=bam1, bam2=bam2, tempdir=tempdir, 
                                     count_file=count_file, label1=label1, 
@@ -177,7 +202,8 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
                                 bam1=bam1, bam2=bam2, bg1=bg1, bg2=bg2, 
                                 largewindow=largewindow, 
                                 millions_mapped=millions_mapped, 
-                                tempdir=tempdir)
+                                tempdir=tempdir, cachedir=cachedir, 
+                                debug=debug, jobid=jobid, cpus=cpus)
         else:
             meta_profile_dict = False
     else:
@@ -215,15 +241,17 @@ def main(use_config=True, combined_file=None, rank=None, scanner=None,
 #Functions
 #==============================================================================
 def count_reads(bedfile=None, bam1=None, bam2=None, tempdir=None, label1=None, 
-                label2=None):
+                label2=None, cachedir=None, debug=False, jobid=None, cpus=1):
     '''Counts reads across regions in a given bed file using bam files inputted
-        by a user
+        by a user. Reads are counted from the coverage cache of each bam file
+        (built in parallel if missing), and the resulting count matrix is 
+        saved as a numpy array alongside the tab-delimited count file used by 
+        DESeq
 
     Parameters
     ----------
     bedfile : string
-        full path to a bed file containing full regions of interest which will 
-        be counted using bedtools multicov
+        full path to a bed file containing full regions of interest
 
     bam1 : list or array
         a list of full paths to bam files pertaining to a single condition 
@@ -242,68 +270,176 @@ def count_reads(bedfile=None, bam1=None, bam2=None, tempdir=None, label1=None,
     label2 : string
         the name of the treatment or condition corresponding to bam2 list
 
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+
+    cpus : int
+        the maximum number of bam files to read at once
+
     Returns
     -------
-    None
+    count_file_header : pathlib.Path
+        full path to a count file with a header line, containing the chrom, 
+        start, stop, region name and counts for each bam file
     '''
-    #This os.system call runs bedtools multicov to count reads in all specified
-    #BAMs for given regions in BED
-    count_file = tempdir / "count_file.bed"
     count_file_header = tempdir / "count_file.header.bed"
+    count_matrix = tempdir / "count_file.npy"
 
-    #pybedtools implementation (incomplete)
-    # pybed_count = BedTool(bedfile.as_posix()).multi_bam_coverage(bams=bam1+bam2)
-    # pybed_count.saveas(count_file, trackline=("#chrom\tstart\tstop\tregion\t" 
-    #                                             + '\t'.join([label1]*len(bam1)) + "\t" 
-    #                                             + '\t'.join([label2]*len(bam2)) + "\n"))
-    
-    for bamfile in bam1+bam2:
-        samtools_index_command = ["samtools",  "index", "-b", bamfile]
-        subprocess.run(samtools_index_command)
+    counts = coverage_counts(bedfile=bedfile, files=bam1+bam2, 
+                                cachedir=cachedir, debug=debug, jobid=jobid, 
+                                cpus=cpus).astype(np.int64)
+    np.save(count_matrix, counts)
 
-    #Bedtools implementation
-    multicov_command = ["bedtools", "multicov", 
-                        "-bams"] + bam1+bam2 + ["-bed", bedfile]
-    with open(count_file, 'w') as outfile:
-        subprocess.run(multicov_command, stdout=outfile, check=True)
+    write_counts(count_file=count_file_header, bedfile=bedfile, counts=counts, 
+                    labels=[label1]*len(bam1) + [label2]*len(bam2))
 
-    # This section adds a header to the count_file and reformats it to remove 
-    # excess information and add a column with the region for later use
-    outfile = open(count_file_header, 'w')
-    outfile.write("#chrom\tstart\tstop\tregion\t" 
-                    + '\t'.join([label1]*len(bam1)) + "\t" 
-                    + '\t'.join([label2]*len(bam2)) + "\n")
+    return count_file_header
 
-    with open(count_file) as F:
+#==============================================================================
+def read_regions(bedfile=None, names=False, strands=False):
+    '''Reads the chrom, start and stop of each region in a bed file, skipping
+        header lines
+
+    Parameters
+    ----------
+    bedfile : string
+        full path to a bed file
+    names : boolean
+        whether to also return the name (4th column) of each region
+    strands : boolean
+        whether to also return the strand (6th column) of each region
+
+    Returns
+    -------
+    chroms : list
+        the chromosome of each region
+    starts : list
+        the start (int) of each region
+    stops : list
+        the stop (int) of each region
+    names : list
+        the name of each region. Only returned if names is True
+    strands : list
+        the strand of each region ('.' if not given). Only returned if 
+        strands is True
+    '''
+    chroms = list()
+    starts = list()
+    stops = list()
+    region_names = list()
+    region_strands = list()
+    with open(bedfile) as F:
         for line in F:
-            line = line.strip('\n').split('\t')
-            chrom,start,stop = line[:3]
-            counts = line[-(len(bam1)+len(bam2)):]
-            outfile.write('\t'.join([chrom,start,stop]) + "\t" 
-                            + chrom + ":" + start + "-" + stop + "\t"
-                            + '\t'.join(counts) + "\n")
-    outfile.close()
-    return count_file_header
+            if line.startswith(('#', 'track', 'browser')) or line.strip() == '':
+                continue
+            fields = line.strip('\n').split('\t')
+            chroms.append(fields[0])
+            starts.append(int(fields[1]))
+            stops.append(int(fields[2]))
+            if names:
+                region_names.append(fields[3])
+            if strands:
+                region_strands.append(fields[5] if len(fields) > 5 else '.')
+
+    regions = [chroms, starts, stops]
+    if names:
+        regions.append(region_names)
+    if strands:
+        regions.append(region_strands)
+
+    return tuple(regions)
 
 #==============================================================================
-def count_reads_bedtools(bedfile=None, bg1=None, bg2=None, tempdir=None, label1=None, 
-                            label2=None):
-    '''Counts reads across regions in a given bed file using bam files inputted
-        by a user
+def write_counts(count_file=None, bedfile=None, counts=None, labels=None):
+    '''Writes a count matrix as a tab-delimited count file with a header, as 
+        read by DESeq. Each line contains the chrom, start and stop of a 
+        region, its name (chrom:start-stop) and its count within each sample
 
     Parameters
     ----------
+    count_file : string
+        full path to the count file to write
     bedfile : string
-        full path to a bed file containing full regions of interest which will 
-        be counted using bedtools multicov
+        full path to the bed file that was counted
+    counts : array
+        (regions x samples) array of counts
+    labels : list
+        the condition label of each sample (column) of counts
+    '''
+    chroms, starts, stops = read_regions(bedfile=bedfile)
+    if np.all(np.mod(counts, 1) == 0):
+        counts = counts.astype(np.int64)
+    with open(count_file, 'w') as outfile:
+        outfile.write("#chrom\tstart\tstop\tregion\t" + '\t'.join(labels) 
+                        + "\n")
+        outfile.writelines(f"{chrom}\t{start}\t{stop}\t{chrom}:{start}-{stop}\t"
+                            + '\t'.join(map(str, row)) + "\n"
+                            for chrom, start, stop, row 
+                            in zip(chroms, starts, stops, counts.tolist()))
+
+#==============================================================================
+def coverage_counts(bedfile=None, files=None, cachedir=None, stranded=False, 
+                    debug=False, jobid=None, cpus=1):
+    '''Counts the reads (bam files) or sums the absolute values of all 
+        intervals (bedGraph files) overlapping each region in a bed file. 
+        Files are added to the coverage cache in parallel if missing and 
+        regions are then counted from the cache.
+
+    Parameters
+    ----------
+    bedfile : string
+        full path to a bed file containing regions to count
+    files : list
+        full paths to bam or bedGraph files
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+    stranded : boolean
+        whether to only count reads on the same strand as each region (6th
+        column of bedfile), as with bedtools multicov -s
+    cpus : int
+        the maximum number of files to add to the cache at once
+
+    Returns
+    -------
+    counts : array
+        (regions x files) float64 array of counts
+    '''
+    coverages = coverage.build_all(files=files, cachedir=cachedir, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
+    if stranded:
+        chroms, starts, stops, strands = read_regions(bedfile=bedfile, 
+                                                        strands=True)
+    else:
+        chroms, starts, stops = read_regions(bedfile=bedfile)
+        strands = None
+
+    return np.column_stack([cache_entry.counts(chroms=chroms, starts=starts, 
+                                                stops=stops, strands=strands)
+                            for cache_entry in coverages])
+
+#==============================================================================
+def count_reads_bedtools(bedfile=None, bg1=None, bg2=None, tempdir=None, 
+                            label1=None, label2=None, cachedir=None, 
+                            debug=False, jobid=None, cpus=1):
+    '''Counts reads across regions in a given bed file using bedGraph files 
+        inputted by a user. The count for a region is the sum of the absolute
+        values of all bedGraph intervals overlapping it (as with bedtools map 
+        -o sum), read from the coverage cache of each bedGraph. The resulting
+        count matrix is saved as a numpy array alongside the tab-delimited 
+        count file used by DESeq
+
+    Parameters
+    ----------
+    bedfile : string
+        full path to a bed file containing full regions of interest
 
     bg1 : list or array
-        a list of full paths to bam files pertaining to a single condition 
-        (i.e. replicates of a single treatment)
+        a list of full paths to bedGraph files pertaining to a single 
+        condition (i.e. replicates of a single treatment)
 
     bg2 : list or array
-        a list of full paths to bam files pertaining to a single condition 
-        (i.e. replicates of a single treatment)
+        a list of full paths to bedGraph files pertaining to a single 
+        condition (i.e. replicates of a single treatment)
 
     tempdir : string
         full path to temp directory in output directory (created by TFEA)
@@ -314,68 +450,43 @@ def count_reads_bedtools(bedfile=None, bg1=None, bg2=None, tempdir=None, label1=
     label2 : string
         the name of the treatment or condition corresponding to bg2 list
 
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+
+    cpus : int
+        the maximum number of bedGraph files to read at once
+
     Returns
     -------
-    None
+    count_file_header : pathlib.Path
+        full path to a count file with a header line, containing the chrom, 
+        start, stop, region name and counts for each bedGraph file
     '''
-    #This os.system call runs bedtools multicov to count reads in all specified
-    #BAMs for given regions in BED
-    count_file = tempdir / "count_file.bed"
     count_file_header = tempdir / "count_file.header.bed"
+    count_matrix = tempdir / "count_file.npy"
 
-    #pybedtools implementation (incomplete)
-    # pybed_count = BedTool(bedfile.as_posix()).multi_bam_coverage(bams=bg1+bg2)
-    # pybed_count.saveas(count_file, trackline=("#chrom\tstart\tstop\tregion\t" 
-    #                                             + '\t'.join([label1]*len(bg1)) + "\t" 
-    #                                             + '\t'.join([label2]*len(bg2)) + "\n"))
-
-    #Bedtools implementation
-    multicov_command = ["bedtools", "map", 
-                        "-a", bedfile, ] + bg1+bg2 + ["-bed", bedfile]
-    multicov_command = ""
-    bedfile = str(bedfile)
-    for i,bgfile in enumerate(bg1+bg2):
-        bgfile = f"<(awk -F'\\t' -v OFS='\\t' 'function abs(x) {{return ((x < 0.0) ? -x : x)}} {{print $1,$2,$3,abs($4)}}' {bgfile})"
-        if i == 0:
-            multicov_command = "bedtools map -null 0 -o sum -c 4 -a "+bedfile+" -b "+bgfile+" | "
-        else:
-            multicov_command = multicov_command + "bedtools map -null 0 -o sum -c 4 -a stdin -b "+bgfile
-    with open(count_file, 'w') as outfile:
-        try:
-            subprocess.run(['/bin/bash','-c', multicov_command],
-                            stdout=outfile, stderr=subprocess.PIPE, check=True)
-        except subprocess.CalledProcessError as e:
-            raise exceptions.SubprocessError(e.stderr.decode())
-
-    # This section adds a header to the count_file and reformats it to remove 
-    # excess information and add a column with the region for later use
-    outfile = open(count_file_header, 'w')
-    outfile.write("#chrom\tstart\tstop\tregion\t" 
-                    + '\t'.join([label1]*len(bg1)) + "\t" 
-                    + '\t'.join([label2]*len(bg2)) + "\n")
+    counts = coverage_counts(bedfile=bedfile, files=bg1+bg2, cachedir=cachedir, 
+                                debug=debug, jobid=jobid, cpus=cpus)
+    np.save(count_matrix, counts)
+
+    write_counts(count_file=count_file_header, bedfile=bedfile, counts=counts, 
+                    labels=[label1]*len(bg1) + [label2]*len(bg2))
 
-    with open(count_file) as F:
-        for line in F:
-            line = line.strip('\n').split('\t')
-            chrom,start,stop = line[:3]
-            counts = line[-(len(bg1)+len(bg2)):]
-            outfile.write('\t'.join([chrom,start,stop]) + "\t" 
-                            + chrom + ":" + start + "-" + stop + "\t"
-                            + '\t'.join(counts) + "\n")
-    outfile.close()
     return count_file_header
 
 #==============================================================================
 def motif_count_reads(bedfile=None, bam1=None, bam2=None, tempdir=None, 
-                            label1=None, label2=None, millions_mapped=None):
-    '''Counts reads across regions in a given bed file using bam files inputted
-        by a user
+                            label1=None, label2=None, millions_mapped=None, 
+                            cachedir=None, debug=False, jobid=None, cpus=1):
+    '''Calculates the FPKM of motif annotations (i.e. TF genes) using bam 
+        files inputted by a user. Only reads on the same strand as each 
+        annotation are counted (as with bedtools multicov -s)
 
     Parameters
     ----------
     bedfile : string
-        full path to a bed file containing full regions of interest which will 
-        be counted using bedtools multicov
+        full path to a bed file containing motif annotations with motif names
+        as the 4th column and strands as the 6th column
 
     bam1 : list or array
         a list of full paths to bam files pertaining to a single condition 
@@ -394,131 +505,124 @@ def motif_count_reads(bedfile=None, bam1=None, bam2=None, tempdir=None,
     label2 : string
         the name of the treatment or condition corresponding to bam2 list
 
+    millions_mapped : list
+        millions mapped reads within each bam file (output of sum_reads)
+
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+
+    cpus : int
+        the maximum number of bam files to read at once
+
     Returns
     -------
-    None
+    motif_fpkm : dict
+        motif name -> mean FPKM across all bam files
     '''
-    #This os.system call runs bedtools multicov to count reads in all specified
-    #BAMs for given regions in BED
-    count_file = tempdir / "motif_counts.bed"
-    count_file_header = tempdir / "motif_counts.header.fpkm.bed"
-
-    #pybedtools implementation (incomplete)
-    # pybed_count = BedTool(bedfile.as_posix()).multi_bam_coverage(bams=bam1+bam2)
-    # pybed_count.saveas(count_file, trackline=("#chrom\tstart\tstop\tregion\t" 
-    #                                             + '\t'.join([label1]*len(bam1)) + "\t" 
-    #                                             + '\t'.join([label2]*len(bam2)) + "\n"))
-
-    #Bedtools implementation
-    multicov_command = ["bedtools", "multicov", "-s", 
-                        "-bams"] + bam1+bam2 + ["-bed", bedfile]
-    with open(count_file, 'w') as outfile:
-        subprocess.run(multicov_command, stdout=outfile, check=True)
-
-    # This section adds a header to the count_file and reformats it to remove 
-    # excess information and add a column with the region for later use
-    outfile = open(count_file_header, 'w')
-    outfile.write("#chrom\tstart\tstop\tregion\t" 
-                    + '\t'.join([label1]*len(bam1)) + "\t" 
-                    + '\t'.join([label2]*len(bam2)) + "\n")
-    motif_fpkm = {}
-    with open(count_file) as F:
-        for line in F:
-            line = line.strip('\n').split('\t')
-            chrom,start,stop,motif = line[:4]
-            length = float(stop) - float(start)
-            fpkm = [float(c)/(m/1000000.0)/(length/1000.0) for c,m in zip(line[-(len(bam1)+len(bam2)):], millions_mapped)]
-            motif_fpkm[motif] = np.mean(fpkm)
-            outfile.write('\t'.join([chrom,start,stop]) + "\t" 
-                            + motif + "\t"
-                            + '\t'.join([str(f) for f in fpkm]) + "\n")
-    outfile.close()
-    return motif_fpkm
+    counts = coverage_counts(bedfile=bedfile, files=bam1+bam2, 
+                                cachedir=cachedir, stranded=True, debug=debug, 
+                                jobid=jobid, cpus=cpus)
+
+    return write_fpkm(count_file=tempdir / "motif_counts.header.fpkm.bed", 
+                        bedfile=bedfile, counts=counts, 
+                        millions_mapped=millions_mapped, 
+                        labels=[label1]*len(bam1) + [label2]*len(bam2))
 
 #==============================================================================
 def motif_count_reads_bg(bedfile=None, bg1=None, bg2=None, tempdir=None, 
-                            label1=None, label2=None, millions_mapped=None):
-    '''Counts reads across regions in a given bed file using bam files inputted
-        by a user
+                            label1=None, label2=None, millions_mapped=None, 
+                            cachedir=None, debug=False, jobid=None, cpus=1):
+    '''Calculates the FPKM of motif annotations (i.e. TF genes) using 
+        bedGraph files inputted by a user
 
     Parameters
     ----------
     bedfile : string
-        full path to a bed file containing full regions of interest which will 
-        be counted using bedtools multicov
+        full path to a bed file containing motif annotations with motif names
+        as the 4th column
 
-    bam1 : list or array
-        a list of full paths to bam files pertaining to a single condition 
-        (i.e. replicates of a single treatment)
+    bg1 : list or array
+        a list of full paths to bedGraph files pertaining to a single 
+        condition (i.e. replicates of a single treatment)
 
-    bam2 : list or array
-        a list of full paths to bam files pertaining to a single condition 
-        (i.e. replicates of a single treatment)
+    bg2 : list or array
+        a list of full paths to bedGraph files pertaining to a single 
+        condition (i.e. replicates of a single treatment)
 
     tempdir : string
         full path to temp directory in output directory (created by TFEA)
 
     label1 : string
-        the name of the treatment or condition corresponding to bam1 list
+        the name of the treatment or condition corresponding to bg1 list
 
     label2 : string
-        the name of the treatment or condition corresponding to bam2 list
+        the name of the treatment or condition corresponding to bg2 list
+
+    millions_mapped : list
+        millions mapped reads within each bedGraph file (output of sum_reads)
+
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+
+    cpus : int
+        the maximum number of bedGraph files to read at once
 
     Returns
     -------
-    None
+    motif_fpkm : dict
+        motif name -> mean FPKM across all bedGraph files
     '''
-    #This os.system call runs bedtools multicov to count reads in all specified
-    #BAMs for given regions in BED
-    count_file = tempdir / "motif_counts.bed"
-    count_file_header = tempdir / "motif_counts.header.fpkm.bed"
-
-    #pybedtools implementation (incomplete)
-    # pybed_count = BedTool(bedfile.as_posix()).multi_bam_coverage(bams=bam1+bam2)
-    # pybed_count.saveas(count_file, trackline=("#chrom\tstart\tstop\tregion\t" 
-    #                                             + '\t'.join([label1]*len(bam1)) + "\t" 
-    #                                             + '\t'.join([label2]*len(bam2)) + "\n"))
-
-    #Bedtools implementation
-    multicov_command = ["bedtools", "map", 
-                        "-a", bedfile, ] + bg1+bg2 + ["-bed", bedfile]
-    multicov_command = ""
-    bedfile = str(bedfile)
-    for i,bgfile in enumerate(bg1+bg2):
-        bgfile = f"<(awk -F'\\t' -v OFS='\\t' 'function abs(x) {{return ((x < 0.0) ? -x : x)}} {{print $1,$2,$3,abs($4)}}' {bgfile})"
-        if i == 0:
-            multicov_command = "bedtools map -null 0 -c 4 -a "+bedfile+" -b "+bgfile+" | "
-        else:
-            multicov_command = multicov_command + "bedtools map -null 0 -c 4 -a stdin -b "+bgfile
+    counts = coverage_counts(bedfile=bedfile, files=bg1+bg2, cachedir=cachedir, 
+                                debug=debug, jobid=jobid, cpus=cpus)
+
+    return write_fpkm(count_file=tempdir / "motif_counts.header.fpkm.bed", 
+                        bedfile=bedfile, counts=counts, 
+                        millions_mapped=millions_mapped, 
+                        labels=[label1]*len(bg1) + [label2]*len(bg2))
+
+#==============================================================================
+def write_fpkm(count_file=None, bedfile=None, counts=None, 
+                millions_mapped=None, labels=None):
+    '''Normalizes the counts of motif annotations to FPKM and writes them as a
+        tab-delimited file with a header
+
+    Parameters
+    ----------
+    count_file : string
+        full path to the FPKM file to write
+    bedfile : string
+        full path to the bed file of motif annotations that was counted
+    counts : array
+        (annotations x samples) array of counts
+    millions_mapped : list
+        millions mapped reads within each sample (output of sum_reads)
+    labels : list
+        the condition label of each sample (column) of counts
+
+    Returns
+    -------
+    motif_fpkm : dict
+        motif name -> mean FPKM across all samples
+    '''
+    chroms, starts, stops, motifs = read_regions(bedfile=bedfile, names=True)
+    lengths = np.array(stops, dtype=float) - np.array(starts, dtype=float)
+    fpkms = (counts/(np.array(millions_mapped)/1000000.0)
+                /(lengths[:, np.newaxis]/1000.0))
+    motif_fpkm = {motif: np.mean(fpkm) for motif, fpkm in zip(motifs, fpkms)}
+
     with open(count_file, 'w') as outfile:
-        try:
-            subprocess.run(['/bin/bash','-c', multicov_command],
-                            stdout=outfile, stderr=subprocess.PIPE, check=True)
-        except subprocess.CalledProcessError as e:
-            raise exceptions.SubprocessError(e.stderr.decode())
-
-    # This section adds a header to the count_file and reformats it to remove 
-    # excess information and add a column with the region for later use
-    outfile = open(count_file_header, 'w')
-    outfile.write("#chrom\tstart\tstop\tregion\t" 
-                    + '\t'.join([label1]*len(bg1)) + "\t" 
-                    + '\t'.join([label2]*len(bg2)) + "\n")
-    motif_fpkm = {}
-    with open(count_file) as F:
-        for line in F:
-            line = line.strip('\n').split('\t')
-            chrom,start,stop,motif = line[:4]
-            length = float(stop) - float(start)
-            fpkm = [float(c)/(m/1000000.0)/(length/1000.0) for c,m in zip(line[-(len(bg1)+len(bg2)):], millions_mapped)]
-            motif_fpkm[motif] = np.mean(fpkm)
-            outfile.write('\t'.join([chrom,start,stop]) + "\t" 
-                            + motif + "\t"
-                            + '\t'.join([str(f) for f in fpkm]) + "\n")
-    outfile.close()
+        outfile.write("#chrom\tstart\tstop\tregion\t" + '\t'.join(labels) 
+                        + "\n")
+        outfile.writelines(f"{chrom}\t{start}\t{stop}\t{motif}\t"
+                            + '\t'.join([str(f) for f in fpkm]) + "\n"
+                            for chrom, start, stop, motif, fpkm 
+                            in zip(chroms, starts, stops, motifs, 
+                                    fpkms.tolist()))
+
     return motif_fpkm
 
 #==============================================================================
-def sum_reads(count_file=None, sample_number=None):
+def sum_reads(count_file=None, sample_number=None, count_matrix=None):
     '''This function calculates millions mapped reads to regions of interest
         to be used later for normalization of meta plot
     
@@ -531,12 +635,20 @@ def sum_reads(count_file=None, sample_number=None):
     sample_number : int
         The total number of samples
 
+    count_matrix : string
+        The full path to the count matrix (.npy) saved alongside count_file. 
+        If it exists, the column sums of this matrix are returned and 
+        count_file is not read
+
     Returns
     -------
     millions_mapped : list
         A list of ints that corresponds to the number of millions mapped per
         sample in the order that appears in the count_file (by column)
     '''
+    if count_matrix is not None and os.path.exists(count_matrix):
+        return np.load(count_matrix).sum(axis=0).astype(float).tolist()
+
     millions_mapped = [0.0]*sample_number
     with open(count_file) as F:
         F.readline()
@@ -653,41 +765,48 @@ write.table(res, file = "'''    + os.path.join(tempdir,'DESeq.res.txt')
 def deseq(bam1=None, bam2=None, tempdir=None, count_file=None, label1=None, 
             label2=None, largewindow=None, rank=None, figuredir=None, 
             basemean_cut=None, plot_format=None, batch=''):
-    #Write the DE-Seq R script
-    write_deseq_script(bam1=bam1, bam2=bam2, tempdir=tempdir, 
-                        count_file=count_file, label1=label1, label2=label2, 
-                        batch=batch)
-
-    #Execute the DE-Seq R script
-    # with open(tempdir / 'DESeq.Rout', 'w') as stdout:
-    deseqR = tempdir / "DESeq.R"
-    deseqout = tempdir / 'DESeq.Rout'
     deseq_file = tempdir / 'DESeq.res.txt'
-    with open(deseqout, 'w') as output:
-        exitcode = subprocess.run(["Rscript", deseqR], stdout=output,
-                                    stderr=output)
-    if exitcode.returncode != 0:
-        errormessage = deseqout.read_text()
-        if 'Error' in errormessage:
-            printmessage = errormessage[errormessage.index('Error'):]
-        raise exceptions.SubprocessError(printmessage)
-
-    
+    if rank == 'nb':
+        #Test in-process, writing results in the same format as DE-Seq
+        nbinom.write_results(count_file=count_file, 
+                            count_matrix=tempdir / 'count_file.npy', 
+                            conditions=[0]*len(bam1) + [1]*len(bam2), 
+                            batch=batch, res_file=deseq_file)
+    else:
+        #Write the DE-Seq R script
+        write_deseq_script(bam1=bam1, bam2=bam2, tempdir=tempdir, 
+                            count_file=count_file, label1=label1, label2=label2, 
+                            batch=batch)
+
+        #Execute the DE-Seq R script
+        deseqR = tempdir / "DESeq.R"
+        deseqout = tempdir / 'DESeq.Rout'
+        with open(deseqout, 'w') as output:
+            exitcode = subprocess.run(["Rscript", deseqR], stdout=output,
+                                        stderr=output)
+        if exitcode.returncode != 0:
+            errormessage = deseqout.read_text()
+            if 'Error' in errormessage:
+                printmessage = errormessage[errormessage.index('Error'):]
+            raise exceptions.SubprocessError(printmessage)
+
+    results = ranked_table.read_deseq(deseq_file=deseq_file)
     plot.plot_deseq_MA(deseq_file=deseq_file, label1=label1, label2=label2, 
                         figuredir=figuredir, basemean_cut=basemean_cut, 
-                        plot_format=plot_format)
+                        plot_format=plot_format, results=results)
 
     ranked_file, pvals, fcs = deseq_parse(deseq_file=deseq_file, tempdir=tempdir, 
                                 largewindow=largewindow, rank=rank, 
-                                basemean_cut=basemean_cut)
+                                basemean_cut=basemean_cut, results=results)
 
     return ranked_file, pvals, fcs
 
 #==============================================================================
 def deseq_parse(deseq_file=None, tempdir=None, largewindow=None, rank=None, 
-                basemean_cut=0):
+                basemean_cut=0, results=None):
     '''This function parses a DE-seq output file and creates a new file with 
-        the center of each region ranked by p-value 
+        the center of each region ranked by p-value. The ranked regions are 
+        also saved as a table (ranked_table) alongside the ranked file.
     
     Parameters
     ----------
@@ -697,80 +816,62 @@ def deseq_parse(deseq_file=None, tempdir=None, largewindow=None, rank=None,
     tempdir : string
         full path to the tempdir directory in the output directory (created by 
         TFEA)
+
+    results : dict
+        the DE-Seq output file already parsed by ranked_table.read_deseq. If 
+        None, deseq_file is parsed
         
     Returns
     -------
     ranked_center_file : string
         full path to a bed file that contains the center of regions of interest
         ranked via DE-Seq p-value
+
+    pvals : array
+        the p-value of each ranked region
+
+    fcs : array
+        the fold change of each ranked region
     '''
     #Parse the DE-Seq output file
-    up = list()
-    down = list()
-    with open(deseq_file) as F:
-        header = F.readline().strip('\n').split('\t')
-        fc_index = [i for i in range(len(header)) 
-                    if header[i]=='"fc"' or header[i]=='"foldChange"'][0]
-        basemean_index = [i for i in range(len(header)) if header[i]=='"baseMean"'][0]
-        for line in F:
-            line = line.strip('\n').split('\t')
-            if line[fc_index+1] != 'NA':
-                try:
-                    pval = format(float(line[-2]),'.12f')
-                except ValueError:
-                    pval = format(1.0,'.12f')
-                region = line[0].split(':')
-                chrom = region[0]
-                coordinates = region[1].split('-')
-                start = coordinates[0]
-                stop = coordinates[1]
-                chrom = chrom.strip('"')
-                stop = stop.strip('"')
-                center = int((int(start)+int(stop))/2)
-                start = center - int(largewindow)
-                start = start if start > 0 else 0
-                stop = center + int(largewindow)
-                fc = float(line[fc_index+1])
-                basemean = float(line[basemean_index+1])
-                if basemean > basemean_cut:
-                    if fc < 1:
-                        down.append([chrom, str(start), str(stop), str(fc), str(pval)])
-                    else:
-                        up.append([chrom, str(start), str(stop), str(fc), str(pval)])
-
-    #Save ranked regions in a bed file (pvalue included)
+    if results is None:
+        results = ranked_table.read_deseq(deseq_file=deseq_file)
+    with np.errstate(invalid='ignore'):
+        keep = np.flatnonzero(~np.isnan(results['fc']) 
+                                & (results['baseMean'] > basemean_cut))
+    chroms = list()
+    centers = list()
+    for index in keep.tolist():
+        chrom, coordinates = results['regions'][index].split(':')[:2]
+        start, stop = coordinates.split('-')
+        chroms.append(chrom)
+        centers.append(int((int(start)+int(stop))/2))
+    centers = np.array(centers, dtype=np.int64)
+    fcs = results['fc'][keep]
+    pvals = np.array([float(format(pval, '.12f')) if not np.isnan(pval) 
+                        else 1.0 for pval in results['pvalue'][keep].tolist()])
+
+    #Rank regions: up-regulated by increasing p-value followed by 
+    # down-regulated by decreasing p-value, or all by decreasing fold change
+    if rank == 'deseq' or rank == 'nb':
+        up = np.flatnonzero(fcs >= 1)
+        down = np.flatnonzero(fcs < 1)
+        order = np.concatenate([up[np.argsort(pvals[up], kind='stable')], 
+                            down[np.argsort(-pvals[down], kind='stable')]])
+    elif rank == 'fc':
+        order = np.argsort(-fcs, kind='stable')
+    table = ranked_table.build(chroms=np.array(chroms, dtype=str)[order], 
+                                starts=np.maximum(centers[order] 
+                                                    - int(largewindow), 0), 
+                                stops=centers[order] + int(largewindow), 
+                                fcs=fcs[order], pvals=pvals[order])
+
+    #Save ranked regions as a table and a bed file (pvalue included)
     ranked_file = tempdir / "ranked_file.bed"
-    pvals = list()
-    fcs = list()
-    with open(ranked_file,'w') as outfile:
-        outfile.write('\t'.join(['#chrom', 'start', 'stop', 'fc,p-value,rank']) 
-                        + '\n')
-        r=1
-        if rank == 'deseq':
-            for region in sorted(up, key=lambda x: x[4]):
-                outfile.write('\t'.join(region[:3]) 
-                            + '\t' + ','.join(region[3:]+[str(r)]) 
-                            + '\n')
-                pvals.append(float(region[-1]))
-                fcs.append(float(region[3]))
-                r += 1
-            for region in sorted(down, key=lambda x: x[4], reverse=True):
-                outfile.write('\t'.join(region[:3]) 
-                            + '\t' + ','.join(region[3:]+[str(r)]) 
-                            + '\n')
-                pvals.append(float(region[-1]))
-                fcs.append(float(region[3]))
-                r += 1
-        elif rank == 'fc':
-            for region in sorted(up+down, key=lambda x: x[3], reverse=True):
-                outfile.write('\t'.join(region[:3]) 
-                            + '\t' + ','.join(region[3:]+[str(r)]) 
-                            + '\n')
-                pvals.append(float(region[-1]))
-                fcs.append(float(region[3]))
-                r += 1
+    table.write_bed(ranked_file)
+    table.save(ranked_table.table_path(bedfile=ranked_file))
 
-    return ranked_file, pvals, fcs
+    return ranked_file, table.pvals, table.fcs
 
 #==============================================================================
 def create_mdd_files(ranked_file=None, percent=False, pval_cut=False, tempdir=None):
@@ -800,44 +901,25 @@ def create_mdd_files(ranked_file=None, percent=False, pval_cut=False, tempdir=No
     '''
     mdd_bedfile1 = tempdir / 'mdd_bedfile1.bed'
     mdd_bedfile2 = tempdir / 'mdd_bedfile2.bed'
-    regions = list()
-    with open(ranked_file) as F:
-        for line in F:
-            if line[0] != '#':
-                chrom, start, stop, rank_values = line.strip('\n').split('\t')
-                fc, pval, rank = rank_values.split(',')
-                fc = float(fc)
-                pval = float(pval)
-                rank = int(rank)
-                regions.append((chrom, start, stop, fc, pval, rank))
-    regions = sorted(regions, key=lambda x: x[-2])
+    table = ranked_table.load(bedfile=ranked_file)
+    order = np.argsort(table.pvals, kind='stable')
     if percent != False:
-        index = int(len(regions) * percent)
-        mdd1_regions = regions[index:]
-        mdd2_regions = regions[:index]
+        index = int(len(order) * percent)
+        mdd1_regions = order[index:]
+        mdd2_regions = order[:index]
     elif pval_cut != False:
-        mdd1_regions = [region for region in regions if region[-2] >= pval_cut]
-        mdd2_regions = [region for region in regions if region[-2] < pval_cut]
+        mdd1_regions = order[table.pvals[order] >= pval_cut]
+        mdd2_regions = order[table.pvals[order] < pval_cut]
     else:
         raise exceptions.InputError("No cutoff value specified for creating mdd bed files")
 
-    with open(mdd_bedfile1, 'w') as ofile1:
-        ofile1.write('\t'.join(['#chrom', 'start', 'stop', 'fc,pval,oldrank', 'rank']) + '\n')
-        rank1 = 1
-        for region1 in mdd1_regions:
-            ofile1.write('\t'.join([x for x in region1[:3]]) 
-                        + '\t' + ','.join([str(x) for x in region1[3:-1]] + [str(rank1)])
-                        + '\n')
-            rank1 += 1
-
-    with open(mdd_bedfile2, 'w') as ofile2:
-        ofile2.write('\t'.join(['#chrom', 'start', 'stop', 'fc,pval,oldrank', 'rank']) + '\n')
-        rank2 = 1
-        for region2 in mdd2_regions:
-            ofile2.write('\t'.join([x for x in region2[:3]]) 
-                        + '\t' + ','.join([str(x) for x in region2[3:-1]] + [str(rank2)])
-                        + '\n')
-            rank2 += 1
+    header = ['#chrom', 'start', 'stop', 'fc,pval,oldrank', 'rank']
+    for mdd_bedfile, regions in [(mdd_bedfile1, mdd1_regions), 
+                                    (mdd_bedfile2, mdd2_regions)]:
+        mdd_table = table.take(regions)
+        mdd_table.ranks = np.arange(1, len(regions) + 1, dtype=np.int32)
+        mdd_table.write_bed(mdd_bedfile, header=header, pval_format='')
+        mdd_table.save(ranked_table.table_path(bedfile=mdd_bedfile))
 
     return mdd_bedfile1, mdd_bedfile2
 
@@ -845,12 +927,7 @@ def create_mdd_files(ranked_file=None, percent=False, pval_cut=False, tempdir=No
 def quartile_split(ranked_file):
     '''Takes a ranked_file and outputs regions separated by quartiles
     '''
-    regions = list()
-    with open(ranked_file) as F:
-        F.readline()
-        for line in F:
-            linelist = line.strip('\n').split('\t')
-            regions.append(linelist[:3])
+    regions = ranked_table.load(bedfile=ranked_file).regions()
     
     q1 = int(round(np.percentile(np.arange(1, len(regions),1), 25)))
     q2 = int(round(np.percentile(np.arange(1, len(regions),1), 50)))
@@ -865,464 +942,228 @@ def quartile_split(ranked_file):
 #==============================================================================
 def meta_profile_quartiles(q1regions, q2regions, q3regions, q4regions, 
                             bam1=None, bam2=None, bg1=None, bg2=None, 
-                            largewindow=None,
-                            tempdir=None, millions_mapped=None):
-    '''This function creates a metaprofile from 4 regions and stores them in
-        a dictionary. 
-    '''
-    if len(q1regions + q2regions + q3regions + q4regions)*largewindow < 6e7 and bam1 and bam2:
-        q1regions = ['q1'] + q1regions
-        q2regions = ['q2'] + q2regions
-        q3regions = ['q3'] + q3regions
-        q4regions = ['q4'] + q4regions
-        kwargs = dict(largewindow=largewindow, bam1=bam1, bam2=bam2)
-        meta_profile_tuples = multiprocess.main(function=meta_profile, 
-                        args=[q1regions, q2regions, q3regions, q4regions], 
-                        kwargs=kwargs)
-    elif bam1 and bam2:
-        print("\tToo many regions to parallelize over. Performing computation in serial.", 
-                file=sys.stderr)
-        q1regions = ['q1'] + q1regions
-        q2regions = ['q2'] + q2regions
-        q3regions = ['q3'] + q3regions
-        q4regions = ['q4'] + q4regions
-        meta_profile_tuples = np.empty(4,dtype=list)
-        meta_profile_tuples[0] = meta_profile(regionlist=q1regions, 
-                                        largewindow=largewindow, bam1=bam1, 
-                                        bam2=bam2)
-
-        meta_profile_tuples[1] = meta_profile(regionlist=q2regions, 
-                                        largewindow=largewindow, bam1=bam1, 
-                                        bam2=bam2)
-
-        meta_profile_tuples[2] = meta_profile(regionlist=q3regions, 
-                                        largewindow=largewindow, bam1=bam1, 
-                                        bam2=bam2)
-    
-        meta_profile_tuples[3] = meta_profile(regionlist=q4regions, 
-                                        largewindow=largewindow, bam1=bam1, 
-                                        bam2=bam2)
-    elif bg1 and bg2:
-        regionlist = q1regions+q2regions+q3regions+q4regions
-        meta_profile_tuples = meta_profile_bg(regionlist=regionlist, 
-                                                largewindow=largewindow, 
-                                                bg1=bg1, bg2=bg2)
+                            largewindow=None, tempdir=None, 
+                            millions_mapped=None, cachedir=None, debug=False, 
+                            jobid=None, cpus=1):
+    '''This function creates meta-profiles for the regions within each 
+        quartile, normalized by millions mapped reads. Profiles are read from
+        the coverage cache in cachedir, one chromosome per process, and each 
+        process writes its rows straight into memory-mapped arrays.
 
-    meta_profile_dict = {}
+    Parameters
+    ----------
+    q1regions, q2regions, q3regions, q4regions : list
+        regions within each quartile. Format: [(chrom, start, stop), ...]
+    bam1, bam2 : list
+        full paths to bam files corresponding to each condition
+    bg1, bg2 : list
+        full paths to bedGraph files corresponding to each condition. Used if
+        bam files are not given. Positive values make up the positive strand
+        profiles and negative values the negative strand profiles
+    largewindow : int
+        half of the profile length
+    tempdir : pathlib.Path
+        full path to a directory in which to save profiles
+    millions_mapped : list
+        mapped reads within each sample (output of sum_reads)
+    cachedir : pathlib.Path
+        full path to the coverage cache folder
+    cpus : int
+        the maximum number of chromosomes to process at once
+
+    Returns
+    -------
+    meta_profile_folder : pathlib.Path
+        full path to a folder containing, for each quartile, strand and 
+        condition (i.e. q1posprofile1), a (regions x 2*largewindow) float32 
+        .npy file of profiles and a .sum.npy file of their sum over regions.
+        If tempdir is None, a dictionary of the profile arrays is returned 
+        instead
+    '''
     if bam1 and bam2:
-        mil_map1 = sum(millions_mapped[:len(bam1)])/len(bam1)/1e6
-        mil_map2 = sum(millions_mapped[-len(bam2):])/len(bam2)/1e6
+        files1, files2 = bam1, bam2
     elif bg1 and bg2:
-        mil_map1 = sum(millions_mapped[:len(bg1)])/len(bg1)/1e6
-        mil_map2 = sum(millions_mapped[-len(bg2):])/len(bg2)/1e6
-    for profile_list in meta_profile_tuples:
-        for key, profile in profile_list:
-            if key[-1] == '1':
-                profile = [[y/mil_map1 for y in x] for x in profile]
-            elif key[-1] == '2':
-                profile = [[y/mil_map2 for y in x] for x in profile]
-            meta_profile_dict[key] = profile
+        files1, files2 = bg1, bg2
+    coverage1 = coverage.build_all(files=files1, cachedir=cachedir, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
+    coverage2 = coverage.build_all(files=files2, cachedir=cachedir, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
+    mil_map1 = sum(millions_mapped[:len(files1)])/len(files1)/1e6
+    mil_map2 = sum(millions_mapped[-len(files2):])/len(files2)/1e6
+
     if tempdir is None:
-        return meta_profile_dict
-    else:
-        meta_profile_folder = tempdir / 'meta_profile'
-        meta_profile_folder.mkdir(exist_ok=True)
-        
-        for key in meta_profile_dict:
-            for i, profile in enumerate(meta_profile_dict[key]):
-                profile_file = meta_profile_folder / (f'{key}_{i}')
-                profile_file.write_text(ujson.dumps(profile))
-                
-        return meta_profile_folder
-
-        #JSON single file
-        # meta_profile_file = tempdir / 'meta_profile.json'
-        # meta_profile_file.write_text(ujson.dumps(meta_profile_dict))
-
-        # return meta_profile_file
-
-        #Pickling
-        # with open(meta_profile_file, 'wb') as f:
-        #     pickle.dump(meta_profile_dict, f)
-
-        # #Pure Python
-        # with open(meta_profile_file, 'w') as outfile:
-        #     for key in meta_profile_dict:
-        #         outfile.write('#' + key + '\n')
-        #         outfile.write('\n'.join([','.join([str(y) for y in x]) for x in profile]) + '\n')
-        
+        with tempfile.TemporaryDirectory() as temp_folder:
+            meta_profile_folder = meta_profile_quartiles(q1regions, q2regions, 
+                                        q3regions, q4regions, bam1=bam1, 
+                                        bam2=bam2, bg1=bg1, bg2=bg2, 
+                                        largewindow=largewindow, 
+                                        tempdir=Path(temp_folder), 
+                                        millions_mapped=millions_mapped, 
+                                        cachedir=cachedir, debug=debug, 
+                                        jobid=jobid, cpus=cpus)
+            return {path.name[:-len('.npy')]: np.load(path) 
+                    for path in meta_profile_folder.glob('*profile?.npy')}
+
+    meta_profile_folder = tempdir / 'meta_profile'
+    meta_profile_folder.mkdir(exist_ok=True)
+    window = 2*int(largewindow)
+    quartiles = [q1regions, q2regions, q3regions, q4regions]
+    for quartile, regions in enumerate(quartiles, 1):
+        for key in profile_keys(quartile=quartile):
+            np.lib.format.open_memmap(str(meta_profile_folder / f'{key}.npy'), 
+                                        mode='w+', dtype=np.float32, 
+                                        shape=(len(regions), window))
+
+    regionlist = q1regions + q2regions + q3regions + q4regions
+    chroms = np.array([chrom for chrom, _, _ in regionlist])
+    kwargs = dict(regionlist=regionlist, 
+                    quartiles=np.repeat(np.arange(1, 5), 
+                                        [len(regions) for regions in quartiles]),
+                    rows=np.concatenate([np.arange(len(regions)) 
+                                            for regions in quartiles]),
+                    largewindow=largewindow, coverage1=coverage1, 
+                    coverage2=coverage2, mil_map1=mil_map1, mil_map2=mil_map2, 
+                    folder=meta_profile_folder)
+    results = multiprocess.main(function=meta_profile_chrom, 
+                                args=list(np.unique(chroms)), kwargs=kwargs, 
+                                debug=debug, jobid=jobid, 
+                                cpus=max(1, min(cpus, len(np.unique(chroms)))))
+
+    sums = {key: np.zeros(window) for quartile in range(1, 5) 
+            for key in profile_keys(quartile=quartile)}
+    for chrom_sums in results:
+        for key, profile_sum in chrom_sums.items():
+            sums[key] += profile_sum
+    for key, profile_sum in sums.items():
+        np.save(meta_profile_folder / f'{key}.sum.npy', profile_sum)
+
+    return meta_profile_folder
 
 #==============================================================================
-def meta_profile(regionlist=None, largewindow=None, bam1=None, bam2=None):
-    '''This function returns average profiles for given regions of interest.
-        A user may input either a list of regions or a bed file
+def profile_keys(quartile=None):
+    '''Returns the names of the positive and negative strand profiles of each
+        condition within a quartile (i.e. q1posprofile1)
+    '''
+    return [f'q{quartile}{strand}profile{condition}' for condition in '12' 
+            for strand in ['pos', 'neg']]
+
+#==============================================================================
+def meta_profile_chrom(chrom, regionlist=None, quartiles=None, rows=None, 
+                        largewindow=None, coverage1=None, coverage2=None, 
+                        mil_map1=None, mil_map2=None, folder=None, 
+                        blocksize=PROFILE_BLOCKSIZE):
+    '''Computes the meta-profiles of all regions on a single chromosome, 
+        normalized by millions mapped reads, and writes each into its row of
+        the memory-mapped profile arrays within folder. Regions are processed
+        in blocks so that memory scales with blocksize rather than with the 
+        number of regions.
+
     Parameters
     ----------
+    chrom : str
+        the chromosome to process
     regionlist : list
-        a list of regions of interest. Format: [(chrom, start, stop), (), ...]
-        First value is special 'key_prefix' which simply keeps track of which
-        quartile we're in.
-    largewindow : float
-        the window with which to compute profiles for
-    bam1 : list
-        a list of full paths to bam files corresponding to a condition or 
-        treatment
-    bam2 : list
-        a list of full paths to bam files corresponding to a condition or 
-        treatment
-        
+        all regions. Format: [(chrom, start, stop), (), ...]
+    quartiles : array
+        the quartile (1-4) of each region
+    rows : array
+        the row of each region within its quartile
+    largewindow : int
+        half of the profile length
+    coverage1 : list
+        coverage cache entries (coverage.Coverage) of condition 1 replicates
+    coverage2 : list
+        coverage cache entries (coverage.Coverage) of condition 2 replicates
+    mil_map1 : float
+        average millions mapped reads of condition 1
+    mil_map2 : float
+        average millions mapped reads of condition 2
+    folder : pathlib.Path
+        full path to the meta-profile folder
+    blocksize : int
+        maximum number of regions to compute profiles for at once
+
     Returns
     -------
-    posprofile1 : list
-        profile for the positive strand corresponding to condition 1. Each 
-        value in the list is a bp
-    negprofile1 : list
-        profile for the negative strand corresponding to condition 1. Each 
-        value in the list is a bp
-    posprofile2 : list
-        profile for the positive strand corresponding to condition 2. Each 
-        value in the list is a bp
-    negprofile2 : list
-        profile for the negative strand corresponding to condition 2. Each 
-        value in the list is a bp
-    Raises
-    ------
+    sums : dict
+        profile name (i.e. q1posprofile1) -> float64 sum of the profiles of 
+        the regions on this chromosome
     '''
-    key_prefix = regionlist[0]
-    regions=list()
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        for chrom, start, stop in regionlist[1:]:
-            regions.append(hts.GenomicInterval(chrom, int(start), int(stop), '.'))
-
-    hts_bam1 = list()
-    hts_bam2 = list()
-    for bam in bam1:
-        hts_bam1.append(hts.BAM_Reader(bam))
-    for bam in bam2:
-        hts_bam2.append(hts.BAM_Reader(bam))
-
-    if len(hts_bam1) == 0 or len(hts_bam2) == 0:
-        raise ValueError("One of bam1 or bam2 variables is empty.")
-
-    # posprofile1 = np.zeros(2*int(largewindow))  
-    # negprofile1 = np.zeros(2*int(largewindow))
-    # posprofile2 = np.zeros(2*int(largewindow))   
-    # negprofile2 = np.zeros(2*int(largewindow))
-    # posprofile1 = []
-    # negprofile1 = []
-    # posprofile2 = []   
-    # negprofile2 = []
-    posprofile1 = np.empty((len(regions), 2*int(largewindow)))
-    negprofile1 = np.empty((len(regions), 2*int(largewindow)))
-    posprofile2 = np.empty((len(regions), 2*int(largewindow)))
-    negprofile2 = np.empty((len(regions), 2*int(largewindow)))
-    rep1number = float(len(hts_bam1))
-    rep2number = float(len(hts_bam2))
-    for i, window in enumerate(regions):
-        avgposprofile1 = np.zeros(2*int(largewindow))
-        avgnegprofile1 = np.zeros(2*int(largewindow))
-        # i = 0
-        for sortedbamfile in hts_bam1:
-            # i += 1
-            tempposprofile = np.zeros(2*int(largewindow))
-            tempnegprofile = np.zeros(2*int(largewindow))
-            for almnt in sortedbamfile[ window ]:
-                if almnt.iv.strand == '+':
-                    start_in_window = almnt.iv.start - window.start
-                    end_in_window = almnt.iv.end - window.end \
-                                    + 2*int(largewindow)
-                    start_in_window = max( start_in_window, 0 )
-                    end_in_window = min( end_in_window, 2*int(largewindow) )
-                    tempposprofile[ start_in_window : end_in_window ] += 1.0
-                if almnt.iv.strand == '-':
-                    start_in_window = almnt.iv.start - window.start
-                    end_in_window   = almnt.iv.end - window.end \
-                                        + 2*int(largewindow)
-                    start_in_window = max( start_in_window, 0 )
-                    end_in_window = min( end_in_window, 2*int(largewindow) )
-                    tempnegprofile[ start_in_window : end_in_window ] += -1.0
-            # avgposprofile1 = [x+y for x,y in zip(avgposprofile1, tempposprofile)]
-            # avgnegprofile1 = [x+y for x,y in zip(avgnegprofile1, tempnegprofile)]
-
-            avgposprofile1 = np.add(avgposprofile1, tempposprofile)
-            avgnegprofile1 = np.add(avgnegprofile1, tempnegprofile)
-        # avgposprofile1 = [x/rep1number for x in avgposprofile1]
-        # avgnegprofile1 = [x/rep1number for x in avgnegprofile1]
-        avgposprofile1 = avgposprofile1/rep1number
-        avgnegprofile1 = avgnegprofile1/rep1number
-        # posprofile1 = [x+y for x,y in zip(posprofile1, avgposprofile1)]
-        # negprofile1 = [x+y for x,y in zip(negprofile1, avgnegprofile1)]
-        # posprofile1.append(avgposprofile1)
-        # negprofile1.append(avgnegprofile1)
-        posprofile1[i] = avgposprofile1
-        negprofile1[i] = avgnegprofile1
-
-        avgposprofile2 = np.zeros(2*int(largewindow))
-        avgnegprofile2 = np.zeros(2*int(largewindow))
-        # i = len(hts_bam1)
-        for sortedbamfile in hts_bam2:
-            # i += 1
-            tempposprofile = np.zeros(2*int(largewindow))
-            tempnegprofile = np.zeros(2*int(largewindow))
-            for almnt in sortedbamfile[ window ]:
-                if almnt.iv.strand == '+':
-                    start_in_window = almnt.iv.start - window.start
-                    end_in_window   = almnt.iv.end - window.end \
-                                        + 2*int(largewindow)
-                    start_in_window = max( start_in_window, 0 )
-                    end_in_window = min( end_in_window, 2*int(largewindow) )
-                    tempposprofile[ start_in_window : end_in_window ] += 1.0
-                if almnt.iv.strand == '-':
-                    start_in_window = almnt.iv.start - window.start
-                    end_in_window   = almnt.iv.end - window.end \
-                                        + 2*int(largewindow)
-                    start_in_window = max( start_in_window, 0 )
-                    end_in_window = min( end_in_window, 2*int(largewindow) )
-                    tempnegprofile[ start_in_window : end_in_window ] += -1.0
-            # avgposprofile2 = [x+y for x,y in zip(avgposprofile2, tempposprofile)]
-            # avgnegprofile2 = [x+y for x,y in zip(avgnegprofile2, tempnegprofile)]
-            avgposprofile2 = np.add(avgposprofile2, tempposprofile)
-            avgnegprofile2 = np.add(avgnegprofile2, tempnegprofile)
-        # avgposprofile2 = [x/rep2number for x in avgposprofile2]
-        # avgnegprofile2 = [x/rep2number for x in avgnegprofile2]
-        avgposprofile2 = avgposprofile2/rep2number
-        avgnegprofile2 = avgnegprofile2/rep2number
-        # posprofile2 = [x+y for x,y in zip(posprofile2, avgposprofile2)]
-        # negprofile2 = [x+y for x,y in zip(negprofile2, avgnegprofile2)]
-        # posprofile2.append(avgposprofile2)
-        # negprofile2.append(avgnegprofile2)
-        posprofile2[i] = avgposprofile2
-        negprofile2[i] = avgnegprofile2
-    
-    # mil_map1 = mil_map1/rep1number/1e6
-    # mil_map2 = mil_map2/rep2number/1e6
-
-    # posprofile1 = [[x/mil_map1 for x in posprofile1]]
-    # negprofile1 = [[x/mil_map1 for x in negprofile1]]
-    # posprofile2 = [[x/mil_map2 for x in posprofile2]]
-    # negprofile2 = [[x/mil_map2 for x in negprofile2]]
-
-
-    return (key_prefix + 'posprofile1', posprofile1), (key_prefix + 'negprofile1', negprofile1), (key_prefix + 'posprofile2', posprofile2), (key_prefix + 'negprofile2', negprofile2)
+    indexes = np.flatnonzero(np.array([region[0] for region in regionlist]) 
+                                == chrom)
+    profiles = {key: np.load(folder / f'{key}.npy', mmap_mode='r+') 
+                for quartile in range(1, 5) 
+                for key in profile_keys(quartile=quartile)}
+    sums = dict()
+    for block in range(0, len(indexes), blocksize):
+        block_indexes = indexes[block:block + blocksize]
+        block_regions = [regionlist[i] for i in block_indexes]
+        for condition, coverages, mil_map in [('1', coverage1, mil_map1), 
+                                                ('2', coverage2, mil_map2)]:
+            strand_profiles = region_profiles(regionlist=block_regions, 
+                                                largewindow=largewindow, 
+                                                coverages=coverages)
+            for strand, profile in zip(['pos', 'neg'], strand_profiles):
+                profile /= np.float32(mil_map)
+                for quartile in np.unique(quartiles[block_indexes]):
+                    mask = quartiles[block_indexes] == quartile
+                    key = f'q{quartile}{strand}profile{condition}'
+                    profiles[key][rows[block_indexes[mask]]] = profile[mask]
+                    sums[key] = (sums.get(key, 0) 
+                                    + profile[mask].sum(axis=0, 
+                                                        dtype=np.float64))
+    for profile in profiles.values():
+        profile.flush()
+
+    return sums
 
 #==============================================================================
-def meta_profile_bg(regionlist=None, largewindow=None, bg1=None, bg2=None):
-    '''This function returns average profiles for given regions of interest.
-        A user may input either a list of regions or a bed file
+def region_profiles(regionlist=None, largewindow=None, coverages=None, 
+                    blocksize=PROFILE_BLOCKSIZE):
+    '''Returns the per-base coverage of each strand within 2*largewindow of 
+        the start of each region, averaged over replicates. The negative 
+        strand profile is given as negative values. Regions are processed one
+        chromosome and block of regions at a time.
+
     Parameters
     ----------
     regionlist : list
-        a list of regions of interest. Format: [(chrom, start, stop), (), ...].
-        First value is special 'key_prefix' which simply keeps track of which
-        quartile we're in.
+        a list of regions of interest. Format: [(chrom, start, stop), (), ...]
     largewindow : float
-        the window with which to compute profiles for
-    bg1 : list
-        a list of full paths to bedgraph files corresponding to a condition or 
-        treatment
-    bg2 : list
-        a list of full paths to bedgraph files corresponding to a condition or 
-        treatment
-        
+        half of the profile length
+    coverages : list
+        coverage cache entries (coverage.Coverage) of replicates
+    blocksize : int
+        maximum number of regions to compute profiles for at once
+
     Returns
     -------
-    posprofile1 : list
-        profile for the positive strand corresponding to condition 1. Each 
-        value in the list is a bp
-    negprofile1 : list
-        profile for the negative strand corresponding to condition 1. Each 
-        value in the list is a bp
-    posprofile2 : list
-        profile for the positive strand corresponding to condition 2. Each 
-        value in the list is a bp
-    negprofile2 : list
-        profile for the negative strand corresponding to condition 2. Each 
-        value in the list is a bp
-    Raises
-    ------
+    posprofile : array
+        (regions x 2*largewindow) float32 positive strand profiles
+    negprofile : array
+        (regions x 2*largewindow) float32 negative strand profiles
     '''
-    from ncls import NCLS
-    number_of_regions = len(regionlist)
-    total_window = 2*int(largewindow)
-    
-    posprofile1 = np.empty((number_of_regions, total_window))
-    negprofile1 = np.empty((number_of_regions, total_window))
-    posprofile2 = np.empty((number_of_regions, total_window))
-    negprofile2 = np.empty((number_of_regions, total_window))
-
-    #Create a dictionary formatted {'chrom': rank: (start, stop, rank)}
-    region_dict = {}
-    for i, (chrom, start, stop) in enumerate(regionlist):
-        start = int(start)
-        stop = int(stop)
-        if chrom not in region_dict:
-            region_dict[chrom] = {}
-        region_dict[chrom][i] = (start, stop, i)
-
-    current_chrom = None
-    id_pointer = {}
-    for bgfile in bg1:
-        with open(bgfile, 'r') as F:
-            for i, line in enumerate(F):
-                if '#' not in line[0]:
-                    chrom, start, stop, value = line.strip().split('\t')
-                    start = int(start)
-                    stop = int(stop)
-                    value = int(value)
-                    if current_chrom == None: #If starting, initialize
-                        current_chrom = chrom
-                        id_pointer[i] = (chrom, start, stop, value)
-                        bedgraph_regions = [(start, stop, i)]
-                    elif chrom != current_chrom: #If new chrom transition:
-                        #1. Perform intersect computation
-                        reg_starts, reg_stops, reg_ids = zip(*[region_dict[chrom][i] for i in region_dict[chrom]])
-                        bg_starts, bg_stops, bg_ids = zip(*bedgraph_regions)
-                        region_ncls = NCLS(np.array(reg_starts), 
-                                            np.array(reg_stops), 
-                                            np.array(reg_ids))
-                        all_overlap_ids = region_ncls.all_overlaps_both(np.array(bg_starts), 
-                                                            np.array(bg_stops), 
-                                                            np.array(bg_ids))
-                        #2. Add profile 
-                        for i, j in np.column_stack((all_overlap_ids[0], all_overlap_ids[1])):
-                            chrom, bg_start, bg_stop, bg_value = id_pointer[i]
-                            reg_start, reg_stop, _ = region_dict[chrom][j]
-                            j_start = bg_start - reg_start if bg_start - reg_start > 0 else 0
-                            j_stop = bg_stop - reg_start if bg_stop - reg_start < total_window else total_window
-                            if bg_value > 0:
-                                posprofile1[j][j_start:j_stop] += bg_value
-                            else:
-                                negprofile1[j][j_start:j_stop] += bg_value
-                        
-                        #3. Initialize new round
-                        current_chrom = chrom
-                        id_pointer = {}
-                        id_pointer[i] = (chrom, start, stop, value)
-                        bedgraph_regions = [(start, stop, i)]
-                    else: #If in same chormosome, continue appending to list
-                        bedgraph_regions.append((start,stop,i))
-                        id_pointer[i] = (chrom, start, stop, value)
-        #Reached end of file. Perform computation and profiling 
-        #1. Perform intersect computation and profiling
-        reg_starts, reg_stops, reg_ids = zip(*[region_dict[chrom][i] for i in region_dict[chrom]])
-        bg_starts, bg_stops, bg_ids = zip(*bedgraph_regions)
-        region_ncls = NCLS(np.array(reg_starts), 
-                            np.array(reg_stops), 
-                            np.array(reg_ids))
-        all_overlap_ids = region_ncls.all_overlaps_both(np.array(bg_starts), 
-                                                        np.array(bg_stops), 
-                                                        np.array(bg_ids))
-        
-        for i, j in np.column_stack((all_overlap_ids[0], all_overlap_ids[1])):
-            chrom, bg_start, bg_stop, bg_value = id_pointer[i]
-            reg_start, reg_stop, _ = region_dict[chrom][j]
-            j_start = bg_start - reg_start if bg_start - reg_start > 0 else 0
-            j_stop = bg_stop - reg_start if bg_stop - reg_start < total_window else total_window
-            if bg_value > 0:
-                posprofile1[j][j_start:j_stop] += bg_value
-            else:
-                negprofile1[j][j_start:j_stop] += bg_value
-
-    for bgfile in bg2:
-        with open(bgfile, 'r') as F:
-            for i, line in enumerate(F):
-                if '#' not in line[0]:
-                    chrom, start, stop, value = line.strip().split('\t')
-                    start = int(start)
-                    stop = int(stop)
-                    value = int(value)
-                    if current_chrom == None: #If starting, initialize
-                        current_chrom = chrom
-                        id_pointer[i] = (chrom, start, stop, value)
-                        bedgraph_regions = [(start, stop, i)]
-                    elif chrom != current_chrom: #If new chrom transition:
-                        #1. Perform intersect computation
-                        reg_starts, reg_stops, reg_ids = zip(*[region_dict[chrom][i] for i in region_dict[chrom]])
-                        bg_starts, bg_stops, bg_ids = zip(*bedgraph_regions)
-                        region_ncls = NCLS(np.array(reg_starts), 
-                                            np.array(reg_stops), 
-                                            np.array(reg_ids))
-                        all_overlap_ids = region_ncls.all_overlaps_both(np.array(bg_starts), 
-                                                            np.array(bg_stops), 
-                                                            np.array(bg_ids))
-                        #2. Add profile 
-                        for i, j in np.column_stack((all_overlap_ids[0], all_overlap_ids[1])):
-                            chrom, bg_start, bg_stop, bg_value = id_pointer[i]
-                            reg_start, reg_stop, _ = region_dict[chrom][j]
-                            j_start = bg_start - reg_start if bg_start - reg_start > 0 else 0
-                            j_stop = bg_stop - reg_start if bg_stop - reg_start < total_window else total_window
-                            if bg_value > 0:
-                                posprofile2[j][j_start:j_stop] += bg_value
-                            else:
-                                negprofile2[j][j_start:j_stop] += bg_value
-                        
-                        #3. Initialize new round
-                        current_chrom = chrom
-                        id_pointer = {}
-                        id_pointer[i] = (chrom, start, stop, value)
-                        bedgraph_regions = [(start, stop, i)]
-                    else: #If in same chormosome, continue appending to list
-                        bedgraph_regions.append((start,stop,i))
-                        id_pointer[i] = (chrom, start, stop, value)
-        #Reached end of file. Perform computation and profiling 
-        #1. Perform intersect computation and profiling
-        reg_starts, reg_stops, reg_ids = zip(*[region_dict[chrom][i] for i in region_dict[chrom]])
-        bg_starts, bg_stops, bg_ids = zip(*bedgraph_regions)
-        region_ncls = NCLS(np.array(reg_starts), 
-                            np.array(reg_stops), 
-                            np.array(reg_ids))
-        all_overlap_ids = region_ncls.all_overlaps_both(np.array(bg_starts), 
-                                                        np.array(bg_stops), 
-                                                        np.array(bg_ids))
-        
-        for i, j in np.column_stack((all_overlap_ids[0], all_overlap_ids[1])):
-            chrom, bg_start, bg_stop, bg_value = id_pointer[i]
-            reg_start, reg_stop, _ = region_dict[chrom][j]
-            j_start = bg_start - reg_start if bg_start - reg_start > 0 else 0
-            j_stop = bg_stop - reg_start if bg_stop - reg_start < total_window else total_window
-            if bg_value > 0:
-                posprofile2[j][j_start:j_stop] += bg_value
-            else:
-                negprofile2[j][j_start:j_stop] += bg_value
-    
-    q1 = int(round(np.percentile(np.arange(1, len(regionlist),1), 25)))
-    q2 = int(round(np.percentile(np.arange(1, len(regionlist),1), 50)))
-    q3 = int(round(np.percentile(np.arange(1, len(regionlist),1), 75)))
-
-    q1posprofile1 = posprofile1[:q1]
-    q1negprofile1 = negprofile1[:q1]
-    q1posprofile2 = posprofile2[:q1]
-    q1negprofile2 = negprofile2[:q1]
-
-    q2posprofile1 = posprofile1[q1:q2]
-    q2negprofile1 = negprofile1[q1:q2]
-    q2posprofile2 = posprofile2[q1:q2]
-    q2negprofile2 = negprofile2[q1:q2]
-
-    q3posprofile1 = posprofile1[q2:q3]
-    q3negprofile1 = negprofile1[q2:q3]
-    q3posprofile2 = posprofile2[q2:q3]
-    q3negprofile2 = negprofile2[q2:q3]
-
-    q4posprofile1 = posprofile1[q3:]
-    q4negprofile1 = negprofile1[q3:]
-    q4posprofile2 = posprofile2[q3:]
-    q4negprofile2 = negprofile2[q3:]
-
-    return np.array([[('q1' + 'posprofile1', q1posprofile1), 
-                    ('q1' + 'negprofile1', q1negprofile1), 
-                    ('q1' + 'posprofile2', q1posprofile2), 
-                    ('q1' + 'negprofile2', q1negprofile2)],
-                    [('q2' + 'posprofile1', q2posprofile1), 
-                    ('q2' + 'negprofile1', q2negprofile1), 
-                    ('q2' + 'posprofile2', q2posprofile2), 
-                    ('q2' + 'negprofile2', q2negprofile2)],
-                    [('q3' + 'posprofile1', q3posprofile1), 
-                    ('q3' + 'negprofile1', q3negprofile1), 
-                    ('q3' + 'posprofile2', q3posprofile2), 
-                    ('q3' + 'negprofile2', q3negprofile2)],
-                    [('q4' + 'posprofile1', q4posprofile1), 
-                    ('q4' + 'negprofile1', q4negprofile1), 
-                    ('q4' + 'posprofile2', q4posprofile2), 
-                    ('q4' + 'negprofile2', q4negprofile2)]])
+    window = 2*int(largewindow)
+    chroms = np.array([chrom for chrom, _, _ in regionlist])
+    starts = np.array([int(start) for _, start, _ in regionlist], 
+                        dtype=np.int64)
+    posprofile = np.zeros((len(regionlist), window), dtype=np.float32)
+    negprofile = np.zeros((len(regionlist), window), dtype=np.float32)
+    for chrom in np.unique(chroms):
+        indexes = np.flatnonzero(chroms == chrom)
+        for block in range(0, len(indexes), blocksize):
+            rows = indexes[block:block + blocksize]
+            for cache_entry in coverages:
+                posprofile[rows] += cache_entry.profiles(chrom=chrom, 
+                                                        starts=starts[rows], 
+                                                        width=window, 
+                                                        strand='+')
+                negprofile[rows] -= cache_entry.profiles(chrom=chrom, 
+                                                        starts=starts[rows], 
+                                                        width=window, 
+                                                        strand='-')
+    posprofile /= len(coverages)
+    negprofile /= len(coverages)
+
+    return posprofile, negprofile
+
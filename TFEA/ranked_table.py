@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains a columnar table of ranked regions. The RANK module
+    builds the table once and saves it (.npz) next to the ranked bed file.
+    Other modules load the table rather than re-reading and splitting the bed
+    file, which is only written for users and external tools.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+from pathlib import Path
+
+import numpy as np
+
+#Constants
+#==============================================================================
+HEADER = ['#chrom', 'start', 'stop', 'fc,p-value,rank']
+
+#Functions
+#==============================================================================
+def build(chroms=None, starts=None, stops=None, fcs=None, pvals=None,
+            ranks=None):
+    '''Builds a RankedTable from per-region columns. If ranks is None,
+        regions are ranked in the order given.
+    '''
+    names, codes = np.unique(np.asarray(chroms, dtype=str),
+                                return_inverse=True)
+    if ranks is None:
+        ranks = np.arange(1, len(codes) + 1)
+
+    return RankedTable(names=names, codes=codes, starts=starts, stops=stops,
+                        fcs=fcs, pvals=pvals, ranks=ranks)
+
+#==============================================================================
+def table_path(bedfile=None):
+    '''Returns the path of the table saved alongside a ranked bed file
+    '''
+    return Path(bedfile).with_suffix('.npz')
+
+#==============================================================================
+_tables = dict()
+
+def load(bedfile=None):
+    '''Returns the ranked table of a bed file. The table saved alongside the
+        bed file is used if it is at least as new as the bed file, otherwise
+        the bed file is parsed (read_bed). Tables are cached per process.
+
+    Parameters
+    ----------
+    bedfile : str or pathlib.Path
+        full path to a ranked bed file
+
+    Returns
+    -------
+    table : RankedTable
+    '''
+    path = table_path(bedfile=bedfile)
+    bed_stat = os.stat(bedfile)
+    if path.exists() and os.stat(path).st_mtime_ns >= bed_stat.st_mtime_ns:
+        source = path
+    else:
+        source = Path(bedfile)
+    stat = os.stat(source)
+    identity = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    key = str(source)
+    if key in _tables and _tables[key][0] == identity:
+        return _tables[key][1]
+
+    if source == path:
+        with np.load(path) as data:
+            table = RankedTable(**{column: data[column]
+                                    for column in RankedTable.columns})
+    else:
+        table = read_bed(bedfile=bedfile)
+    _tables[key] = (identity, table)
+
+    return table
+
+#==============================================================================
+def read_bed(bedfile=None):
+    '''Parses a ranked bed file (chrom, start, stop, 'fc,p-value,rank'). If
+        the fourth column is missing or not in this format, fold changes and
+        p-values are NaN and regions are ranked in file order.
+    '''
+    chroms = list()
+    starts = list()
+    stops = list()
+    values = list()
+    with open(bedfile) as F:
+        for line in F:
+            if line[0] == '#' or line.strip() == '':
+                continue
+            linelist = line.strip('\n').split('\t')
+            chroms.append(linelist[0])
+            starts.append(int(linelist[1]))
+            stops.append(int(linelist[2]))
+            values.append(linelist[3].split(',') if len(linelist) > 3 else [])
+    try:
+        fcs = np.array([float(value[0]) for value in values])
+        pvals = np.array([float(value[-2]) for value in values])
+        ranks = np.array([int(value[-1]) for value in values])
+    except (ValueError, IndexError):
+        fcs = np.full(len(chroms), np.nan)
+        pvals = np.full(len(chroms), np.nan)
+        ranks = None
+
+    return build(chroms=chroms, starts=starts, stops=stops, fcs=fcs,
+                    pvals=pvals, ranks=ranks)
+
+#==============================================================================
+def read_deseq(deseq_file=None):
+    '''Parses a DE-Seq results file (as written by R's write.table) in a
+        single pass.
+
+    Parameters
+    ----------
+    deseq_file : str or pathlib.Path
+        full path to a DE-Seq results file (DESeq.res.txt)
+
+    Returns
+    -------
+    results : dict
+        'regions': list of region names (chrom:start-stop), and float arrays
+        'baseMean', 'log2FoldChange', 'fc' and 'pvalue' with NaN for
+        missing values
+    '''
+    regions = list()
+    rows = list()
+    with open(deseq_file) as F:
+        header = F.readline().strip('\n').split('\t')
+        fc_index = [i for i in range(len(header))
+                    if header[i]=='"fc"' or header[i]=='"foldChange"'][0] + 1
+        basemean_index = header.index('"baseMean"') + 1
+        log2fc_index = header.index('"log2FoldChange"') + 1
+        for line in F:
+            line = line.strip('\n').split('\t')
+            regions.append(line[0].strip('"'))
+            rows.append([line[basemean_index], line[log2fc_index],
+                            line[fc_index], line[-2]])
+
+    results = dict(regions=regions)
+    for i, column in enumerate(['baseMean', 'log2FoldChange', 'fc',
+                                'pvalue']):
+        results[column] = np.array([to_float(row[i]) for row in rows],
+                                    dtype=np.float64)
+
+    return results
+
+#==============================================================================
+def to_float(value):
+    '''Converts a string to float, returning NaN if it is not a number
+    '''
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+#Classes
+#==============================================================================
+class RankedTable:
+    '''Ranked regions stored as columns: chromosome codes into names, int32
+        start and stop, float64 fold change and p-value, and int32 rank. Rows
+        are in ranked order.
+    '''
+    columns = ['names', 'codes', 'starts', 'stops', 'fcs', 'pvals', 'ranks']
+
+    def __init__(self, names=None, codes=None, starts=None, stops=None,
+                    fcs=None, pvals=None, ranks=None):
+        self.names = np.asarray(names, dtype=str)
+        self.codes = np.asarray(codes, dtype=np.int32)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.stops = np.asarray(stops, dtype=np.int32)
+        self.fcs = np.asarray(fcs, dtype=np.float64)
+        self.pvals = np.asarray(pvals, dtype=np.float64)
+        self.ranks = np.asarray(ranks, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def chroms(self):
+        '''The chromosome of each region
+        '''
+        return self.names[self.codes]
+
+    def take(self, indexes):
+        '''Returns a table of the given rows, keeping their ranks
+        '''
+        return RankedTable(names=self.names, codes=self.codes[indexes],
+                            starts=self.starts[indexes],
+                            stops=self.stops[indexes], fcs=self.fcs[indexes],
+                            pvals=self.pvals[indexes],
+                            ranks=self.ranks[indexes])
+
+    def regions(self):
+        '''Returns a list of (chrom, start, stop) tuples
+        '''
+        return list(zip(self.chroms.tolist(), self.starts.tolist(),
+                        self.stops.tolist()))
+
+    def save(self, path):
+        '''Saves the table as an uncompressed .npz file
+        '''
+        with open(path, 'wb') as outfile:
+            np.savez(outfile, **{column: getattr(self, column)
+                                    for column in self.columns})
+
+        return path
+
+    def write_bed(self, bedfile, header=HEADER, pval_format='.12f',
+                    ranks=None, starts=None, stops=None):
+        '''Writes the table as a bed file with a header line, with the fold
+            change, p-value and rank of each region comma-separated in the
+            fourth column. Ranks, starts and stops may be replaced and the
+            header omitted (empty header).
+        '''
+        ranks = self.ranks if ranks is None else ranks
+        starts = self.starts if starts is None else starts
+        stops = self.stops if stops is None else stops
+        pvals = [format(pval, pval_format) for pval in self.pvals.tolist()]
+        with open(bedfile, 'w') as outfile:
+            if header:
+                outfile.write('\t'.join(header) + '\n')
+            outfile.writelines(f'{chrom}\t{start}\t{stop}\t{fc},{pval},{rank}\n'
+                                for chrom, start, stop, fc, pval, rank
+                                in zip(self.chroms.tolist(),
+                                        np.asarray(starts).tolist(),
+                                        np.asarray(stops).tolist(),
+                                        self.fcs.tolist(), pvals,
+                                        np.asarray(ranks).tolist()))
+
+        return bedfile
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains a persistent, content-addressed cache of motif
+    distances computed within the SCANNER module. Each entry is a float32
+    .npy file holding the distances of a single motif to every sequence within
+    a fasta file. Entries are keyed by a hash of the fasta file contents, the
+    motif itself (its record within the .meme database), the scanning function
+    and its options (p-value threshold, background, largewindow), so a cache
+    folder can be shared between projects. The cache is kept under a size
+    limit by removing the least recently used entries.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import hashlib
+from pathlib import Path
+from itertools import chain
+
+import ujson
+import numpy as np
+
+from TFEA import distance_matrix
+from TFEA import motif_database
+
+#Constants
+#==============================================================================
+#Increment if the format or meaning of cached distances changes
+VERSION = 1
+#Options passed to scanning functions that do not affect motif distances
+IGNORED_KEYWORDS = ['tempdir', 'motifdatabase']
+
+#Main Script
+#==============================================================================
+def wrap(function=None, kwargs=None, cachedir=None):
+    '''Returns a function and keyword arguments to use in place of a SCANNER
+        function when filling a distance matrix. If cachedir is False, the
+        inputs are returned unchanged.
+
+    Parameters
+    ----------
+    function : function object
+        a scanning function that takes a motif as its first argument (i.e.
+        scanner.fimo or pwm.scan)
+    kwargs : dict
+        keyword arguments to pass to function. Must contain fasta_file and
+        motifdatabase
+    cachedir : pathlib.Path or boolean
+        full path to the cache folder
+
+    Returns
+    -------
+    function : function object
+        scan_cache.scan or the original function
+    kwargs : dict
+        keyword arguments for the returned function
+    '''
+    if not cachedir:
+        return function, kwargs
+
+    Path(cachedir).mkdir(exist_ok=True, parents=True)
+    cache_keywords = dict(function=function, kwargs=kwargs,
+                            cachedir=cachedir,
+                            key=options_key(function=function, kwargs=kwargs))
+
+    return scan, cache_keywords
+
+#==============================================================================
+def scan(motif, function=None, kwargs=None, cachedir=None, key=None):
+    '''Returns the distances of a single motif from the cache if present.
+        Otherwise runs function and stores its distances in the cache.
+
+    Parameters
+    ----------
+    motif : str
+        the name of a motif within the motif database
+    function : function object
+        the scanning function to run on a cache miss
+    kwargs : dict
+        keyword arguments to pass to function
+    cachedir : pathlib.Path
+        full path to the cache folder
+    key : str
+        hash of the scanning options, output of options_key
+
+    Returns
+    -------
+    motif : str
+        the name of the motif
+    distances : array
+        float32 array of motif distances, NaN where there was no hit
+    '''
+    digest = hashlib.sha1((key + motif_record(
+                                    motifdatabase=kwargs['motifdatabase'],
+                                    motif=motif)).encode()).hexdigest()
+    entry = Path(cachedir) / (digest + '.npy')
+    try:
+        distances = np.load(entry)
+        os.utime(entry)
+        return [motif, distances]
+    except (OSError, ValueError):
+        pass
+
+    result = function(motif, **kwargs)
+    if len(result) == 2 and isinstance(result[1], np.ndarray):
+        distances = result[1].astype(np.float32)
+    else:
+        distances = distance_matrix.list_to_row(result[1:])
+
+    #Write then rename so that concurrent runs never read a partial entry.
+    #Temporary files do not end in .npy so that evict never removes them
+    temp_entry = entry.with_name(f'{digest}.{os.getpid()}.tmp')
+    with open(temp_entry, 'wb') as outfile:
+        np.save(outfile, distances)
+    os.replace(temp_entry, entry)
+
+    return [result[0], distances]
+
+#Functions
+#==============================================================================
+def options_key(function=None, kwargs=None):
+    '''Hashes the scanning function and all options that affect the motif
+        distances it returns. Files (i.e. the fasta file and background file)
+        are hashed by their contents.
+    '''
+    fields = dict(version=VERSION,
+                    function=function.__module__ + '.' + function.__name__)
+    for name, value in sorted(kwargs.items()):
+        if name in IGNORED_KEYWORDS:
+            continue
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif (isinstance(value, (str, Path)) and str(value) != ''
+                and os.path.isfile(value)):
+            value = file_hash(path=value)
+        fields[name] = str(value)
+
+    return hashlib.sha1(ujson.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+#==============================================================================
+def file_hash(path=None, blocksize=2**20):
+    '''Returns the sha1 hex digest of the contents of a file
+    '''
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as F:
+        for block in iter(lambda: F.read(blocksize), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+#==============================================================================
+def motif_record(motifdatabase=None, motif=None):
+    '''Returns the text defining a single motif within a .meme database: the
+        database header (alphabet, strands and background) followed by the
+        motif's own lines. Databases are read once per process.
+    '''
+    database = motif_database.load(motifdatabase=motifdatabase)
+    if motif not in database:
+        return motif
+
+    return database.record(motif)
+
+#==============================================================================
+def evict(cachedir=None, max_size=None):
+    '''Removes the least recently used cache entries, including markov 
+        background files, until the total size of the cache is below max_size.
+
+    Parameters
+    ----------
+    cachedir : pathlib.Path
+        full path to the cache folder
+    max_size : float
+        maximum size of the cache in gigabytes
+
+    Returns
+    -------
+    removed : int
+        the number of entries removed
+    '''
+    entries = list()
+    for entry in chain(Path(cachedir).glob('*.npy'), 
+                        Path(cachedir).glob('markov_background.*.txt')):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    max_bytes = max_size*1024**3
+    removed = 0
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            entry.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+
+    return removed
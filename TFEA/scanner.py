@@ -19,8 +19,8 @@ import os
 import sys
 import time
 import datetime
+import hashlib
 import subprocess
-import traceback
 from pathlib import Path
 
 import numpy as np
@@ -29,19 +29,30 @@ from pybedtools import featurefuncs
 
 from TFEA import multiprocess
 from TFEA import exceptions
+from TFEA import distance_matrix
+from TFEA import genome_fasta
+from TFEA import genomehits_index
+from TFEA import markov
+from TFEA import pwm
+from TFEA import ranked_table
+from TFEA import scan_cache
 
 #Main Script
 #==============================================================================
 def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False, 
-            ranked_file=None, md_bedfile1=None, md_bedfile2=None, 
+            mdd_fasta1=False, mdd_fasta2=False, ranked_file=None, 
+            md_bedfile1=None, md_bedfile2=None, mdd_bedfile1=None, 
+            mdd_bedfile2=None, 
             scanner=None, md=None, largewindow=None, smallwindow=None, 
             genomehits=None, fimo_background=None, genomefasta=None, 
             tempdir=None, fimo_motifs=None, singlemotif=None, fimo_thresh=None,
-            debug=None, mdd=None, jobid=None, cpus=None):
+            debug=None, mdd=None, jobid=None, cpus=None, cachedir=None, 
+            cache_size=None):
     '''This is the main script of the SCANNER module. It returns motif distances
         to regions of interest by either scanning fasta files on the fly using
-        fimo or homer or by using bedtools closest on a center bed file and 
-        a database of bed files corresponding to motif hits across the genome
+        fimo or homer or by finding the closest hit to the center of each 
+        region within a database of bed files corresponding to motif hits 
+        across the genome
 
     Parameters
     ----------
@@ -55,11 +66,17 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
     md_fasta2 : str
         Full path to a fasta file corresponding to a single condition. Only 
         required if md score analysis desired
+    mdd_fasta1 : str
+        Full path to a fasta file corresponding to a single condition. Only 
+        required if mdd score analysis desired
+    mdd_fasta2 : str
+        Full path to a fasta file corresponding to a single condition. Only 
+        required if mdd score analysis desired
     ranked_file : str
         Full path to a ranked bed file used in calculating background for 
         fimo scanning. Only necessary if fimo scanning desired
     scanner : str
-        Scanning method desired
+        Scanning method desired ('fimo', 'pwm' or 'genome hits')
     md : boolean
         Whether md score analysis is desired. If True, requires bed files for
         each condition. These can be generated in the COMBINE module.
@@ -71,11 +88,14 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
         motif hits
     genomehits : str
         Full path to a folder containing bed files of motif hits across the 
-        genome
+        genome, or to an index of such a folder created with 
+        'TFEA index-genomehits'
     fimo_background : int, str, or boolean
         Defines whether to use a background file when performing fimo motif
         scanning. A user can specify any int for window size, smallwindow, 
-        largewindow, or False if not desired.
+        largewindow, the full path to a MEME background file, or False if not 
+        desired. If fasta files are given instead of bed files, the 
+        background is computed from the ranked sequences
     genomefasta : str
         Full path to a fasta file for desired genome
     tempdir : str
@@ -91,24 +111,23 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
     debug : boolean
         Whether to print debug statements specifically within the multiprocess
         module
+    cachedir : str or boolean
+        Full path to a folder used to cache motif distances between runs, or 
+        False if not desired. Only used with the 'fimo' and 'pwm' scanners
+    cache_size : float
+        Maximum size of cachedir in gigabytes. Least recently used entries 
+        are removed once scanning is complete
 
     Returns
     -------
-    motif_distances : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
-    md_distances1 : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
-    md_distances2 : list of lists
-        A list containing a list for each motif scanned. For each motif, the 
-        list begins with the motif name as a string and is followed by int
-        values corresponding to the motif distance for each region (ranked). A
-        '.' value means the motif was not within the given region
+    motif_distances : DistanceMatrix
+        A handle to a memory-mapped (motifs x regions) float32 matrix 
+        containing the motif distance for each region (ranked). A NaN value 
+        means the motif was not within the given region
+    md_distances1 : DistanceMatrix
+        Same as motif_distances for the regions of a single condition
+    md_distances2 : DistanceMatrix
+        Same as motif_distances for the regions of a single condition
 
     Raises
     ------
@@ -146,6 +165,8 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
         pvals = config.vars['PVALS']
         cpus = config.vars['CPUS']
         jobid = config.vars['JOBID']
+        cachedir = config.vars['SCAN_CACHE']
+        cache_size = config.vars['SCAN_CACHE_SIZE']
 
     print("Scanning regions using " + scanner + "...", flush=True, file=sys.stderr)
 
@@ -155,54 +176,67 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
     mdd_distances1 = None
     mdd_distances2 = None
 
-    if not fasta_file and scanner != 'genome hits':
-        fasta_file = getfasta(bedfile=ranked_file, genomefasta=genomefasta, 
-                                tempdir=tempdir, outname='ranked_file.fa')
-        if os.stat(fasta_file).st_size == 0:
-            raise exceptions.FileEmptyError("Error in SCANNER module. Converting RANKED_FILE to fasta failed.")
-    if md:
-        if not md_fasta1:
-            md_fasta1 = getfasta(bedfile=md_bedfile1, genomefasta=genomefasta, 
-                                tempdir=tempdir, outname='md1_fasta.fa')
-        if not md_fasta2:
-            md_fasta2 = getfasta(bedfile=md_bedfile2, genomefasta=genomefasta, 
-                                tempdir=tempdir, outname='md2_fasta.fa')
-        if os.stat(md_fasta1).st_size == 0 or os.stat(md_fasta2).st_size == 0:
-            raise exceptions.FileEmptyError("Error in SCANNER module. Converting MD bedfiles to fasta failed.")
-    if mdd:
-        if not mdd_fasta1:
-            mdd_fasta1 = getfasta(bedfile=mdd_bedfile1, genomefasta=genomefasta, 
-                                tempdir=tempdir, outname='mdd1_fasta.fa')
-        if not mdd_fasta2:
-            mdd_fasta2 = getfasta(bedfile=mdd_bedfile2, genomefasta=genomefasta, 
-                                tempdir=tempdir, outname='mdd2_fasta.fa')
-        if os.stat(mdd_fasta1).st_size == 0 or os.stat(mdd_fasta2).st_size == 0:
-            raise exceptions.FileEmptyError("Error in SCANNER module. Converting MDD bedfiles to fasta failed.")
-
-    #FIMO
-    if scanner == 'fimo':
-        #Get background file, if none desired set to 'None'
-        if fasta_file and fimo_background:
-            background_file = fasta_markov(tempdir=tempdir, fastafile=fasta_file, order='1')
+    #FIMO or PWM
+    if scanner == 'fimo' or scanner == 'pwm':
+        #Extract the sequences of the ranked, MD and MDD regions (or read the 
+        #fasta files given instead) into a single buffer
+        region_sets = [(fasta_file, ranked_file, 'RANKED_FILE', 'ranked_file')]
+        outnames = ['motif_distances.npy']
+        if md:
+            region_sets += [(md_fasta1, md_bedfile1, 'MD bedfiles', 'md1_fasta'), 
+                            (md_fasta2, md_bedfile2, 'MD bedfiles', 'md2_fasta')]
+            outnames += ['md_distances1.npy', 'md_distances2.npy']
+        if mdd:
+            region_sets += [(mdd_fasta1, mdd_bedfile1, 'MDD bedfiles', 'mdd1_fasta'), 
+                            (mdd_fasta2, mdd_bedfile2, 'MDD bedfiles', 'mdd2_fasta')]
+            outnames += ['mdd_distances1.npy', 'mdd_distances2.npy']
+        buffer, offsets, bounds, names = genome_fasta.read_sets(
+                        sets=[(fasta, bedfile) for fasta, bedfile, _, _ 
+                                in region_sets], genomefasta=genomefasta, 
+                        indexdir=cachedir if cachedir else tempdir)
+        for i, (_, _, label, _) in enumerate(region_sets):
+            if bounds[i + 1] == bounds[i]:
+                raise exceptions.FileEmptyError(f"Error in SCANNER module. Converting {label} to fasta failed.")
+        ranked_buffer = buffer[:offsets[bounds[1]]]
+
+        #Get background file, if none desired set to 'None'. The PWM scanner 
+        #only uses 0-order frequencies, which are computed in-process for the 
+        #ranked sequences and otherwise read from the background file
+        background = None
+        if scanner == 'pwm' and fasta_file and fimo_background:
+            background = pwm.frequencies(codes=pwm.encode(ranked_buffer))
+            background_file = None
+        elif fasta_file and fimo_background:
+            background_file = markov.cached_background(
+                        cachedir=cachedir if cachedir else tempdir, 
+                        fields=dict(sequences=markov.buffer_hash(
+                                                        buffer=ranked_buffer)), 
+                        sequences=lambda: ranked_buffer, order=1, 
+                        source='ranked regions')
         elif fimo_background == 'largewindow':
             background_file = fimo_background_file(
                                 window=int(largewindow), 
                                 tempdir=tempdir, bedfile=ranked_file, 
-                                genomefasta=genomefasta, order='1')
+                                genomefasta=genomefasta, order=1, 
+                                cachedir=cachedir)
         elif fimo_background == 'smallwindow':
             background_file = fimo_background_file(
                                 window=int(smallwindow), 
                                 tempdir=tempdir, bedfile=ranked_file, 
-                                genomefasta=genomefasta, order='1')
+                                genomefasta=genomefasta, order=1, 
+                                cachedir=cachedir)
         elif type(fimo_background) == int:
             background_file = fimo_background_file(
                                 window=fimo_background, 
                                 tempdir=tempdir, bedfile=ranked_file, 
-                                genomefasta=genomefasta, order='1')
-        elif type(fimo_background) == str:
+                                genomefasta=genomefasta, order=1, 
+                                cachedir=cachedir)
+        elif fimo_background and type(fimo_background) == str:
             background_file = fimo_background
         else:
             background_file = None
+        if scanner == 'pwm' and background_file:
+            background = pwm.read_background(bgfile=background_file)
 
         #Get motifs to scan through
         if singlemotif != False:
@@ -210,86 +244,88 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
         else:
             motif_list = fimo_motif_names(motifdatabase=fimo_motifs)
 
-        #Perform fimo on desired motifs
-        print("\tTFEA:", file=sys.stderr)
-        fimo_keywords = dict(bg_file=background_file, fasta_file=fasta_file, 
-                            tempdir=tempdir, motifdatabase=fimo_motifs, 
-                            thresh=fimo_thresh, 
-                            largewindow=largewindow)
-
-        motif_distances = multiprocess.main(function=fimo, args=motif_list, 
-                                            kwargs=fimo_keywords, debug=debug, 
-                                            jobid=jobid, cpus=cpus)
+        if scanner == 'pwm':
+            scan_function = pwm.scan
+            scan_keywords = dict(background=background, 
+                                motifdatabase=fimo_motifs, 
+                                thresh=fimo_thresh, largewindow=largewindow)
+        else:
+            scan_function = fimo
+            scan_keywords = dict(bg_file=background_file, tempdir=tempdir, 
+                                motifdatabase=fimo_motifs, 
+                                thresh=fimo_thresh, largewindow=largewindow)
+
+        #The ranked regions are scanned as they are, as when MD and MDD are 
+        #off, so that their scan cache entries do not depend on the MD and MDD
+        #options. Distinct MD and then MDD sequences that were not already 
+        #scanned are scanned once per group and motif distances are projected 
+        #back onto each region set. Sequences are only written as fasta for 
+        #FIMO
+        groups = [('ranked_file', 'TFEA', [0], 'motif_distances.npy')]
+        if md:
+            groups.append(('md_regions', 'MD', [1, 2], 
+                            'md_unique_distances.npy'))
+        if mdd:
+            groups.append(('mdd_regions', 'MDD', [len(region_sets) - 2, 
+                                                    len(region_sets) - 1], 
+                            'mdd_unique_distances.npy'))
+        scan_sets, columns = scan_groups(groups=groups, buffer=buffer, 
+                                            offsets=offsets, bounds=bounds)
 
-        #FIMO for md score fasta files
+        #Perform fimo on desired motifs
+        sources = list()
+        for (outname, label, _, filename), positions in zip(groups, scan_sets):
+            if len(positions) == 0:
+                continue
+            scan_buffer = genome_fasta.subset(buffer=buffer, offsets=offsets, 
+                                                positions=positions)
+            scan_names = [names[position] for position in positions.tolist()]
+            print(f"\t{label} ({len(scan_names)} regions):", file=sys.stderr)
+            if scanner == 'pwm':
+                scan_fasta = genome_fasta.write_sequences(
+                                path=tempdir / (outname + genome_fasta.SUFFIX), 
+                                buffer=scan_buffer)
+            else:
+                scan_fasta = genome_fasta.write_fasta(
+                                path=tempdir / (outname + '.fa'), 
+                                buffer=scan_buffer, 
+                                offsets=genome_fasta.sequence_offsets(
+                                                            buffer=scan_buffer), 
+                                names=scan_names)
+            fimo_keywords = dict(scan_keywords, fasta_file=scan_fasta)
+            function, keywords = scan_cache.wrap(function=scan_function, 
+                                            kwargs=fimo_keywords, 
+                                            cachedir=cachedir)
+            sources.append(distance_matrix.fill(function=function, 
+                                        motifs=motif_list, 
+                                        regions=len(scan_names), 
+                                        path=tempdir / filename, 
+                                        kwargs=keywords, debug=debug, 
+                                        jobid=jobid, cpus=cpus))
+
+        matrices = [sources[0]]
+        for i, outname in enumerate(outnames[1:], 1):
+            matrices.append(distance_matrix.project(source=sources, 
+                                    indices=columns[bounds[i]:bounds[i + 1]], 
+                                    path=tempdir / outname))
+
+        motif_distances = matrices[0]
         if md:
-            print("\tMD:", file=sys.stderr)
-            fimo_keywords = dict(bg_file=background_file, fasta_file=md_fasta1, 
-                            tempdir=tempdir, motifdatabase=fimo_motifs, 
-                            thresh=fimo_thresh, 
-                            largewindow=largewindow)
-            md_distances1 = multiprocess.main(function=fimo, args=motif_list, 
-                                                kwargs=fimo_keywords, 
-                                                debug=debug, jobid=jobid, 
-                                                cpus=cpus)
-            
-            fimo_keywords = dict(bg_file=background_file, fasta_file=md_fasta2, 
-                            tempdir=tempdir, motifdatabase=fimo_motifs, 
-                            thresh=fimo_thresh, 
-                            largewindow=largewindow)
-            md_distances2 = multiprocess.main(function=fimo, args=motif_list, 
-                                                kwargs=fimo_keywords, 
-                                                debug=debug, jobid=jobid,
-                                                cpus=cpus)
-            
+            md_distances1, md_distances2 = matrices[1:3]
             if use_config:
                 config.vars['MD_DISTANCES1'] = md_distances1
                 config.vars['MD_DISTANCES2'] = md_distances2
-        
+
         if mdd:
-            print("\tMDD:", file=sys.stderr)
-            print(f'\t Completed: 0/{len(motif_distances)} ', end=' ', file=sys.stderr)
-            fimo_keywords = dict(bg_file=background_file, fasta_file=mdd_fasta1, 
-                            tempdir=tempdir, motifdatabase=fimo_motifs, 
-                            thresh=fimo_thresh, 
-                            largewindow=largewindow)
-            mdd_distances1 = multiprocess.main(function=fimo, args=motif_list, 
-                                                kwargs=fimo_keywords, 
-                                                debug=debug, jobid=jobid,
-                                                cpus=cpus)
-            
-            fimo_keywords = dict(bg_file=background_file, fasta_file=mdd_fasta2, 
-                            tempdir=tempdir, motifdatabase=fimo_motifs, 
-                            thresh=fimo_thresh, 
-                            largewindow=largewindow)
-            mdd_distances2 = multiprocess.main(function=fimo, args=motif_list, 
-                                                kwargs=fimo_keywords, 
-                                                debug=debug, jobid=jobid,
-                                                cpus=cpus)
-            # mdd_distances1 = []
-            # mdd_distances2 = []
-            # mdd_sorted_indices = np.argsort(pvals)
-            # for i, single_motif_distances in enumerate(motif_distances, 1):
-            #     motif = single_motif_distances[0]
-            #     mdd_distances = single_motif_distances[1:]
-            #     print("pval len:", len(pvals), file=sys.stderr)
-            #     print("mdd_indices len:", len(mdd_sorted_indices), file=sys.stderr)
-            #     print("mdd_dist len:", len(mdd_distances), file=sys.stderr)
-            #     mdd_sorted_distances = [mdd_distances[i] for i in mdd_sorted_indices]
-            #     if mdd_percent != False:
-            #         cutoff = int(len(mdd_sorted_distances)*mdd_percent)
-            #         mdd_distances2.append([motif] + mdd_sorted_distances[:cutoff])
-            #         mdd_distances1.append([motif] + mdd_sorted_distances[cutoff:])
-            #     else:
-            #         sorted_pvals = [pvals[i] for i in mdd_sorted_indices]
-            #         cutoff = int(len([p for p in sorted_pvals if p < mdd_pval]))
-            #         mdd_distances2.append([motif] + mdd_sorted_distances[:cutoff])
-            #         mdd_distances1.append([motif] + mdd_sorted_distances[cutoff:])
-            #     # print(f'\r\t Completed: {i}/{len(motif_distances)} ', end=' ', flush=True, file=sys.stderr)
+            mdd_distances1, mdd_distances2 = matrices[-2:]
             if use_config:
                 config.vars['MDD_DISTANCES1'] = mdd_distances1
                 config.vars['MDD_DISTANCES2'] = mdd_distances2
-            
+
+        #Keep the scan cache under its size limit
+        if cachedir:
+            scan_cache.evict(cachedir=cachedir, max_size=cache_size)
+
     #HOMER
     elif scanner== 'homer':
         raise exceptions.InputError("Homer scanning is not supported at this time.")
@@ -297,81 +333,73 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
     #GENOME HITS
     elif scanner == 'genome hits':
         #Get motifs to analyze
-        if singlemotif == False:
+        if singlemotif == False and genomehits_index.is_index(genomehits):
+            motif_list = genomehits_index.motifs(genomehits=genomehits)
+        elif singlemotif == False:
             motif_list = os.listdir(genomehits)
         else:
             motif_list = [os.path.join(genomehits, motif) for motif in singlemotif.split(',')]
 
-        #Perform bedtools closest to get distances
-        ranked_file = get_center(bedfile=ranked_file, outname=ranked_file)
+        #Find the closest motif hit to the center of each region
         print("\tTFEA:", file=sys.stderr)
-        bedtools_distance_keywords = dict(genomehits=genomehits, 
-                                            ranked_center_file=ranked_file, 
-                                            tempdir=tempdir, 
-                                            distance_cutoff=largewindow, 
-                                            rank_index=3)
+        closest_keywords = dict(genomehits=genomehits, bedfile=ranked_file, 
+                                distance_cutoff=largewindow, 
+                                rank_index=3)
         
-        motif_distances = multiprocess.main(function=bedtools_closest, 
-                                            args=motif_list, 
-                                            kwargs=bedtools_distance_keywords, 
-                                            debug=debug, jobid=jobid,
-                                            cpus=cpus)
+        motif_distances = distance_matrix.fill(function=closest, 
+                                    motifs=motif_list, 
+                                    regions=bed_linecount(bedfile=ranked_file),
+                                    path=tempdir / 'motif_distances.npy',
+                                    kwargs=closest_keywords, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
 
         #GENOME HITS for md score bed files
         if md:
             print("\tMD:", file=sys.stderr)
-            md_bedfile1 = get_center(bedfile=md_bedfile1, outname=md_bedfile1)
-            bedtools_distance_keywords = dict(genomehits=genomehits, 
-                                                ranked_center_file=md_bedfile1, 
-                                                tempdir=tempdir, 
-                                                distance_cutoff=largewindow)
-
-            md_distances1 = multiprocess.main(function=bedtools_closest, 
-                                            args=motif_list, 
-                                            kwargs=bedtools_distance_keywords, 
-                                            debug=debug, jobid=jobid,
-                                            cpus=cpus)
-
-            md_bedfile2 = get_center(bedfile=md_bedfile2, outname=md_bedfile2)
-            bedtools_distance_keywords = dict(genomehits=genomehits, 
-                                                ranked_center_file=md_bedfile2, 
-                                                tempdir=tempdir, 
-                                                distance_cutoff=largewindow)
-
-            md_distances2 = multiprocess.main(function=bedtools_closest, 
-                                            args=motif_list, 
-                                            kwargs=bedtools_distance_keywords, 
-                                            debug=debug, jobid=jobid,
-                                            cpus=cpus)
+            closest_keywords = dict(genomehits=genomehits, bedfile=md_bedfile1, 
+                                    distance_cutoff=largewindow)
+
+            md_distances1 = distance_matrix.fill(function=closest, 
+                                    motifs=motif_list, 
+                                    regions=bed_linecount(bedfile=md_bedfile1),
+                                    path=tempdir / 'md_distances1.npy',
+                                    kwargs=closest_keywords, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
+
+            closest_keywords = dict(genomehits=genomehits, bedfile=md_bedfile2, 
+                                    distance_cutoff=largewindow)
+
+            md_distances2 = distance_matrix.fill(function=closest, 
+                                    motifs=motif_list, 
+                                    regions=bed_linecount(bedfile=md_bedfile2),
+                                    path=tempdir / 'md_distances2.npy',
+                                    kwargs=closest_keywords, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
             if use_config:
                 config.vars['MD_DISTANCES1'] = md_distances1
                 config.vars['MD_DISTANCES2'] = md_distances2
         if mdd:
             print("\tMDD:", file=sys.stderr)
             print(f'\t Completed: 0/{len(motif_distances)} ', end=' ', file=sys.stderr)
-            mdd_bedfile1 = get_center(bedfile=mdd_bedfile1, outname=mdd_bedfile1)
-            bedtools_distance_keywords = dict(genomehits=genomehits, 
-                                                ranked_center_file=mdd_bedfile1, 
-                                                tempdir=tempdir, 
-                                                distance_cutoff=largewindow)
-
-            mdd_distances1 = multiprocess.main(function=bedtools_closest, 
-                                            args=motif_list, 
-                                            kwargs=bedtools_distance_keywords, 
-                                            debug=debug, jobid=jobid,
-                                            cpus=cpus)
-
-            mdd_bedfile2 = get_center(bedfile=mdd_bedfile2, outname=mdd_bedfile2)
-            bedtools_distance_keywords = dict(genomehits=genomehits, 
-                                                ranked_center_file=mdd_bedfile2, 
-                                                tempdir=tempdir, 
-                                                distance_cutoff=largewindow)
-
-            mdd_distances2 = multiprocess.main(function=bedtools_closest, 
-                                            args=motif_list, 
-                                            kwargs=bedtools_distance_keywords, 
-                                            debug=debug, jobid=jobid,
-                                            cpus=cpus)
+            closest_keywords = dict(genomehits=genomehits, bedfile=mdd_bedfile1, 
+                                    distance_cutoff=largewindow)
+
+            mdd_distances1 = distance_matrix.fill(function=closest, 
+                                    motifs=motif_list, 
+                                    regions=bed_linecount(bedfile=mdd_bedfile1),
+                                    path=tempdir / 'mdd_distances1.npy',
+                                    kwargs=closest_keywords, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
+
+            closest_keywords = dict(genomehits=genomehits, bedfile=mdd_bedfile2, 
+                                    distance_cutoff=largewindow)
+
+            mdd_distances2 = distance_matrix.fill(function=closest, 
+                                    motifs=motif_list, 
+                                    regions=bed_linecount(bedfile=mdd_bedfile2),
+                                    path=tempdir / 'mdd_distances2.npy',
+                                    kwargs=closest_keywords, 
+                                    debug=debug, jobid=jobid, cpus=cpus)
             # mdd_distances1 = []
             # mdd_distances2 = []
             # mdd_sorted_indices = np.argsort(pvals)
@@ -423,51 +451,62 @@ def main(use_config=True, fasta_file=False, md_fasta1=False, md_fasta2=False,
 
 #Functions
 #==============================================================================
-def getfasta(bedfile=None, genomefasta=None, tempdir=None, outname=None):
-    '''Converts a bed file to a fasta file using bedtools. Outputs into the 
-        tempdir directory created by TFEA.
+def scan_groups(groups=None, buffer=None, offsets=None, bounds=None):
+    '''Chooses the sequences to scan for each group of region sets. All 
+        sequences of the first group are scanned. Each later group scans its
+        distinct sequences that were not scanned by an earlier group.
 
     Parameters
     ----------
-    bedfile : string
-        full path to a bed file
-
-    genomefasta : string
-        full path to a fasta file for the genome of interest
-        
-    tempdir : string
-        full path to temp directory in output directory (created by TFEA)
+    groups : list
+        (outname, label, set indexes, filename) for each group, where set 
+        indexes are consecutive sets within buffer
+    buffer : array
+        uint8 array of the sequences of all region sets
+    offsets : array
+        int64 array with the start of each sequence within buffer
+    bounds : array
+        int64 array with the index of the first sequence of each set
 
     Returns
     -------
-    ranked_file_fasta : string 
-        full path to a fasta file containing the inputted bed file regions in 
-        fasta format 
+    scan_sets : list
+        int64 array of the sequences (indexes within buffer) to scan for each
+        group
+    columns : array
+        int64 array with the column of each sequence within the distance 
+        matrices of all groups placed side by side
     '''
-    fasta_file = tempdir / outname
-    #pybedtools implementation (incomplete)
-    # pybed = BedTool(bedfile).sequence(fi=genomefasta).saveas(fasta_file)
-
-    getfasta_command = ["bedtools", "getfasta",
-                        "-fi", genomefasta, 
-                        "-bed", bedfile,
-                        "-fo", fasta_file]
-    
-    try:
-        subprocess.run(getfasta_command, check=True, 
-                        stdout=subprocess.PIPE, 
-                        stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        raise exceptions.SubprocessError(e.stderr.decode())
+    _, indexes = genome_fasta.unique(buffer=buffer, offsets=offsets)
+    column = np.full(indexes.max() + 1 if len(indexes) else 0, -1, 
+                        dtype=np.int64)
+    scan_sets = list()
+    scanned = 0
+    for i, (_, _, sets, _) in enumerate(groups):
+        positions = np.arange(bounds[sets[0]], bounds[sets[-1] + 1])
+        if i == 0:
+            scan = positions
+        else:
+            ids, first = np.unique(indexes[positions], return_index=True)
+            first = first[column[ids] == -1]
+            scan = positions[np.sort(first)]
+        scan_ids = indexes[scan]
+
+        #The first of duplicate sequences within a group is used
+        new = column[scan_ids] == -1
+        new_ids, first = np.unique(scan_ids[new], return_index=True)
+        column[new_ids] = scanned + np.flatnonzero(new)[first]
+        scan_sets.append(scan)
+        scanned += len(scan)
 
-    return fasta_file
+    return scan_sets, column[indexes]
 
 #==============================================================================
-def fasta_linecount(fastafile=None):
+def bed_linecount(bedfile=None):
     linecount = 0
-    with open(fastafile) as F:
+    with open(bedfile) as F:
         for line in F:
-            if line[0] == '>':
+            if line[0] != '#' and line.strip() != '':
                 linecount += 1
     
     return linecount
@@ -484,61 +523,38 @@ def fasta_names(fastafile=None):
             
 #==============================================================================
 def fimo_background_file(window=None, tempdir=None, bedfile=None, 
-                            genomefasta=None, order=None):
-    background_bed_file = tempdir / "fimo_background.bed"
-    outfile = open(background_bed_file,'w')
-    with open(bedfile) as F:
-        F.readline()
-        for line in F:
-            chrom, start, stop, name = line.strip('\n').split('\t')
-            center = (int(start)+int(stop))/2
-            start = int(center - window)
-            stop = int(center + window)
-            outfile.write('\t'.join([chrom, str(start), str(stop), name]) + '\n')
-    outfile.close()
-    
-    getfasta(bedfile=background_bed_file, 
-                                genomefasta=genomefasta, tempdir=tempdir, 
-                                outname='fimo_background.fa')
-
-    fasta_file = tempdir / 'fimo_background.fa'
-    background_file = fasta_markov(tempdir=tempdir, fastafile=fasta_file, 
-                                    order=order)
+                            genomefasta=None, order=None, cachedir=None):
+    '''Returns a markov background file computed from windows around the 
+        center of each region within a bed file. Windows are only extracted 
+        from the genome if the background is not already within cachedir 
+        (tempdir if not given).
+    '''
+    table = ranked_table.load(bedfile=bedfile)
+    centers = (table.starts.astype(np.int64) + table.stops)/2
+    starts = (centers - window).astype(np.int64)
+    stops = (centers + window).astype(np.int64)
+    regions = hashlib.sha1()
+    for column in [table.chroms.astype('U'), starts, stops]:
+        regions.update(np.ascontiguousarray(column).data)
+
+    def sequences():
+        buffer, _ = genome_fasta.extract(genomefasta=genomefasta, 
+                                chroms=table.chroms, starts=starts, 
+                                stops=stops, 
+                                indexdir=cachedir if cachedir else tempdir)
+        return buffer
+
+    background_file = markov.cached_background(
+                        cachedir=cachedir if cachedir else tempdir, 
+                        fields=dict(genome=markov.genome_key(
+                                                    genomefasta=genomefasta), 
+                                    regions=regions.hexdigest(), 
+                                    window=int(window)), 
+                        sequences=sequences, order=order, 
+                        source=f'{bedfile} ({window}bp windows)')
     
     return background_file
 
-#==============================================================================
-def fasta_markov(tempdir=None, fastafile=None, order=None):
-    '''This function runs meme's fasta-get-markov function that generates a 
-        background markov file (for use with fimo) from a fasta file.
-
-    Parameters
-    ----------
-    tempdir : string
-        full path to temp directory in output directory (created by TFEA)
-
-    fastafile : string
-        full path to fasta file that will be used to generate the markov
-        background model file
-
-    order : string
-        an integer formatted as a string where a user may specify what order
-        markov model they would like (default='0')
-        
-    Returns
-    -------
-    None
-    '''
-    markov_background = tempdir / "markov_background.txt"
-    try:
-        with open(markov_background, 'w') as output:
-            subprocess.run(["fasta-get-markov", "-m", order, fastafile],
-                            stdout=output, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        raise exceptions.SubprocessError(e.stderr.decode())
-        
-    return markov_background
-
 #==============================================================================
 def fimo(motif, bg_file=None, fasta_file=None, tempdir=None, 
         motifdatabase=None, thresh=None, largewindow=None):
@@ -741,64 +757,211 @@ def fimo_parse_stdout(fimo_stdout=None, largewindow=None, retain='score',
     return distances
 
 #==============================================================================
-def bedtools_closest(motif, genomehits=None, ranked_center_file=None, 
-                        tempdir=None, distance_cutoff=None, rank_index=None):
-    '''Calculates nearest motif hit from a bed file. TFEA provides this 
-        function with a bed file containing the center of the inputted regions.
+def closest(motif, genomehits=None, bedfile=None, distance_cutoff=None, 
+            rank_index=None, width=100):
+    '''Calculates the distance from the center of each region in a bed file
+        to the nearest motif hit within a bed file of genome-wide motif hits.
+        Distances follow the conventions of 'bedtools closest -D ref -t first' 
+        on a bed file of region centers: 0 when a hit overlaps the center, 
+        negative when the nearest hit is upstream and positive when 
+        downstream.
 
     Parameters
     ----------
-    TFresults : list of lists
-        contains calculated enrichment scores for all TFs of interest specified
-        by the user
-        
+    motif : str
+        the name of a bed file within genomehits containing motif hits
+    genomehits : pathlib.Path
+        full path to a folder containing bed files of motif hits across the
+        genome or to an index created by genomehits_index.build
+    bedfile : str
+        full path to a bed file of regions
+    distance_cutoff : int
+        distances further than this value are reported as no hit
+    rank_index : int or None
+        the column within bedfile containing the region rank as the last
+        comma-separated value. If given, distances are ordered by rank, 
+        otherwise by genomic position
+    width : int
+        the width of the window around each region center
+
     Returns
     -------
-    motif_distance_bed_sorted : string
-        full path to where the sorted motif distance file was outputted
+    motif : str
+        the name of the motif
+    distances : array
+        float32 array of distances with NaN for no hit
     '''
-    try:
-        motif_path = genomehits / motif
-        if os.stat(motif_path).st_size == 0:
-            return [motif] + ['.' for i in range(os.stat(ranked_center_file).st_size)]
+    motif_name = genomehits_index.motif_name(motif)
+    centers = read_centers(bedfile=bedfile, rank_index=rank_index, 
+                            width=width)
+    if genomehits_index.is_index(genomehits):
+        hits = genomehits_index.motif_hits(genomehits=genomehits, 
+                                            motif=motif)
+    else:
+        hits = read_genomehits(bedfile=Path(genomehits) / motif)
+    distances = nearest_distances(centers=centers, hits=hits)
+    distances[np.abs(distances) > distance_cutoff] = np.nan
 
-        command = ("bedtools", "closest", "-D", "ref", "-t", "first", "-a", 
-                    ranked_center_file, "-b", motif_path)
-        closest_out = tempdir / (motif + '.closest.bed')
+    return [motif_name, distances]
 
-        # import sys
-        # print(' '.join([str(c) for c in command]) + ' > ' + closest_out.as_posix(), file=sys.stderr)
+#==============================================================================
+_centers = dict()
 
-        try:
-            closest_out.write_bytes(subprocess.check_output(command, stderr=subprocess.PIPE))
-        except subprocess.CalledProcessError as e:
-            raise exceptions.SubprocessError(e.stderr.decode())
-        
-        
-        distances = list()
-        ranks = list()
-        with open(closest_out) as F:
-            for line in F:
-                linelist = line.strip('\n').split('\t')
-                distance = int(linelist[-1])
-                if rank_index is not None:
-                    rank = int(linelist[rank_index].split(',')[-1])
-                    ranks.append(rank)
-                if abs(distance) <= distance_cutoff:
-                    distances.append(distance)
-                else:
-                    distances.append('.')
-        if rank_index is not None:
-            distances = [x for i,x in sorted(zip(ranks,distances))]
-        closest_out.unlink()
-
-    except Exception as e:
-        # This prints the type, value, and stack trace of the
-        # current exception being handled.
-        print(traceback.print_exc())
-        raise e
-
-    return [motif.strip('.bed')] + distances
+def read_centers(bedfile=None, rank_index=None, width=100):
+    '''Reads a bed file and returns a window of a given width around the 
+        center of each region, grouped by chromosome. Results are cached per 
+        process since every motif is compared against the same regions.
+
+    Parameters
+    ----------
+    bedfile : str
+        full path to a bed file of regions
+    rank_index : int or None
+        the column containing the region rank as the last comma-separated 
+        value. If given, regions are ordered by rank (read from the ranked 
+        table of bedfile), otherwise by genomic position
+    width : int
+        the width of the window around each region center. Regions smaller 
+        than width are kept whole
+
+    Returns
+    -------
+    centers : dict
+        chromosome -> (starts, stops, output indexes) as int64 arrays
+    '''
+    key = (str(bedfile), rank_index, width)
+    if key in _centers:
+        return _centers[key]
+
+    table = ranked_table.load(bedfile=bedfile)
+    chroms = table.chroms
+    starts = table.starts.astype(np.int64)
+    stops = table.stops.astype(np.int64)
+    ranks = table.ranks
+
+    center = starts + (stops - starts)//2
+    halfwidth = width//2
+    small = (stops - starts) < width
+    starts = np.where(small, starts, np.maximum(center - halfwidth, 1))
+    stops = np.where(small, stops, center + max(halfwidth, 1))
+
+    #Output position of each region
+    if rank_index is not None:
+        order = np.argsort(ranks, kind='mergesort')
+    else:
+        order = np.lexsort((starts, chroms))
+    indexes = np.empty(len(order), dtype=np.int64)
+    indexes[order] = np.arange(len(order))
+
+    centers = dict()
+    for chrom in np.unique(chroms):
+        mask = chroms == chrom
+        centers[chrom] = (starts[mask], stops[mask], indexes[mask])
+    _centers[key] = centers
+
+    return centers
+
+#==============================================================================
+def read_genomehits(bedfile=None):
+    '''Reads a bed file of motif hits into sorted arrays grouped by 
+        chromosome.
+
+    Parameters
+    ----------
+    bedfile : str
+        full path to a bed file of motif hits
+
+    Returns
+    -------
+    hits : dict
+        chromosome -> (starts, ends) as int64 arrays sorted by start, where 
+        ends is the running maximum of hit stops (so that ends[i] is the 
+        furthest any of the first i+1 hits extends)
+    '''
+    positions = dict()
+    with open(bedfile) as F:
+        for line in F:
+            if line[0] == '#' or line.strip() == '':
+                continue
+            chrom, start, stop = line.split('\t', 3)[:3]
+            if chrom not in positions:
+                positions[chrom] = (list(), list())
+            positions[chrom][0].append(int(start))
+            positions[chrom][1].append(int(stop))
+
+    hits = dict()
+    for chrom, (starts, stops) in positions.items():
+        hits[chrom] = sorted_hits(starts=starts, stops=stops)
+
+    return hits
+
+#==============================================================================
+def sorted_hits(starts=None, stops=None):
+    '''Sorts motif hits by start and computes the running maximum of stops
+        used by nearest_distances
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    stops = np.asarray(stops, dtype=np.int64)
+    #Stable sort keeps file order for ties (bedtools -t first)
+    order = np.argsort(starts, kind='mergesort')
+
+    return starts[order], np.maximum.accumulate(stops[order])
+
+#==============================================================================
+def nearest_distances(centers=None, hits=None):
+    '''Vectorized nearest-feature search between region windows and motif 
+        hits using np.searchsorted on each chromosome.
+
+    Parameters
+    ----------
+    centers : dict
+        output of read_centers
+    hits : dict
+        output of read_genomehits or genomehits_index.motif_hits
+
+    Returns
+    -------
+    distances : array
+        float32 array of signed distances (bedtools closest -D ref 
+        conventions) ordered by the output indexes in centers. NaN where a 
+        chromosome has no hits
+    '''
+    regions = sum(len(value[2]) for value in centers.values())
+    distances = np.full(regions, np.nan, dtype=np.float32)
+    for chrom, (starts, stops, indexes) in centers.items():
+        if chrom not in hits or len(hits[chrom][0]) == 0:
+            continue
+        hit_starts, hit_ends = hits[chrom]
+        n = len(hit_starts)
+
+        #First hit starting at or after the end of each window
+        right = np.searchsorted(hit_starts, stops.astype(hit_starts.dtype), 
+                                side='left')
+        downstream = np.where(right < n, 
+                    hit_starts[np.minimum(right, n - 1)].astype(np.int64) 
+                        - stops + 1,
+                    np.iinfo(np.int64).max)
+
+        #Furthest extent of all hits starting before the end of each window
+        furthest = np.where(right > 0, 
+                    hit_ends[np.maximum(right - 1, 0)].astype(np.int64), 
+                    np.iinfo(np.int64).min)
+        overlap = (right > 0) & (furthest > starts)
+        upstream = np.where(right > 0, starts - furthest + 1, 
+                            np.iinfo(np.int64).max)
+
+        #Ties between upstream and downstream go to the upstream hit, which 
+        #comes first in a sorted motif hit file
+        chrom_distances = np.where(upstream <= downstream, -upstream, 
+                                    downstream)
+        chrom_distances[overlap] = 0
+        missing = (upstream == np.iinfo(np.int64).max) & \
+                    (downstream == np.iinfo(np.int64).max)
+        chrom_distances = chrom_distances.astype(np.float32)
+        chrom_distances[missing] = np.nan
+        distances[indexes] = chrom_distances
+
+    return distances
 
 #==============================================================================
 def get_center(bedfile=None, outname=None):
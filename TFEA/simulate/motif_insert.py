@@ -15,6 +15,8 @@ __email__ = 'Jonathan.Rubin@colorado.edu'
 #==============================================================================
 import numpy as np
 
+from TFEA import motif_database as motifdb
+
 #==============================================================================
 def insert_single_motif(sequences=None, sequence_n=None, motif_database=None, 
                         motif=None, rank_pdf=None, rank_inserts=None, 
@@ -60,25 +62,12 @@ def get_PSSM(motif_database=None, motif=None):
         
     Returns
     -------
-    PSSM : list or array
-        a list of lists where each corresponding to position then alphabet probability
+    PSSM : array
+        a (position x alphabet) array of probabilities
     '''
-    motif_hit = False
-    PSSM = list()
-    with open(motif_database,'r') as F:
-        for line in F:
-            if 'MOTIF' in line:
-                if motif in line:
-                    motif_hit = True
-                else:
-                    motif_hit = False
-            elif motif_hit and 'URL' not in line and 'letter-probability' not in line and line != '\n':
-                acgt_probabilities = [float(x) for x in line.strip('\n').split()]
-                total_prob = sum(acgt_probabilities)
-                acgt_probabilities = [x/total_prob for x in acgt_probabilities] #Convert to probabilities
-                PSSM.append(acgt_probabilities)
+    database = motifdb.load(motifdatabase=motif_database)
             
-    return PSSM
+    return database.pssm(motif)
 
 #==============================================================================
 def get_rank_inserts(sequence_n=None, rank_pdf=None, seed=None):
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the COMBINE module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import combine
+from TFEA import intervals
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        test_files = Path(__file__).absolute().parent / 'test_files'
+        self.bed1 = [test_files / 'SRR1105736.tfit_bidirs.chr22.bed',
+                        test_files / 'SRR1105737.tfit_bidirs.chr22.bed']
+        self.bed2 = [test_files / 'SRR1105738.tfit_bidirs.chr22.bed',
+                        test_files / 'SRR1105739.tfit_bidirs.chr22.bed']
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_md_windows(self):
+        #MD regions are centered and extended by largewindow for every method
+        largewindow = 1500
+        for method in ['mumerge', 'mergeall', 'tfitclean', 'intersectall',
+                        'tfitremovesmall', 'intersect/merge']:
+            with self.subTest(method=method):
+                tempdir = self.tempdir / method.replace('/', '_')
+                tempdir.mkdir()
+                combine.main(use_config=False, bed1=self.bed1,
+                                bed2=self.bed2, method=method,
+                                tempdir=tempdir, md=True,
+                                largewindow=largewindow, label1='DMSO',
+                                label2='Nutlin')
+                md_bedfiles = sorted(tempdir.glob('md_bedfile*'))
+                self.assertEqual(len(md_bedfiles), 2)
+                for md_bedfile in md_bedfiles:
+                    regions = intervals.read_bed(bedfile=md_bedfile)
+                    self.assertGreater(intervals.count(regions=regions), 0)
+                    for starts, stops in regions.values():
+                        np.testing.assert_array_equal(stops - starts,
+                                                        2*largewindow + 1)
+
+if __name__ == '__main__':
+    unittest.main()
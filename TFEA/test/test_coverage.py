@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the coverage cache used by the RANK
+    module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import coverage
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.test_files = Path(__file__).absolute().parent / 'test_files'
+        self.cachedir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def read_counts(self, count_file):
+        chroms, starts, stops, counts = list(), list(), list(), list()
+        with open(count_file) as F:
+            F.readline()
+            for line in F:
+                fields = line.strip('\n').split('\t')
+                chroms.append(fields[0])
+                starts.append(int(fields[1]))
+                stops.append(int(fields[2]))
+                counts.append(float(fields[4]))
+        return chroms, starts, stops, np.array(counts)
+
+    def test_bam_counts(self):
+        #The first column of this count file was produced by bedtools multicov
+        bamfile = self.test_files / 'SRR1105736.sorted.chr22.subsample.bam'
+        chroms, starts, stops, expected = self.read_counts(
+                            self.test_files / 'count_file.header.bed')
+        cache_entry, = coverage.build_all(files=[bamfile],
+                                            cachedir=self.cachedir)
+        counts = cache_entry.counts(chroms=chroms, starts=starts, stops=stops)
+        np.testing.assert_array_equal(counts, expected)
+
+        #A second build is a cache hit
+        entries = sorted(self.cachedir.iterdir())
+        self.assertEqual(coverage.build_all(files=[bamfile],
+                                cachedir=self.cachedir)[0].path,
+                            cache_entry.path)
+        self.assertEqual(sorted(self.cachedir.iterdir()), entries)
+
+    def test_bedgraph(self):
+        rng = np.random.RandomState(0)
+        starts = rng.randint(0, 5000, size=500)
+        stops = starts + rng.randint(1, 50, size=500)
+        values = rng.randint(-5, 6, size=500)
+        bgfile = self.cachedir / 'test.bedGraph'
+        with open(bgfile, 'w') as outfile:
+            outfile.write('track type=bedGraph\n')
+            for start, stop, value in zip(starts, stops, values):
+                outfile.write(f'chr1\t{start}\t{stop}\t{value}\n')
+        cache_entry, = coverage.build_all(files=[bgfile],
+                                            cachedir=self.cachedir)
+
+        region_starts = rng.randint(0, 5000, size=100)
+        region_stops = region_starts + rng.randint(1, 300, size=100)
+        strands = rng.choice(['+', '-', '.'], size=100)
+        counts = cache_entry.counts(chroms=['chr1']*100, starts=region_starts,
+                                    stops=region_stops, strands=strands)
+        for i in range(100):
+            overlap = ((starts < region_stops[i]) & (stops > region_starts[i])
+                        & ((values > 0) if strands[i] == '+' else True)
+                        & ((values < 0) if strands[i] == '-' else True))
+            self.assertEqual(counts[i], np.abs(values[overlap]).sum())
+
+        window_starts = [0, 1000, 1010, 4990]
+        profiles = cache_entry.profiles(chrom='chr1', starts=window_starts,
+                                        width=500, strand='-')
+        for window_start, profile in zip(window_starts, profiles):
+            expected = np.zeros(500)
+            for start, stop, value in zip(starts, stops, values):
+                if value < 0:
+                    expected[max(start - window_start, 0):
+                                max(stop - window_start, 0)] -= value
+            np.testing.assert_array_equal(profile, expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the statistics computed within the
+    ENRICHMENT module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import unittest
+import numpy as np
+
+from TFEA import enrichment
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.regions = 2000
+        self.permutations = 20000
+        score = np.exp(-rng.uniform(0, 1500, self.regions)/300.0)
+        score[rng.uniform(size=self.regions) < 0.6] = 0.0
+        binwidth = 1.0/float(self.regions)
+        self.normalized_score = np.multiply(np.divide(score, np.sum(score)),
+                                            binwidth)
+        trend = np.append(np.arange(0,1,1.0/float(self.regions - 1)), 1.0)
+        self.trend = np.multiply(trend, binwidth)
+
+    def test_analytic_null_matches_permutation(self):
+        sim_auc = enrichment.permute_auc(distances=self.normalized_score,
+                                            trend=self.trend,
+                                            permutations=self.permutations)
+        mu, sigma = enrichment.analytic_auc_null(
+                                            distances=self.normalized_score,
+                                            trend=self.trend)
+        standard_error = sigma/np.sqrt(self.permutations)
+        self.assertLess(abs(np.mean(sim_auc) - mu), 5*standard_error)
+        self.assertAlmostEqual(np.std(sim_auc)/sigma, 1.0, delta=0.05)
+
+    def test_analytic_null_exact(self):
+        #Enumerate every permutation of a small score vector
+        from itertools import permutations
+        distances = np.array([0.0, 0.3, 0.0, 0.5, 0.2])
+        trend = np.linspace(0, 1, len(distances))
+        triangle_area = np.trapz(trend)
+        aucs = [(np.trapz(np.cumsum(p)) - triangle_area)*2
+                    for p in permutations(distances)]
+        mu, sigma = enrichment.analytic_auc_null(distances=distances,
+                                                    trend=trend)
+        self.assertAlmostEqual(mu, np.mean(aucs))
+        self.assertAlmostEqual(sigma, np.std(aucs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-process region sequence
+    extraction used by the SCANNER module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import shutil
+import unittest
+import tempfile
+from unittest import mock
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import genome_fasta
+from TFEA import pwm
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        rng = np.random.RandomState(0)
+        self.genome = dict()
+        self.genomefasta = self.tempdir / 'genome.fa'
+        with open(self.genomefasta, 'w') as outfile:
+            for chrom, length, linebases in [('chr1', 1000, 60),
+                                                ('chr2', 537, 50)]:
+                sequence = ''.join(rng.choice(list('ACGTNacgt'), size=length))
+                self.genome[chrom] = sequence
+                outfile.write(f'>{chrom} description\n')
+                for start in range(0, length, linebases):
+                    outfile.write(sequence[start:start + linebases] + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_fai(self):
+        index = genome_fasta.read_fai(genomefasta=self.genomefasta)
+        self.assertEqual(index, {'chr1': (1000, 18, 60, 61),
+                                    'chr2': (537, 1053, 50, 51)})
+
+    def test_fai_read_only(self):
+        #Genomes in folders that are not writable are indexed in indexdir
+        indexdir = self.tempdir / 'index'
+        write_fai = genome_fasta.write_fai
+
+        def read_only_write_fai(genomefasta=None, fai=None):
+            if fai.parent == self.genomefasta.parent:
+                raise PermissionError(f"Permission denied: '{fai}'")
+            return write_fai(genomefasta=genomefasta, fai=fai)
+
+        with mock.patch.object(genome_fasta, 'write_fai',
+                                side_effect=read_only_write_fai) as patched:
+            index = genome_fasta.read_fai(genomefasta=self.genomefasta,
+                                            indexdir=indexdir)
+            self.assertEqual(index, {'chr1': (1000, 18, 60, 61),
+                                        'chr2': (537, 1053, 50, 51)})
+            self.assertFalse(Path(str(self.genomefasta) + '.fai').exists())
+            self.assertEqual(len(list(indexdir.glob('genome.fa.*.fai'))), 1)
+
+            #The index within indexdir is reused
+            genome_fasta.read_fai(genomefasta=self.genomefasta,
+                                    indexdir=indexdir)
+            self.assertEqual(patched.call_count, 3)
+
+            #and rewritten if the genome changes
+            stat = os.stat(self.genomefasta)
+            os.utime(self.genomefasta, ns=(stat.st_atime_ns,
+                                            stat.st_mtime_ns + 10**9))
+            genome_fasta.read_fai(genomefasta=self.genomefasta,
+                                    indexdir=indexdir)
+            self.assertEqual(patched.call_count, 5)
+
+    def test_extract(self):
+        rng = np.random.RandomState(1)
+        chroms = rng.choice(['chr1', 'chr2', 'chr3'], size=200)
+        starts = rng.randint(-10, 1000, size=200)
+        stops = starts + rng.randint(0, 200, size=200)
+        buffer, offsets = genome_fasta.extract(genomefasta=self.genomefasta,
+                                                chroms=chroms, starts=starts,
+                                                stops=stops, blocksize=500)
+        self.assertEqual(len(offsets), 201)
+        for i in range(200):
+            expected = self.genome.get(chroms[i], '')[max(starts[i], 0):
+                                                        max(stops[i], 0)]
+            self.assertEqual(buffer[offsets[i]:offsets[i + 1]].tobytes(),
+                                expected.encode() + b'\n')
+
+    def test_sets(self):
+        bedfile = self.tempdir / 'regions.bed'
+        with open(bedfile, 'w') as outfile:
+            outfile.write('#chrom\tstart\tstop\n')
+            outfile.write('chr1\t100\t150\nchr2\t0\t30\nchr1\t100\t150\n')
+        fastafile = self.tempdir / 'regions.fa'
+        with open(fastafile, 'w') as outfile:
+            outfile.write('>seq1\nACGT\nAC\n>seq2\n'
+                            + self.genome['chr2'][:30] + '\n')
+        buffer, offsets, bounds, names = genome_fasta.read_sets(
+                                        sets=[(False, bedfile),
+                                                (fastafile, bedfile)],
+                                        genomefasta=self.genomefasta)
+        np.testing.assert_array_equal(bounds, [0, 3, 5])
+        self.assertEqual(names, ['chr1:100-150', 'chr2:0-30', 'chr1:100-150',
+                                    'seq1', 'seq2'])
+
+        unique_buffer, indexes = genome_fasta.unique(buffer=buffer,
+                                                        offsets=offsets)
+        np.testing.assert_array_equal(indexes, [0, 1, 0, 2, 1])
+
+        #Scanners read sequence files and fasta files alike
+        sequence_file = genome_fasta.write_sequences(
+                                        path=self.tempdir / 'unique.seq',
+                                        buffer=unique_buffer)
+        unique_offsets = genome_fasta.sequence_offsets(buffer=unique_buffer)
+        fasta = genome_fasta.write_fasta(path=self.tempdir / 'unique.fa',
+                                            buffer=unique_buffer,
+                                            offsets=unique_offsets,
+                                            names=['a', 'b', 'c'])
+        _, seq_codes, seq_offsets = pwm.read_fasta(fastafile=sequence_file)
+        names, fasta_codes, fasta_offsets = pwm.read_fasta(fastafile=fasta)
+        self.assertEqual(names, ['a', 'b', 'c'])
+        np.testing.assert_array_equal(seq_codes, fasta_codes)
+        np.testing.assert_array_equal(seq_offsets, fasta_offsets)
+
+if __name__ == '__main__':
+    unittest.main()
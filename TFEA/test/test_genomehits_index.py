@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the GENOMEHITS_INDEX module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import scanner
+from TFEA import genomehits_index
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        test_files = Path(__file__).absolute().parent / 'test_files'
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.genomehits = test_files / 'test_genome_hits'
+        self.ranked_file = test_files / 'test_ranked_file.bed'
+        self.motif = 'SOX10_HUMAN.H11MO.0.B'
+        self.index = self.tempdir / 'index'
+        genomehits_index.main(['--genomehits', str(self.genomehits),
+                                '--output', str(self.index)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_build(self):
+        self.assertTrue(genomehits_index.is_index(self.index))
+        self.assertFalse(genomehits_index.is_index(self.genomehits))
+        self.assertEqual(genomehits_index.motifs(genomehits=self.index),
+                            [self.motif])
+        expected = scanner.read_genomehits(
+                                bedfile=self.genomehits / (self.motif + '.bed'))
+        hits = genomehits_index.motif_hits(genomehits=self.index,
+                                            motif=self.motif + '.bed')
+        self.assertEqual(sorted(hits), sorted(expected))
+        for chrom, (starts, ends) in expected.items():
+            self.assertEqual(hits[chrom][0].dtype, np.int32)
+            np.testing.assert_array_equal(hits[chrom][0], starts)
+            np.testing.assert_array_equal(hits[chrom][1], ends)
+
+    def test_closest(self):
+        #Nearest-hit distances from the index match those from the bed files
+        for distance_cutoff in [1500, 10**9]:
+            keywords = dict(bedfile=self.ranked_file, rank_index=3,
+                            distance_cutoff=distance_cutoff)
+            name, expected = scanner.closest(self.motif + '.bed',
+                                                genomehits=self.genomehits,
+                                                **keywords)
+            index_name, distances = scanner.closest(self.motif + '.bed',
+                                                    genomehits=self.index,
+                                                    **keywords)
+            self.assertEqual(index_name, name)
+            self.assertGreater(np.count_nonzero(~np.isnan(expected)), 0)
+            np.testing.assert_array_equal(distances, expected)
+
+    def test_scanner(self):
+        matrices = list()
+        for genomehits in [self.genomehits, self.index]:
+            scandir = self.tempdir / genomehits.name / 'scan'
+            scandir.mkdir(parents=True)
+            matrices.append(scanner.main(use_config=False,
+                                        ranked_file=self.ranked_file,
+                                        scanner='genome hits', md=False,
+                                        mdd=False, largewindow=1500,
+                                        genomehits=genomehits,
+                                        tempdir=scandir, singlemotif=False,
+                                        debug=False, jobid=0, cpus=1)[0])
+        expected, matrix = matrices
+        self.assertEqual(matrix.motifs, [self.motif])
+        np.testing.assert_array_equal(matrix.row(matrix.index(self.motif)),
+                            expected.row(expected.index(self.motif)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-memory interval operations used
+    by the COMBINE module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import intervals
+
+#Tests
+#==============================================================================
+def region_list(regions):
+    return sorted((chrom, start, stop) for chrom, (starts, stops)
+                    in regions.items()
+                    for start, stop in zip(starts.tolist(), stops.tolist()))
+
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        rng = np.random.RandomState(0)
+        self.lists = list()
+        self.sets = list()
+        for i in range(3):
+            bedfile = self.tempdir / f'sample{i}.bed'
+            with open(bedfile, 'w') as outfile:
+                outfile.write('track name=sample\n')
+                for chrom in ['chr2', 'chr1', 'chr10']:
+                    for start in rng.randint(0, 20000, size=60):
+                        stop = start + rng.randint(1, 600)
+                        outfile.write(f'{chrom}\t{start}\t{stop}\tname\n')
+            self.sets.append(intervals.read_bed(bedfile=bedfile))
+            self.lists.append(region_list(self.sets[-1]))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_merge(self):
+        expected = list()
+        for chrom, start, stop in sorted(sum(self.lists, [])):
+            if expected and expected[-1][0] == chrom and start <= expected[-1][2]:
+                expected[-1][2] = max(expected[-1][2], stop)
+            else:
+                expected.append([chrom, start, stop])
+        self.assertEqual(region_list(intervals.merge(region_sets=self.sets)),
+                            [tuple(region) for region in expected])
+
+    def test_intersect(self):
+        expected = self.lists[0]
+        for regions in self.lists[1:]:
+            expected = [(chrom, max(start, b_start), min(stop, b_stop))
+                        for chrom, start, stop in expected
+                        for b_chrom, b_start, b_stop in regions
+                        if chrom == b_chrom and start < b_stop
+                        and b_start < stop]
+        self.assertEqual(region_list(intervals.intersect_all(
+                                                    region_sets=self.sets)),
+                            sorted(expected))
+
+    def test_windows(self):
+        regions = {'chr1': (np.array([5, 100, -3, 50]),
+                            np.array([20, 301, 10, 40]))}
+        windows = intervals.remove_invalid(regions=intervals.extend(
+                                    regions=intervals.center(regions=regions),
+                                    size=10))
+        np.testing.assert_array_equal(windows['chr1'][0], [2, 190, 0, 35])
+        np.testing.assert_array_equal(windows['chr1'][1], [23, 211, 14, 56])
+        invalid = intervals.remove_invalid(regions=regions)
+        np.testing.assert_array_equal(invalid['chr1'][0], [5, 100])
+        sized = intervals.filter_size(regions=regions, above=10, below=200)
+        np.testing.assert_array_equal(sized['chr1'][0], [5, -3])
+
+        bedfile = intervals.write_bed(regions=windows,
+                                        bedfile=self.tempdir / 'windows.bed',
+                                        name='.')
+        with open(bedfile) as F:
+            self.assertEqual(F.readline(), 'chr1\t2\t23\t.\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-process markov background used
+    by the SCANNER module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+from itertools import product
+
+import numpy as np
+
+from TFEA import markov
+from TFEA import pwm
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        rng = np.random.RandomState(0)
+        self.sequences = [''.join(rng.choice(list('ACGTNacgt'), size=length))
+                            for length in rng.randint(0, 300, size=20)]
+        self.buffer = np.frombuffer(''.join(sequence + '\n' for sequence
+                                    in self.sequences).encode(), np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_kmer_frequencies(self):
+        complement = str.maketrans('ACGT', 'TGCA')
+        strands = [sequence.upper() for sequence in self.sequences]
+        strands += [sequence.translate(complement)[::-1]
+                    for sequence in strands]
+        frequencies = markov.kmer_frequencies(buffer=self.buffer, order=2,
+                                                blocksize=97)
+        for k in range(1, 4):
+            counts = {''.join(kmer): 0 for kmer in product('ACGT', repeat=k)}
+            for sequence in strands:
+                for i in range(len(sequence) - k + 1):
+                    if sequence[i:i + k] in counts:
+                        counts[sequence[i:i + k]] += 1
+            expected = np.array(list(counts.values()))/sum(counts.values())
+            np.testing.assert_allclose(frequencies[k - 1], expected)
+
+    def test_cached_background(self):
+        calls = list()
+        def sequences():
+            calls.append(1)
+            return self.buffer
+        fields = dict(genome='genome.fa', regions='abc', window=150)
+        background_file = markov.cached_background(cachedir=self.tempdir,
+                                                    fields=fields,
+                                                    sequences=sequences,
+                                                    order=1)
+        self.assertEqual(markov.cached_background(cachedir=self.tempdir,
+                                                    fields=fields,
+                                                    sequences=sequences,
+                                                    order=1),
+                            background_file)
+        self.assertEqual(len(calls), 1)
+        self.assertNotEqual(markov.cached_background(cachedir=self.tempdir,
+                                                    fields=fields,
+                                                    sequences=sequences,
+                                                    order=2),
+                            background_file)
+
+        frequencies = markov.kmer_frequencies(buffer=self.buffer, order=1)
+        np.testing.assert_allclose(pwm.read_background(
+                                                bgfile=background_file),
+                                    frequencies[0], rtol=1e-3)
+        with open(background_file) as F:
+            lines = F.read().splitlines()
+        self.assertEqual(lines[1], '# order 0')
+        self.assertEqual(lines[6], '# order 1')
+        self.assertEqual([line.split()[0] for line in lines[7:]],
+                            [a + b for a in 'ACGT' for b in 'ACGT'])
+
+if __name__ == '__main__':
+    unittest.main()
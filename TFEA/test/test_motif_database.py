@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the parsed motif database shared by
+    the SCANNER, ENRICHMENT and plotting modules.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import motif_database
+from TFEA import scan_cache
+
+#Constants
+#==============================================================================
+HEADER = ('MEME version 4\n\nALPHABET= ACGT\n\nstrands: + -\n\n'
+            'Background letter frequencies\nA 0.3 C 0.2 G 0.2 T 0.3 \n\n')
+MOTIFS = ('MOTIF ESX1 ESX1\n\n'
+            'letter-probability matrix: alength= 4 w= 2 nsites= 8 E= 0\n'
+            '  0.5  0.5  0.0  0.0\n  1.0  1.0  1.0  1.0\n'
+            'URL http://example.org/ESX1\n\n'
+            'MOTIF HESX1 HESX1\n\n'
+            'letter-probability matrix: alength= 4 w= 3\n'
+            '  0.0  0.0  1.0  0.0\n  0.0  1.0  0.0  0.0\n'
+            '  0.25  0.25  0.25  0.25\n\n')
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.motifdatabase = self.tempdir / 'database.meme'
+        with open(self.motifdatabase, 'w') as outfile:
+            outfile.write(HEADER + MOTIFS)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_parse(self):
+        database = motif_database.load(motifdatabase=self.motifdatabase)
+        self.assertEqual(database.names, ['ESX1', 'HESX1'])
+        np.testing.assert_array_equal(database.background,
+                                        [0.3, 0.2, 0.2, 0.3])
+        np.testing.assert_array_equal(database.lengths, [2, 3])
+        np.testing.assert_array_equal(database.nsites,
+                                [8, motif_database.DEFAULT_NSITES])
+        np.testing.assert_array_equal(database.pssm('ESX1'),
+                                        [[0.5, 0.5, 0, 0], [0.25] * 4])
+
+        #Motif names are matched exactly, not as substrings
+        self.assertAlmostEqual(database.gc_content('ESX1'), 0.5)
+        self.assertAlmostEqual(database.gc_content('HESX1'), 2.5/3)
+        self.assertTrue(np.isnan(database.gc_content('SOX10')))
+
+        #Records are single-motif databases
+        single_motif_file = database.write_motif('HESX1',
+                                                self.tempdir / 'single.meme')
+        single = motif_database.load(motifdatabase=single_motif_file)
+        self.assertEqual(single.names, ['HESX1'])
+        np.testing.assert_array_equal(single.probabilities,
+                                        database.pssm('HESX1'))
+        self.assertEqual(scan_cache.motif_record(
+                                        motifdatabase=self.motifdatabase,
+                                        motif='HESX1'),
+                            database.record('HESX1'))
+
+    def test_cache(self):
+        database = motif_database.load(motifdatabase=self.motifdatabase)
+        self.assertIs(motif_database.load(motifdatabase=self.motifdatabase),
+                        database)
+
+        #A modified database is parsed again
+        with open(self.motifdatabase, 'w') as outfile:
+            outfile.write(HEADER + MOTIFS.split('MOTIF HESX1')[0])
+        stat = os.stat(self.motifdatabase)
+        os.utime(self.motifdatabase, ns=(stat.st_atime_ns,
+                                            stat.st_mtime_ns + 10**9))
+        self.assertEqual(motif_database.load(
+                            motifdatabase=self.motifdatabase).names, ['ESX1'])
+
+if __name__ == '__main__':
+    unittest.main()
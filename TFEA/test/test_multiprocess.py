@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for parallel task dispatch within the
+    multiprocess module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import unittest
+
+from TFEA import multiprocess
+
+#Functions
+#==============================================================================
+def add(arg, offset=None, values=None):
+    return arg + offset + len(values)
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.args = list(range(500))
+        self.values = list(range(1000))
+        self.expected = [arg + 1 + len(self.values) for arg in self.args]
+
+    def tearDown(self):
+        multiprocess.stop_pool()
+
+    def test_temporary_pool(self):
+        results = multiprocess.main(function=add, args=self.args, 
+                                    kwargs=dict(offset=1, values=self.values), 
+                                    cpus=2)
+        self.assertEqual(sorted(results), self.expected)
+
+    def test_persistent_pool(self):
+        multiprocess.start_pool(cpus=2, shared=dict(VALUES=self.values))
+        kwargs = dict(offset=1, 
+                    values=multiprocess.shared_value('VALUES', self.values))
+        self.assertIsInstance(kwargs['values'], multiprocess.Shared)
+        for cpus in [1, 2]:
+            results = multiprocess.main(function=add, args=self.args, 
+                                        kwargs=kwargs, cpus=cpus)
+            self.assertEqual(sorted(results), self.expected)
+
+    def test_share(self):
+        #State produced after the pool started reaches every worker
+        multiprocess.start_pool(cpus=3)
+        multiprocess.share(shared=dict(VALUES=self.values))
+        pool = multiprocess._pool
+        kwargs = dict(offset=1,
+                    values=multiprocess.shared_value('VALUES', self.values))
+        self.assertIsInstance(kwargs['values'], multiprocess.Shared)
+        results = multiprocess.main(function=add, args=self.args,
+                                    kwargs=kwargs, cpus=2)
+        self.assertEqual(sorted(results), self.expected)
+        self.assertIs(multiprocess._pool, pool)
+
+    def test_chunksize(self):
+        #Slow tasks are sent one at a time, fast tasks are batched
+        self.assertEqual(multiprocess.chunksize(tasks=1000, cpus=4, 
+                                                task_time=1.0), 1)
+        self.assertEqual(multiprocess.chunksize(tasks=1000, cpus=4, 
+                                                task_time=0.001), 62)
+        self.assertEqual(multiprocess.chunksize(tasks=1000, cpus=4, 
+                                                task_time=0.01), 20)
+
+if __name__ == '__main__':
+    unittest.main()
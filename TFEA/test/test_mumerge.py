@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-process muMerge used by the
+    COMBINE module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import mumerge
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        rng = np.random.RandomState(0)
+        sites = {'chr1': [5000, 9000, 20000], 'chr2': [3000, 7000]}
+        self.beds = list()
+        for i in range(4):
+            bed = self.tempdir / f'sample{i}.bed'
+            with open(bed, 'w') as outfile:
+                outfile.write('#chrom\tstart\tstop\n')
+                for chrom, positions in sites.items():
+                    for position in positions:
+                        mu = position + rng.randint(-50, 50)
+                        sig = rng.randint(20, 200)
+                        outfile.write(f'{chrom}\t{mu - sig}\t{mu + sig}\n')
+            self.beds.append(bed)
+        self.groups = ['A', 'A', 'B', 'B']
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_merge_regions(self):
+        #Overlapping and book-ended calls are merged, as by bedtools merge
+        calls = [{'chr2': (np.array([10, 50]), np.array([20, 60]))},
+                    {'chr1': (np.array([5]), np.array([8])),
+                    'chr2': (np.array([20, 12, 58]), np.array([30, 15, 70]))}]
+        self.assertEqual(mumerge.merge_regions(calls),
+                            [('chr1', 5, 8), ('chr2', 10, 30),
+                            ('chr2', 50, 70)])
+
+    def test_run(self):
+        calls = dict()
+        regions = mumerge.run(beds=self.beds, groups=self.groups, calls=calls)
+        self.assertEqual(sorted(calls), sorted(self.beds))
+        self.assertEqual(regions['chrom'].tolist(),
+                            ['chr1', 'chr1', 'chr1', 'chr2', 'chr2'])
+        np.testing.assert_array_less(regions['start'], regions['stop'])
+
+        #Each merged region contains one call per sample, so its center lies
+        # within the spread of the calls
+        for chrom, start, stop in regions.tolist():
+            centers = [(call_start + call_stop)/2 for bed in self.beds
+                        for call_start, call_stop
+                        in zip(*calls[bed][chrom])
+                        if call_start < stop and call_stop > start]
+            self.assertEqual(len(centers), 4)
+            self.assertTrue(min(centers) <= (start + stop)/2 <= max(centers))
+
+        #Parallel workers give the same regions
+        np.testing.assert_array_equal(mumerge.run(beds=self.beds,
+                                                    groups=self.groups,
+                                                    calls=calls, processes=2),
+                                        regions)
+
+    def test_underflow(self):
+        #The product of distant narrow calls underflows to zero. Log
+        # probabilities still place the merged call between them
+        regions = {(0, 4000): [(1000, 1010, 0, 'a'), (3000, 3010, 0, 'b')]}
+        _, bed_regions, miscalls = mumerge.chromosome_merger(
+                                                ('chr1', regions),
+                                                num_samps=2,
+                                                groupings=[['a', 'b']])
+        self.assertEqual(bed_regions, [(2000, 2010)])
+        self.assertEqual(miscalls, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-process negative binomial test
+    used by the RANK module with --rank nb.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from scipy import stats
+from scipy import optimize
+
+from TFEA import nbinom
+from TFEA import ranked_table
+
+#Constants
+#==============================================================================
+#Agreement that will be required with DESeq2 results written by 
+# deseq2_fixture.R (not yet bundled): Spearman correlation of p-values, and the median and 95th percentile absolute 
+# difference in log2 fold change for regions with a baseMean of at least 10
+MIN_PVALUE_CORRELATION = 0.95
+MAX_MEDIAN_LOG2FC_DIFF = 0.02
+MAX_LOG2FC_DIFF = 0.1
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.test_files = Path(__file__).absolute().parent / 'test_files'
+        self.tempdir = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def simulate(self, regions=5000, de=500, seed=0):
+        rng = np.random.RandomState(seed)
+        conditions = np.array([0, 0, 0, 1, 1, 1])
+        sf = np.array([0.7, 1.0, 1.3, 0.9, 1.1, 1.2])
+        means = rng.lognormal(3, 1.5, size=regions)
+        disps = 0.05 + 1/means
+        lfc = np.zeros(regions)
+        lfc[:de] = rng.choice([-2, 2], size=de)
+        mu = means[:, None]*sf*2**(lfc[:, None]*conditions)
+        counts = rng.negative_binomial(1/disps[:, None],
+                                        1/(1 + disps[:, None]*mu))
+        return counts, list(conditions), lfc
+
+    def test_size_factors(self):
+        counts = np.array([[10, 20, 40], [5, 5, 20], [0, 3, 9], [8, 16, 8]])
+        usable = counts[[0, 1, 3]]
+        geomeans = np.exp(np.log(usable).mean(axis=1))
+        expected = np.median(usable/geomeans[:, None], axis=0)
+        np.testing.assert_allclose(nbinom.size_factors(counts=counts),
+                                    expected)
+
+    def test_glm(self):
+        #IRLS coefficients and standard errors agree with a direct
+        # maximization of the likelihood
+        counts, conditions, _ = self.simulate(regions=20, de=10)
+        X = nbinom.design_matrix(conditions=conditions)
+        sf = nbinom.size_factors(counts=counts)
+        alpha = np.full(len(counts), 0.1)
+        beta, _, sigma = nbinom.fit_glm(counts=counts, sf=sf, X=X, alpha=alpha)
+        for i in range(len(counts)):
+            def loss(b):
+                mu = np.exp(X @ b)*sf
+                return -nbinom.log_likelihood(counts=counts[i], mu=mu,
+                                                alpha=alpha[i])
+            fit = optimize.minimize(loss, x0=np.zeros(2), method='BFGS')
+            np.testing.assert_allclose(beta[i], fit.x, atol=1e-4)
+            mu = np.exp(X @ beta[i])*sf
+            information = X.T @ (X*(mu/(1 + alpha[i]*mu))[:, None])
+            np.testing.assert_allclose(sigma[i], np.linalg.inv(information),
+                                        rtol=1e-4)
+
+    def test_calibration(self):
+        counts, conditions, lfc = self.simulate()
+        results = nbinom.nbinom_test(counts=counts, conditions=conditions)
+        null = results['pvalue'][500:]
+        null = null[~np.isnan(null)]
+        self.assertLess(np.mean(null < 0.05), 0.06)
+        significant = results['padj'][:500] < 0.1
+        self.assertGreater(np.mean(significant), 0.5)
+        np.testing.assert_array_equal(
+                        np.sign(results['log2FoldChange'][:500][significant]),
+                        np.sign(lfc[:500][significant]))
+
+    def test_write_results(self):
+        #Results table is in the DESeq2 format read by rank.deseq_parse
+        count_file = self.test_files / 'count_file.header.bed'
+        res_file = nbinom.write_results(count_file=count_file,
+                                        conditions=[0, 1],
+                                        res_file=self.tempdir / 'DESeq.res.txt')
+        with open(res_file) as F:
+            header = F.readline().strip('\n').split('\t')
+            lines = [line.strip('\n').split('\t') for line in F]
+        self.assertEqual(header, ['"baseMean"', '"log2FoldChange"', '"lfcSE"',
+                                    '"fc"', '"stat"', '"pvalue"', '"padj"'])
+        self.assertEqual(len(lines), sum(1 for _ in open(count_file)) - 1)
+        for line in lines:
+            self.assertEqual(len(line), len(header) + 1)
+            self.assertRegex(line[0], r'^"chr22:\d+-\d+"$')
+            fc = float(line[header.index('"fc"') + 1])
+            log2fc = float(line[header.index('"log2FoldChange"') + 1])
+            self.assertAlmostEqual(np.log2(fc), log2fc)
+            self.assertTrue(0 <= float(line[-2]) <= 1)
+
+    def test_deseq2(self):
+        #Cross-check against DESeq2 on 2 vs 2 replicates, with and without a
+        # batch. The DESeq2 tables are not bundled yet: this test is skipped
+        # until deseq2_fixture.R is run where R and DESeq2 are available and
+        # both tables are committed to test_files
+        count_file = self.test_files / 'count_file.replicates.bed'
+        for batch, deseq_file in [('', 'count_file.replicates.deseq2.txt'),
+                                    ('a,b,a,b', ('count_file.replicates.batch'
+                                                    '.deseq2.txt'))]:
+            deseq_file = self.test_files / deseq_file
+            with self.subTest(batch=batch):
+                if not deseq_file.exists():
+                    self.skipTest(f"{deseq_file.name} is not bundled, run "
+                                    "deseq2_fixture.R to generate it")
+                res_file = nbinom.write_results(count_file=count_file,
+                                        conditions=[0, 0, 1, 1], batch=batch,
+                                        res_file=self.tempdir / 'DESeq.res.txt')
+                expected = ranked_table.read_deseq(deseq_file=deseq_file)
+                results = ranked_table.read_deseq(deseq_file=res_file)
+                self.assertEqual(results['regions'], expected['regions'])
+                tested = (~np.isnan(results['pvalue'])
+                            & ~np.isnan(expected['pvalue']))
+                correlation = stats.spearmanr(results['pvalue'][tested],
+                                            expected['pvalue'][tested])[0]
+                self.assertGreaterEqual(correlation, MIN_PVALUE_CORRELATION)
+                expressed = tested & (expected['baseMean'] >= 10)
+                differences = np.abs(results['log2FoldChange'][expressed]
+                                    - expected['log2FoldChange'][expressed])
+                self.assertLessEqual(np.median(differences),
+                                        MAX_MEDIAN_LOG2FC_DIFF)
+                self.assertLessEqual(np.percentile(differences, 95),
+                                        MAX_LOG2FC_DIFF)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the in-process PWM scanner used by the
+    SCANNER module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import unittest
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import pwm
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        test_files = Path(__file__).absolute().parent / 'test_files'
+        self.motifdatabase = test_files / 'test_database.meme'
+        self.fasta_file = test_files / 'test_fasta_file.fa'
+        self.motifs, _ = pwm.read_meme(motifdatabase=self.motifdatabase)
+
+    def test_pvalue_threshold_exact(self):
+        #Enumerate every sequence for a short motif
+        background = np.array([0.3, 0.2, 0.2, 0.3])
+        probabilities, nsites = self.motifs['SP2_HUMAN.H11MO.0.A']
+        scores = pwm.log_odds(probabilities=probabilities[:6],
+                                background=background, nsites=nsites)
+        scaled, threshold = pwm.pvalue_threshold(scores=scores,
+                                                    background=background,
+                                                    thresh=0.01)
+        positions = np.arange(len(scaled))
+        pvalue = lambda cutoff: sum(np.prod(background[list(seq)])
+                        for seq in product(range(4), repeat=len(scaled))
+                        if scaled[positions, list(seq)].sum() >= cutoff)
+        self.assertLess(pvalue(threshold), 0.01)
+        self.assertGreaterEqual(pvalue(threshold - 1), 0.01)
+
+    def test_scan_best_hit(self):
+        motif = 'SOX10_HUMAN.H11MO.0.B'
+        largewindow = 1500
+        background = pwm.fasta_background(fastafile=self.fasta_file)
+        _, distances = pwm.scan(motif, fasta_file=self.fasta_file,
+                                motifdatabase=self.motifdatabase,
+                                background=background, thresh=1e-4,
+                                largewindow=largewindow)
+
+        #Score every window on both strands one at a time
+        probabilities, nsites = self.motifs[motif]
+        scores = pwm.log_odds(probabilities=probabilities,
+                                background=background, nsites=nsites)
+        scaled, threshold = pwm.pvalue_threshold(scores=scores,
+                                                    background=background,
+                                                    thresh=1e-4)
+        names, codes, offsets = pwm.read_fasta(fastafile=self.fasta_file)
+        width = len(scores)
+        positions = np.arange(width)
+        expected = np.full(len(names), np.nan)
+        for i in range(len(names)):
+            sequence = codes[offsets[i]:offsets[i+1]-1]
+            best = None
+            for start in range(len(sequence) - width + 1):
+                window = sequence[start:start + width]
+                if np.any(window > 3):
+                    continue
+                for raw, integer in [(scores, scaled),
+                                    (scores[::-1, ::-1], scaled[::-1, ::-1])]:
+                    if integer[positions, window].sum() < threshold:
+                        continue
+                    score = raw[positions, window].sum()
+                    if best is None or score > best[0]:
+                        best = (score, start)
+            if best is not None:
+                expected[i] = (2*best[1] + width + 1)/2.0 - largewindow
+
+        self.assertGreater(np.sum(~np.isnan(expected)), 0)
+        np.testing.assert_array_equal(distances, expected.astype(np.float32))
+
+if __name__ == '__main__':
+    unittest.main()
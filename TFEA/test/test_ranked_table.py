@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the ranked region table built by the
+    RANK module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import rank
+from TFEA import ranked_table
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.deseq_file = self.tempdir / 'DESeq.res.txt'
+        rows = [('chr1:1000-3000', 50.0, 1.5, 0.01),
+                ('chr2:5000-5100', 20.0, 0.5, 0.2),
+                ('chr1:8000-9000', 0.5, 4.0, 0.001),
+                ('chr2:100-200', 10.0, 'NA', 0.5),
+                ('chr1:20000-20400', 30.0, 2.0, 'NA'),
+                ('chr2:700-900', 80.0, 0.25, 0.01),
+                ('chr1:30000-30100', 60.0, 1.2, 0.3)]
+        with open(self.deseq_file, 'w') as outfile:
+            outfile.write('"baseMean"\t"log2FoldChange"\t"lfcSE"\t"fc"\t'
+                            '"stat"\t"pvalue"\t"padj"\n')
+            for region, basemean, fc, pval in rows:
+                outfile.write(f'"{region}"\t{basemean}\t0\t0.1\t{fc}\t0\t'
+                                f'{pval}\tNA\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_deseq_parse(self):
+        ranked_file, pvals, fcs = rank.deseq_parse(deseq_file=self.deseq_file,
+                                                    tempdir=self.tempdir,
+                                                    largewindow=1500,
+                                                    rank='deseq',
+                                                    basemean_cut=1)
+        #Up-regulated by increasing p-value then down-regulated by
+        # decreasing p-value. Missing fold changes and small base means are
+        # removed and missing p-values are set to 1
+        with open(ranked_file) as F:
+            lines = F.read().splitlines()
+        self.assertEqual(lines, ['#chrom\tstart\tstop\tfc,p-value,rank',
+                    'chr1\t500\t3500\t1.5,0.010000000000,1',
+                    'chr1\t28550\t31550\t1.2,0.300000000000,2',
+                    'chr1\t18700\t21700\t2.0,1.000000000000,3',
+                    'chr2\t3550\t6550\t0.5,0.200000000000,4',
+                    'chr2\t0\t2300\t0.25,0.010000000000,5'])
+        np.testing.assert_array_equal(pvals, [0.01, 0.3, 1.0, 0.2, 0.01])
+        np.testing.assert_array_equal(fcs, [1.5, 1.2, 2.0, 0.5, 0.25])
+
+        #The saved table and the parsed bed file agree
+        table = ranked_table.load(bedfile=ranked_file)
+        parsed = ranked_table.read_bed(bedfile=ranked_file)
+        for column in ranked_table.RankedTable.columns[2:]:
+            np.testing.assert_array_equal(getattr(table, column),
+                                            getattr(parsed, column))
+        np.testing.assert_array_equal(table.chroms, parsed.chroms)
+        self.assertEqual(table.starts.dtype, np.int32)
+
+        ranked_file, _, fcs = rank.deseq_parse(deseq_file=self.deseq_file,
+                                                tempdir=self.tempdir,
+                                                largewindow=1500, rank='fc',
+                                                basemean_cut=1)
+        np.testing.assert_array_equal(fcs, [2.0, 1.5, 1.2, 0.5, 0.25])
+        np.testing.assert_array_equal(
+                        ranked_table.load(bedfile=ranked_file).fcs, fcs)
+
+    def test_mdd_files(self):
+        ranked_file, _, _ = rank.deseq_parse(deseq_file=self.deseq_file,
+                                                tempdir=self.tempdir,
+                                                largewindow=1500,
+                                                rank='deseq', basemean_cut=1)
+        mdd_bedfile1, mdd_bedfile2 = rank.create_mdd_files(
+                                                ranked_file=ranked_file,
+                                                pval_cut=0.1,
+                                                tempdir=self.tempdir)
+        with open(mdd_bedfile2) as F:
+            self.assertEqual(F.read().splitlines()[1:],
+                                ['chr1\t500\t3500\t1.5,0.01,1',
+                                'chr2\t0\t2300\t0.25,0.01,2'])
+        table = ranked_table.load(bedfile=mdd_bedfile1)
+        np.testing.assert_array_equal(table.pvals, [0.2, 0.3, 1.0])
+        np.testing.assert_array_equal(table.ranks, [1, 2, 3])
+
+if __name__ == '__main__':
+    unittest.main()
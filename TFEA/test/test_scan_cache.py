@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the motif distance cache used by the
+    SCANNER module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import os
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import pwm
+from TFEA import markov
+from TFEA import scan_cache
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        test_files = Path(__file__).absolute().parent / 'test_files'
+        self.cachedir = Path(tempfile.mkdtemp())
+        self.motif = 'SOX10_HUMAN.H11MO.0.B'
+        self.kwargs = dict(fasta_file=test_files / 'test_fasta_file.fa',
+                            motifdatabase=test_files / 'test_database.meme',
+                            background=None, thresh=1e-4, largewindow=1500)
+        self.calls = list()
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def counted_scan(self, motif, **kwargs):
+        self.calls.append(motif)
+        return pwm.scan(motif, **kwargs)
+
+    def cached_scan(self, **kwargs):
+        function, keywords = scan_cache.wrap(function=self.counted_scan,
+                                        kwargs=dict(self.kwargs, **kwargs),
+                                        cachedir=self.cachedir)
+        return function(self.motif, **keywords)
+
+    def test_cache_hit(self):
+        name, distances = self.cached_scan()
+        cached_name, cached_distances = self.cached_scan()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(name, cached_name)
+        np.testing.assert_array_equal(distances, cached_distances)
+
+        #Options that change motif distances are part of the key
+        self.cached_scan(thresh=1e-5)
+        self.cached_scan(largewindow=1000)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_evict_least_recently_used(self):
+        self.cached_scan()
+        self.cached_scan(thresh=1e-5)
+        entries = sorted(self.cachedir.glob('*.npy'))
+        os.utime(entries[0], (0, 0))
+        max_size = entries[1].stat().st_size/1024**3
+        self.assertEqual(scan_cache.evict(cachedir=self.cachedir,
+                                            max_size=max_size), 1)
+        self.assertEqual(list(self.cachedir.glob('*.npy')), entries[1:])
+
+    def test_evict_in_flight(self):
+        #Temporary files of runs still writing entries are never evicted
+        self.cached_scan()
+        self.assertEqual([path.suffix for path in self.cachedir.iterdir()],
+                            ['.npy'])
+        temp_entry = self.cachedir / 'digest.123.tmp'
+        temp_entry.write_bytes(b'0'*1024)
+        self.assertEqual(scan_cache.evict(cachedir=self.cachedir,
+                                            max_size=0), 1)
+        self.assertTrue(temp_entry.exists())
+
+    def test_evict_backgrounds(self):
+        #Markov background files count towards the cache size
+        self.cached_scan()
+        background_file = markov.cached_background(cachedir=self.cachedir,
+                        fields=dict(sequences='test'),
+                        sequences=lambda: np.frombuffer(b'ACGTTGCA\n',
+                                                        dtype=np.uint8))
+        os.utime(background_file, (0, 0))
+        entry, = self.cachedir.glob('*.npy')
+        max_size = entry.stat().st_size/1024**3
+        self.assertEqual(scan_cache.evict(cachedir=self.cachedir,
+                                            max_size=max_size), 1)
+        self.assertFalse(background_file.exists())
+        self.assertTrue(entry.exists())
+
+if __name__ == '__main__':
+    unittest.main()
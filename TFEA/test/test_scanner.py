@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''This module contains test cases for the SCANNER module.
+'''
+
+#==============================================================================
+__author__ = 'Jonathan D. Rubin and Rutendo F. Sigauke'
+__credits__ = ['Jonathan D. Rubin', 'Rutendo F. Sigauke', 'Jacob T. Stanley',
+                'Robin D. Dowell']
+__maintainer__ = 'Jonathan D. Rubin'
+__email__ = 'Jonathan.Rubin@colorado.edu'
+
+#Imports
+#==============================================================================
+import shutil
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from TFEA import pwm
+from TFEA import scanner
+
+#Tests
+#==============================================================================
+class TestMain(unittest.TestCase):
+    def setUp(self):
+        test_files = Path(__file__).absolute().parent / 'test_files'
+        self.tempdir = Path(tempfile.mkdtemp())
+        self.motifdatabase = test_files / 'test_database.meme'
+        with open(test_files / 'test_fasta_file.fa') as F:
+            lines = F.read().split('\n')
+        self.records = [lines[i] + '\n' + lines[i + 1] + '\n'
+                        for i in range(0, 120, 2)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_fasta(self, name, indexes):
+        path = self.tempdir / (name + '.fa')
+        with open(path, 'w') as outfile:
+            outfile.writelines(self.records[i] for i in indexes)
+        return path
+
+    def test_md_mdd_projection(self):
+        #MD and MDD sets overlap the ranked regions, each other and contain
+        # duplicates
+        sets = dict(fasta_file=list(range(40)),
+                    md_fasta1=list(range(10, 30)) + list(range(40, 50)) + [45],
+                    md_fasta2=list(range(45, 55)) + [3, 3],
+                    mdd_fasta1=list(range(15)) + [55, 56],
+                    mdd_fasta2=list(range(15, 40)) + [50, 57])
+        fastas = {name: self.write_fasta(name, indexes)
+                    for name, indexes in sets.items()}
+        scandir = self.tempdir / 'scan'
+        scandir.mkdir()
+        matrices = scanner.main(use_config=False, **fastas, scanner='pwm',
+                                md=True, mdd=True, largewindow=1500,
+                                fimo_background=False, tempdir=scandir,
+                                fimo_motifs=self.motifdatabase,
+                                singlemotif=False, fimo_thresh=1e-4,
+                                debug=False, jobid=0, cpus=1, cachedir=None)
+        for (name, fasta), matrix in zip(fastas.items(), matrices):
+            for motif in matrix.motifs:
+                _, expected = pwm.scan(motif, fasta_file=fasta,
+                                        motifdatabase=self.motifdatabase,
+                                        thresh=1e-4, largewindow=1500)
+                np.testing.assert_array_equal(
+                                matrix.row(matrix.index(motif)), expected,
+                                err_msg=f'{name} {motif}')
+
+    def test_cache_keys(self):
+        #Scans of the ranked regions are cached independently of MD and MDD
+        cachedir = self.tempdir / 'cache'
+        ranked = self.write_fasta('ranked', range(40))
+        keywords = dict(scanner='pwm', largewindow=1500,
+                        fimo_background=False, fimo_motifs=self.motifdatabase,
+                        singlemotif=False, fimo_thresh=1e-4, debug=False,
+                        jobid=0, cpus=1, cachedir=cachedir, cache_size=1)
+        runs = [dict(md=True, mdd=True,
+                    md_fasta1=self.write_fasta('md1', range(30, 50)),
+                    md_fasta2=self.write_fasta('md2', range(30, 50)),
+                    mdd_fasta1=self.write_fasta('mdd1', range(20)),
+                    mdd_fasta2=self.write_fasta('mdd2', range(20, 40))),
+                dict(md=False, mdd=False),
+                dict(md=False, mdd=True,
+                    mdd_fasta1=self.write_fasta('mdd3', range(10)),
+                    mdd_fasta2=self.write_fasta('mdd4', range(10, 40)))]
+        entries = list()
+        for i, options in enumerate(runs):
+            scandir = self.tempdir / f'scan{i}'
+            scandir.mkdir()
+            scanner.main(use_config=False, fasta_file=ranked, tempdir=scandir,
+                            **options, **keywords)
+            entries.append(set(path.name for path in cachedir.glob('*.npy')))
+
+        #Ranked and MD regions outside them are cached once per motif.
+        # Turning MD off or changing the MDD split scans nothing again
+        motifs = len(scanner.fimo_motif_names(motifdatabase=self.motifdatabase))
+        self.assertEqual(len(entries[0]), 2*motifs)
+        self.assertEqual(entries[1], entries[0])
+        self.assertEqual(entries[2], entries[0])
+
+    def test_pwm_background(self):
+        #The PWM scanner reads a background file given with --fimo_background
+        # and otherwise counts the bases in windows around the ranked regions
+        genomefasta = self.tempdir / 'genome.fa'
+        sequence = ''.join(record.split('\n')[1]
+                            for record in self.records[:10])
+        with open(genomefasta, 'w') as outfile:
+            outfile.write('>chr1\n')
+            outfile.writelines(sequence[i:i + 60] + '\n'
+                                for i in range(0, len(sequence), 60))
+        ranked_file = self.tempdir / 'ranked.bed'
+        with open(ranked_file, 'w') as outfile:
+            outfile.writelines(f'chr1\t{i*3000}\t{(i + 1)*3000}\t'
+                                f'1.0,0.5,{i + 1}\n' for i in range(10))
+        bgfile = self.tempdir / 'background.txt'
+        with open(bgfile, 'w') as outfile:
+            outfile.write('# order 0\nA 3.500e-01\nC 1.500e-01\n'
+                            'G 1.500e-01\nT 3.500e-01\n')
+        fasta_file = self.write_fasta('ranked', range(10))
+        codes = pwm.encode(sequence.encode())
+        counts = np.bincount(codes, minlength=4)[:4]
+        window_background = (counts + counts[::-1])/(2*np.sum(counts))
+
+        for fimo_background in [str(bgfile), 'largewindow', 1500]:
+            scandir = self.tempdir / f'scan_{fimo_background}'.replace('/', '')
+            scandir.mkdir()
+            matrix = scanner.main(use_config=False, ranked_file=ranked_file,
+                                    genomefasta=genomefasta, scanner='pwm',
+                                    md=False, mdd=False, largewindow=1500,
+                                    fimo_background=fimo_background,
+                                    tempdir=scandir,
+                                    fimo_motifs=self.motifdatabase,
+                                    singlemotif=False, fimo_thresh=1e-4,
+                                    debug=False, jobid=0, cpus=1,
+                                    cachedir=None)[0]
+            if fimo_background == str(bgfile):
+                background = pwm.read_background(bgfile=bgfile)
+                np.testing.assert_allclose(background, [0.35, 0.15, 0.15, 0.35])
+            else:
+                background = pwm.read_background(
+                        bgfile=scanner.fimo_background_file(window=1500,
+                                    tempdir=scandir, bedfile=ranked_file,
+                                    genomefasta=genomefasta, order=1))
+                np.testing.assert_allclose(background, window_background,
+                                            rtol=1e-3)
+            for motif in matrix.motifs:
+                _, expected = pwm.scan(motif, fasta_file=fasta_file,
+                                        motifdatabase=self.motifdatabase,
+                                        background=background, thresh=1e-4,
+                                        largewindow=1500)
+                np.testing.assert_array_equal(
+                                matrix.row(matrix.index(motif)), expected,
+                                err_msg=f'{fimo_background} {motif}')
+
+    def test_nearest_distances(self):
+        #Hits are unsorted, on both strands, overlap and share starts. Windows
+        # fall before the first hit, after the last and on a chromosome
+        # without hits
+        rng = np.random.default_rng(0)
+        hits_file = self.tempdir / 'hits.bed'
+        positions = dict(chr1=[(500, 520), (100, 1000), (200, 210),
+                                (1030, 1040), (1030, 1035), (40, 50)],
+                        chr2=list())
+        for _ in range(300):
+            start = int(rng.integers(0, 20000))
+            positions['chr2'].append((start, start + int(rng.integers(1, 400))))
+        with open(hits_file, 'w') as outfile:
+            for chrom, hits in positions.items():
+                for i, (start, stop) in enumerate(hits):
+                    outfile.write(f'{chrom}\t{start}\t{stop}\tmotif\t1.0\t'
+                                    f'{"+-"[i % 2]}\n')
+        windows = dict(chr1=[(0, 10), (30, 40), (50, 60), (60, 90), (150, 250),
+                            (600, 700), (1005, 1025), (1100, 1200),
+                            (1040, 1041)],
+                        chr2=[(start, start + 100) for start in
+                                rng.integers(0, 21000, 500).tolist()],
+                        chr3=[(100, 200)])
+        centers = dict()
+        index = 0
+        for chrom, regions in windows.items():
+            starts, stops = np.array(regions, dtype=np.int64).T
+            centers[chrom] = (starts, stops,
+                                np.arange(index, index + len(regions)))
+            index += len(regions)
+
+        #Brute force: signed distance to every hit, closest wins and ties go
+        # to the upstream hit
+        expected = list()
+        for chrom, regions in windows.items():
+            for start, stop in regions:
+                distances = [0 if hit_start < stop and hit_stop > start
+                            else -(start - hit_stop + 1) if hit_stop <= start
+                            else hit_start - stop + 1
+                            for hit_start, hit_stop in positions.get(chrom, [])]
+                expected.append(min(distances, key=lambda d: (abs(d), d))
+                                if distances else np.nan)
+        expected = np.array(expected, dtype=np.float32)
+        np.testing.assert_array_equal(expected[:9],
+                                        [31, 1, -1, -11, 0, 0, -6, -61, -1])
+
+        hits = scanner.read_genomehits(bedfile=hits_file)
+        starts, ends = hits['chr1']
+        np.testing.assert_array_equal(starts, [40, 100, 200, 500, 1030, 1030])
+        np.testing.assert_array_equal(ends, [50, 1000, 1000, 1000, 1040, 1040])
+        distances = scanner.nearest_distances(centers=centers, hits=hits)
+        np.testing.assert_array_equal(distances, expected)
+        self.assertTrue(np.isnan(distances[-1]))
+
+if __name__ == '__main__':
+    unittest.main()
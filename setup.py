@@ -21,7 +21,7 @@ setuptools.setup(
     install_requires=[
         "matplotlib>=3.1.1",
         "scipy",
-        "numpy",
+        "numpy>=1.20",
         "pybedtools",
         "htseq",
         "psutil",